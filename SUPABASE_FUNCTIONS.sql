@@ -0,0 +1,121 @@
+-- Server-side helpers used by app_supabase.py
+-- Run in the Supabase SQL Editor after the tables from SUPABASE_SETUP.md exist.
+
+-- Indexes backing the dashboard's filtered count queries
+CREATE INDEX IF NOT EXISTS appointments_status_payment_idx
+    ON appointments (status, payment_status);
+CREATE INDEX IF NOT EXISTS appointments_date_idx
+    ON appointments (date);
+
+-- Dashboard revenue, refunds and unique patients in one round trip
+-- (called by /api/reports/dashboard as POST /rest/v1/rpc/dashboard_aggregates)
+CREATE OR REPLACE FUNCTION dashboard_aggregates(p_month_start DATE)
+RETURNS JSON
+LANGUAGE SQL
+STABLE
+AS $$
+    SELECT json_build_object(
+        'revenue_base', COALESCE(SUM(consultation_fee) FILTER (
+            WHERE payment_status = 'completed'
+              AND status IS DISTINCT FROM 'cancelled'
+              AND date >= p_month_start
+              AND date < p_month_start + INTERVAL '1 month'), 0),
+        'refunded_base', COALESCE(SUM(consultation_fee) FILTER (
+            WHERE payment_status = 'refunded'
+              AND date >= p_month_start
+              AND date < p_month_start + INTERVAL '1 month'), 0),
+        'unique_patients', COUNT(DISTINCT patient_email) FILTER (
+            WHERE status IS DISTINCT FROM 'cancelled')
+    )
+    FROM appointments;
+$$;
+
+-- Review count, rating sum and the newest well-rated reviews in one round trip
+-- (used to refresh the in-memory aggregate behind GET /api/reviews)
+CREATE INDEX IF NOT EXISTS reviews_rating_created_idx
+    ON reviews (rating, created_at DESC);
+
+CREATE OR REPLACE FUNCTION review_summary(p_min_rating INT, p_limit INT)
+RETURNS JSON
+LANGUAGE SQL
+STABLE
+AS $$
+    SELECT json_build_object(
+        'count', (SELECT COUNT(*) FROM reviews),
+        'rating_sum', (SELECT COALESCE(SUM(rating), 0) FROM reviews),
+        'top', COALESCE((
+            SELECT json_agg(r)
+            FROM (
+                SELECT * FROM reviews
+                WHERE rating >= p_min_rating
+                ORDER BY created_at DESC
+                LIMIT p_limit
+            ) r
+        ), '[]'::json)
+    );
+$$;
+
+-- Gapless per-year invoice numbers (INV-<year>-<number>), handed to app
+-- workers in blocks. Numbers a worker does not use are returned with
+-- release_invoice_block and handed out again before the counter moves on.
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS invoice_no TEXT UNIQUE;
+
+CREATE TABLE IF NOT EXISTS invoice_counters (
+    year INT PRIMARY KEY,
+    next_no INT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS invoice_returned_ranges (
+    id BIGSERIAL PRIMARY KEY,
+    year INT NOT NULL,
+    start_no INT NOT NULL,
+    end_no INT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION reserve_invoice_block(p_year INT, p_size INT)
+RETURNS JSON
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_start INT;
+    v_end INT;
+BEGIN
+    DELETE FROM invoice_returned_ranges
+    WHERE id = (
+        SELECT id FROM invoice_returned_ranges
+        WHERE year = p_year
+        ORDER BY start_no
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING start_no, end_no INTO v_start, v_end;
+
+    IF v_start IS NULL THEN
+        INSERT INTO invoice_counters (year, next_no) VALUES (p_year, 1 + p_size)
+        ON CONFLICT (year) DO UPDATE SET next_no = invoice_counters.next_no + p_size
+        RETURNING next_no - p_size INTO v_start;
+        v_end := v_start + p_size - 1;
+    END IF;
+
+    RETURN json_build_object('start_no', v_start, 'end_no', v_end);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION release_invoice_block(p_year INT, p_start INT, p_end INT)
+RETURNS VOID
+LANGUAGE SQL
+AS $$
+    INSERT INTO invoice_returned_ranges (year, start_no, end_no)
+    VALUES (p_year, p_start, p_end);
+$$;
+
+-- Keyset pagination of the admin lists: (created_at, id) / (timestamp, id)
+-- newest first, and patients by (patient_email, id)
+CREATE INDEX IF NOT EXISTS appointments_created_id_idx
+    ON appointments (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS appointments_patient_email_id_idx
+    ON appointments (patient_email, id);
+CREATE INDEX IF NOT EXISTS contact_messages_created_id_idx
+    ON contact_messages (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS login_history_timestamp_id_idx
+    ON login_history (timestamp DESC, id DESC);
@@ -1,13 +1,72 @@
 from flask import Flask, render_template, jsonify
 from flask_cors import CORS
+from utils.ids import appointment_ids, order_ids, InvoiceNumberAllocator
+from utils.invoices import InvoiceRenderCache, BulkInvoiceRenderer, build_invoice, invoice_key
+from utils.export import iter_zip
+from utils.memory_store import AppointmentStore, ReviewStore
+from utils.shared_store import SharedLog, SharedAppointmentStore, SharedReviewStore
+import os
+import tempfile
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'test-secret-key'
 CORS(app)
 
-# In-memory storage for appointments and reviews
-appointments_storage = []
-reviews_storage = [
+# In-memory storage for appointments and reviews (indexed, thread-safe).
+# TEST_STORE=shared puts them in one memory-mapped log that every worker
+# process reads, so a booking is visible to all of them.
+TEST_STORE = os.getenv('TEST_STORE', 'memory')
+
+if TEST_STORE == 'shared':
+    shared_log = SharedLog(os.getenv('TEST_STORE_PATH', os.path.join(tempfile.gettempdir(), 'hospital-test-store.log')))
+    appointments_storage = SharedAppointmentStore(shared_log)
+    
+    def _reserve_invoice_block(year, size):
+        last = shared_log.next_value(f'invoice-{year}', size)
+        return last - size + 1, last
+    
+    # One number at a time, so no block is stranded in a worker that exits
+    invoice_numbers = InvoiceNumberAllocator(_reserve_invoice_block, block_size=1)
+elif TEST_STORE == 'memory':
+    appointments_storage = AppointmentStore()
+    invoice_numbers = InvoiceNumberAllocator()
+else:
+    raise ValueError(f"TEST_STORE must be 'memory' or 'shared', not {TEST_STORE!r}")
+
+# Rendered invoices, keyed by a hash of their contents
+invoice_cache = InvoiceRenderCache(os.getenv('INVOICE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'hospital-invoices')))
+bulk_invoice_renderer = BulkInvoiceRenderer(invoice_cache, workers=int(os.getenv('INVOICE_RENDER_WORKERS', '0')) or None)
+
+# Demo invoices listed alongside real bookings in test mode
+demo_invoice_appointments = [
+    {
+        'id': 'INV001',
+        'invoice_no': 'INV-2024-001',
+        'appointment_id': 'APT001',
+        'patient_name': 'John Doe',
+        'patient_email': 'john@gmail.com',
+        'department': 'General Medicine',
+        'date': '2024-01-25',
+        'time': '10:00 AM',
+        'consultation_fee': 500,
+        'payment_status': 'completed',
+        'created_at': '2024-01-25T09:00:00'
+    },
+    {
+        'id': 'INV002',
+        'invoice_no': 'INV-2024-002',
+        'appointment_id': 'APT002',
+        'patient_name': 'Jane Smith',
+        'patient_email': 'jane@gmail.com',
+        'department': 'Cardiology',
+        'date': '2024-01-28',
+        'time': '2:00 PM',
+        'consultation_fee': 800,
+        'payment_status': 'pending',
+        'created_at': '2024-01-28T09:00:00'
+    }
+]
+demo_reviews = [
     {
         'id': '1',
         'name': 'John Doe',
@@ -30,6 +89,21 @@ reviews_storage = [
         'date': '2024-01-20'
     }
 ]
+reviews_storage = SharedReviewStore(shared_log, demo_reviews) if TEST_STORE == 'shared' else ReviewStore(demo_reviews)
+
+def _token_email(default='patient@gmail.com'):
+    """Email from the request's bearer token, or the demo patient's"""
+    from flask import request
+    import jwt
+    
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        try:
+            decoded = jwt.decode(auth_header.split(' ')[1], app.config['SECRET_KEY'], algorithms=['HS256'])
+            return decoded.get('email', default)
+        except:
+            pass
+    return default
 
 # Frontend Routes
 @app.route('/')
@@ -232,27 +306,15 @@ def book_appointment():
     """Book new appointment"""
     try:
         from flask import request
-        import random
         from datetime import datetime
-        import jwt
         data = request.get_json()
         
         # Get user info from token
-        auth_header = request.headers.get('Authorization', '')
-        user_email = 'patient@gmail.com'
-        user_name = 'Patient'
-        
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            try:
-                decoded = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-                user_email = decoded.get('email', 'patient@gmail.com')
-                user_name = user_email.split('@')[0].title()
-            except:
-                pass
+        user_email = _token_email()
+        user_name = user_email.split('@')[0].title()
         
         # Generate appointment ID
-        apt_id = f"APT{random.randint(1000, 9999)}"
+        apt_id = appointment_ids.next()
         
         # Calculate fees
         consultation_fee = 500
@@ -260,8 +322,8 @@ def book_appointment():
         total = consultation_fee + tax
         
         # Generate mock payment order
-        order_id = f"order_{random.randint(100000, 999999)}"
-        invoice_no = f"INV-2024-{random.randint(1000, 9999)}"
+        order_id = order_ids.next()
+        invoice_no = invoice_numbers.next()
         
         # Create appointment object with actual user data
         appointment = {
@@ -284,8 +346,16 @@ def book_appointment():
             'created_at': datetime.now().isoformat()
         }
         
-        # Store in memory
-        appointments_storage.append(appointment)
+        # Store in memory; add() refuses an appointment_id that is already
+        # taken (e.g. another worker on the shared store using the same
+        # worker bits), so draw a fresh ID and try again
+        for _ in range(3):
+            if appointments_storage.add(appointment):
+                break
+            appointment['appointment_id'] = appointment_ids.next()
+        else:
+            print(f"❌ Appointment ID {appointment['appointment_id']} already taken, not stored")
+            return jsonify({'error': 'Could not create appointment, please try again'}), 500
         
         return jsonify({
             'message': 'Appointment created! Please proceed with payment.',
@@ -310,20 +380,20 @@ def verify_payment():
         
         appointment_id = data.get('appointment_id')
         
-        # Find and update appointment in storage
-        for apt in appointments_storage:
-            if apt['appointment_id'] == appointment_id:
-                apt['status'] = 'confirmed'
-                apt['payment_status'] = 'completed'
-                apt['doctor'] = 'Dr. Smith'  # Assign doctor
-                
-                return jsonify({
-                    'success': True,
-                    'message': 'Payment successful! Your appointment is confirmed.',
-                    'payment_status': 'completed',
-                    'invoice_id': apt['invoice_no'],
-                    'appointment': apt
-                }), 200
+        # Find and update appointment in storage (assigning a doctor)
+        apt = appointments_storage.update(appointment_id, {
+            'status': 'confirmed',
+            'payment_status': 'completed',
+            'doctor': 'Dr. Smith'
+        })
+        if apt is not None:
+            return jsonify({
+                'success': True,
+                'message': 'Payment successful! Your appointment is confirmed.',
+                'payment_status': 'completed',
+                'invoice_id': apt['invoice_no'],
+                'appointment': apt
+            }), 200
         
         # If not found in storage, return success anyway
         return jsonify({
@@ -344,11 +414,8 @@ def verify_payment():
 @app.route('/api/appointments/my-appointments', methods=['GET'])
 def my_appointments():
     """Get user appointments - Returns stored appointments"""
-    # Return only confirmed/paid appointments
-    confirmed_appointments = [apt for apt in appointments_storage if apt.get('payment_status') == 'completed']
-    
-    # Sort by date (newest first)
-    confirmed_appointments.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+    # Return only the caller's confirmed/paid appointments, newest first
+    confirmed_appointments = appointments_storage.for_patient(_token_email(), payment_status='completed')
     
     return jsonify({
         'appointments': confirmed_appointments
@@ -358,11 +425,11 @@ def my_appointments():
 def get_appointment(appointment_id):
     """Get single appointment details - Returns actual booked appointment"""
     # Find appointment in storage
-    for apt in appointments_storage:
-        if apt['appointment_id'] == appointment_id:
-            return jsonify({
-                'appointment': apt
-            }), 200
+    apt = appointments_storage.get(appointment_id)
+    if apt is not None:
+        return jsonify({
+            'appointment': apt
+        }), 200
     
     # If not found, return error
     return jsonify({
@@ -428,37 +495,30 @@ def all_appointments():
         'count': 2
     }), 200
 
+def _invoice_appointments():
+    """Appointments that carry an invoice: real bookings first, then the demo ones"""
+    return [apt for apt in appointments_storage.newest() if apt.get('invoice_no')] + demo_invoice_appointments
+
 @app.route('/api/billing/invoices', methods=['GET'])
 def get_invoices():
     """Get all invoices"""
+    invoices = []
+    for apt in _invoice_appointments():
+        invoice = build_invoice(apt['invoice_no'], apt)
+        invoices.append({
+            'id': apt.get('id', apt['invoice_no']),
+            'invoice_no': apt['invoice_no'],
+            'appointment_id': apt['appointment_id'],
+            'patient_name': invoice['patient_name'],
+            'date': apt.get('date'),
+            'total': invoice['total'],
+            'payment_status': invoice['payment_status'],
+            'items': invoice['items']
+        })
+    
     return jsonify({
-        'invoices': [
-            {
-                'id': 'INV001',
-                'invoice_no': 'INV-2024-001',
-                'patient_name': 'John Doe',
-                'date': '2024-01-25',
-                'total': 590,
-                'payment_status': 'completed',
-                'items': [
-                    {'description': 'Consultation Fee', 'amount': 500},
-                    {'description': 'Tax (18%)', 'amount': 90}
-                ]
-            },
-            {
-                'id': 'INV002',
-                'invoice_no': 'INV-2024-002',
-                'patient_name': 'Jane Smith',
-                'date': '2024-01-28',
-                'total': 944,
-                'payment_status': 'pending',
-                'items': [
-                    {'description': 'Consultation Fee', 'amount': 800},
-                    {'description': 'Tax (18%)', 'amount': 144}
-                ]
-            }
-        ],
-        'count': 2
+        'invoices': invoices,
+        'count': len(invoices)
     }), 200
 
 @app.route('/api/billing/summary', methods=['GET'])
@@ -473,79 +533,65 @@ def billing_summary():
         }
     }), 200
 
+@app.route('/api/billing/invoices/bulk', methods=['GET'])
+def bulk_invoices():
+    """Download every invoice issued in ?month=YYYY-MM as PDFs in one ZIP"""
+    from flask import request
+    from datetime import datetime
+    
+    month = request.args.get('month', '')
+    try:
+        datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({'error': 'month must be given as YYYY-MM'}), 400
+    
+    year, number = map(int, month.split('-'))
+    next_month = f'{year + number // 12:04d}-{number % 12 + 1:02d}'
+    month_appointments = appointments_storage.created_between(month, next_month) + [
+        apt for apt in demo_invoice_appointments if apt['created_at'].startswith(month)]
+    invoices = [build_invoice(apt['invoice_no'], apt) for apt in month_appointments if apt.get('invoice_no')]
+    pdfs = bulk_invoice_renderer.iter_pdfs(invoices)
+    members = ((f"{invoice['invoice_no']}.pdf", path) for invoice, path in pdfs)
+    
+    response = app.response_class(iter_zip(members), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="invoices_{month}.zip"'
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
 @app.route('/api/billing/invoices/<invoice_id>/download', methods=['GET'])
 def download_invoice(invoice_id):
-    """Download invoice as HTML (mock)"""
-    from datetime import datetime
+    """Download an invoice as HTML (default) or PDF (?format=pdf)"""
+    from flask import request, send_file
     
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Invoice - {invoice_id}</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 40px; }}
-            .header {{ text-align: center; margin-bottom: 30px; }}
-            .invoice-details {{ margin: 20px 0; }}
-            table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-            th, td {{ padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }}
-            th {{ background-color: #2196F3; color: white; }}
-            .total {{ font-size: 18px; font-weight: bold; text-align: right; }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>🏥 City General Hospital</h1>
-            <p>123 Medical Center Drive, City, State 12345</p>
-            <p>Phone: +1-234-567-8900 | Email: info@cityhospital.com</p>
-        </div>
-        
-        <h2>INVOICE</h2>
-        
-        <div class="invoice-details">
-            <p><strong>Invoice No:</strong> {invoice_id}</p>
-            <p><strong>Date:</strong> {datetime.now().strftime('%B %d, %Y')}</p>
-            <p><strong>Patient Name:</strong> Test Patient</p>
-            <p><strong>Appointment ID:</strong> APT001</p>
-        </div>
-        
-        <table>
-            <thead>
-                <tr>
-                    <th>Description</th>
-                    <th>Amount</th>
-                </tr>
-            </thead>
-            <tbody>
-                <tr>
-                    <td>Consultation Fee - General Medicine</td>
-                    <td>₹500.00</td>
-                </tr>
-                <tr>
-                    <td>Tax (18%)</td>
-                    <td>₹90.00</td>
-                </tr>
-            </tbody>
-        </table>
-        
-        <p class="total">Total Amount: ₹590.00</p>
-        <p class="total">Payment Status: <span style="color: green;">PAID</span></p>
-        
-        <div style="margin-top: 40px; text-align: center; color: #666;">
-            <p>Thank you for choosing City General Hospital!</p>
-            <p>For any queries, please contact us at info@cityhospital.com</p>
-        </div>
-        
-        <script>
-            // Auto print on load
-            window.onload = function() {{ window.print(); }}
-        </script>
-    </body>
-    </html>
-    """
+    apt = (appointments_storage.get_by_invoice(invoice_id)
+           or appointments_storage.get(invoice_id)
+           or next((a for a in demo_invoice_appointments
+                    if invoice_id in (a['invoice_no'], a['id'], a['appointment_id'])), None))
+    if apt is None:
+        return jsonify({'error': 'Invoice not found'}), 404
+    
+    fmt = 'pdf' if request.args.get('format') == 'pdf' else 'html'
+    invoice = build_invoice(apt['invoice_no'], apt)
     
-    from flask import Response
-    return Response(html, mimetype='text/html')
+    # The key is derived from the data, so an unchanged invoice is confirmed
+    # without rendering or opening the cached file. The format is part of the
+    # ETag, so a validator for the PDF never matches the HTML and vice versa
+    key = f'{invoice_key(invoice)}.{fmt}'
+    if request.if_none_match.contains(key):
+        response = app.response_class(status=304)
+        response.set_etag(key)
+    else:
+        path, _ = invoice_cache.get(invoice, fmt)
+        response = send_file(
+            path,
+            mimetype='application/pdf' if fmt == 'pdf' else 'text/html',
+            as_attachment=fmt == 'pdf',
+            download_name=f"{apt['invoice_no']}.{fmt}",
+            etag=key,
+            conditional=True
+        )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/api/login-activity/all', methods=['GET'])
 def login_activity():
@@ -652,11 +698,11 @@ def dashboard_stats():
 def get_reviews():
     """Get all reviews for homepage"""
     # Return only 5-star and 4-star reviews for homepage
-    top_reviews = [r for r in reviews_storage if r['rating'] >= 4]
+    top_reviews, count, average_rating = reviews_storage.summary()
     return jsonify({
-        'reviews': top_reviews[:6],  # Show top 6 reviews
-        'count': len(reviews_storage),
-        'average_rating': sum(r['rating'] for r in reviews_storage) / len(reviews_storage) if reviews_storage else 0
+        'reviews': top_reviews,  # Show top 6 reviews
+        'count': count,
+        'average_rating': average_rating
     }), 200
 
 @app.route('/api/reviews', methods=['POST'])
@@ -665,18 +711,16 @@ def add_review():
     try:
         from flask import request
         from datetime import datetime
-        import random
         data = request.get_json()
         
         review = {
-            'id': str(random.randint(1000, 9999)),
             'name': data.get('name', 'Anonymous'),
             'rating': int(data.get('rating', 5)),
             'review': data.get('review', ''),
             'date': datetime.now().strftime('%Y-%m-%d')
         }
         
-        reviews_storage.append(review)
+        review = reviews_storage.add(review)
         
         return jsonify({
             'message': 'Thank you for your review!',
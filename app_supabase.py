@@ -1,9 +1,14 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for
+from flask import Flask, render_template, jsonify, request, redirect, url_for, g
 from flask_cors import CORS
 import jwt
 from datetime import datetime, timedelta
-import random
+import hashlib
+import hmac
+import time
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import uuid
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'test-secret-key'
@@ -11,8 +16,24 @@ CORS(app)
 
 # Import Supabase - Simple HTTP version
 import os
+import tempfile
 from dotenv import load_dotenv
-import requests
+from utils.http_pool import http_pool, correlation_id, CORRELATION_HEADER
+from utils.metrics import RouteMetrics, ROUTE_KEY
+from utils.background import PeriodicTask
+from utils.dashboard_aggregate import DashboardAggregate
+from utils.slot_index import SlotIndex, SLOT_MINUTES, SLOT_STARTS
+from utils.ttl_cache import TTLCache
+from utils.review_stats import ReviewStats
+from utils.write_behind import WriteBehindQueue
+from utils.ids import appointment_ids, order_ids, InvoiceNumberAllocator
+from utils.pagination import encode_cursor, decode_cursor
+from utils.http_cache import VersionedBody, body_etag
+from utils.json_stream import iter_json_object
+from utils.export import iter_csv, write_xlsx, iter_file, iter_zip, remove_quietly
+from utils.invoices import InvoiceRenderCache, BulkInvoiceRenderer, build_invoice
+from itertools import chain
+from urllib.parse import quote
 
 load_dotenv()
 
@@ -20,7 +41,9 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
 def supabase_insert(table, data):
-    """Insert data into Supabase table"""
+    """Insert data into Supabase table (a list of rows is sent as chunked array inserts)"""
+    if isinstance(data, list):
+        return supabase_insert_many(table, data, returning=True)
     try:
         url = f"{SUPABASE_URL}/rest/v1/{table}"
         headers = {
@@ -29,7 +52,7 @@ def supabase_insert(table, data):
             'Content-Type': 'application/json',
             'Prefer': 'return=representation'
         }
-        response = requests.post(url, json=data, headers=headers)
+        response = http_pool.post(url, json=data, headers=headers)
         
         if response.status_code in [200, 201]:
             print(f"[SUCCESS] Inserted into {table}: {data.get('email', data.get('name', 'data'))}")
@@ -41,6 +64,38 @@ def supabase_insert(table, data):
         print(f"[ERROR] Insert error for {table}: {e}")
         return None
 
+INSERT_CHUNK_SIZE = int(os.getenv('SUPABASE_INSERT_CHUNK_SIZE', '500'))
+
+def supabase_insert_many(table, rows, returning=False, chunk_size=None):
+    """Insert a list of rows as PostgREST array-body requests of up to chunk_size rows
+
+    Each chunk is its own transaction. Returns the inserted rows (or True
+    with returning=False), or None if any chunk failed.
+    """
+    chunk_size = chunk_size or INSERT_CHUNK_SIZE
+    url = f"{SUPABASE_URL}/rest/v1/{table}"
+    headers = {
+        'apikey': SUPABASE_KEY,
+        'Authorization': f'Bearer {SUPABASE_KEY}',
+        'Content-Type': 'application/json',
+        'Prefer': 'return=representation' if returning else 'return=minimal'
+    }
+    inserted = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            response = http_pool.post(url, json=chunk, headers=headers)
+        except Exception as e:
+            print(f"[ERROR] Bulk insert error for {table} (rows {start}-{start + len(chunk) - 1}): {e}")
+            return None
+        if response.status_code not in [200, 201, 204]:
+            print(f"[ERROR] Bulk insert failed for {table} (rows {start}-{start + len(chunk) - 1}): {response.status_code} - {response.text}")
+            return None
+        if returning:
+            inserted.extend(response.json())
+    print(f"[SUCCESS] Inserted {len(rows)} rows into {table}")
+    return inserted if returning else True
+
 def supabase_select(table, filters=None):
     """Select data from Supabase table"""
     try:
@@ -51,23 +106,182 @@ def supabase_select(table, filters=None):
             'apikey': SUPABASE_KEY,
             'Authorization': f'Bearer {SUPABASE_KEY}'
         }
-        response = requests.get(url, headers=headers)
+        response = http_pool.get(url, headers=headers)
         return response.json() if response.status_code == 200 else []
     except Exception as e:
         print(f"Select error: {e}")
         return []
 
-def supabase_update(table, data, filter_col, filter_val):
+SELECT_PAGE_SIZE = int(os.getenv('SUPABASE_PAGE_SIZE', '1000'))
+
+# PostgREST's neq drops NULLs, so spell out "not cancelled" the way Python did
+NOT_CANCELLED = 'or=(status.is.null,status.neq.cancelled)'
+
+class _ContextExecutor(ThreadPoolExecutor):
+    """Runs each task in the submitter's context, so fanned-out calls keep its correlation id"""
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+_io_executor = None
+_io_executor_pid = None
+
+def _get_io_executor():
+    """Per-process executor for page prefetch and fanned-out PostgREST calls"""
+    global _io_executor, _io_executor_pid
+    if _io_executor is None or _io_executor_pid != os.getpid():
+        _io_executor = _ContextExecutor(max_workers=4, thread_name_prefix='supabase-io')
+        _io_executor_pid = os.getpid()
+    return _io_executor
+
+def _select_page(table, filters, key, after, page_size):
+    """Fetch one keyset page; raises instead of returning a silently short result"""
+    params = [filters] if filters else []
+    if after is not None:
+        params.append(f'{key}=gt.{after}')
+    params.append(f'order={key}.asc&limit={page_size}')
+
+    url = f"{SUPABASE_URL}/rest/v1/{table}?{'&'.join(params)}"
+    headers = {
+        'apikey': SUPABASE_KEY,
+        'Authorization': f'Bearer {SUPABASE_KEY}'
+    }
+    response = http_pool.get(url, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f"Paged select failed for {table}: {response.status_code} - {response.text[:200]}")
+    return response.json()
+
+def supabase_select_iter(table, filters=None, page_size=None, key='id'):
+    """Yield rows from a Supabase table one keyset page at a time
+
+    Walks the table ordered by `key` in fixed-size pages so callers can
+    aggregate in constant memory and PostgREST's max-rows cap never
+    truncates the result. The next page is fetched while the current one
+    is being consumed. `filters` must not contain its own order/limit.
+    """
+    page_size = page_size or SELECT_PAGE_SIZE
+    page = _select_page(table, filters, key, None, page_size)
+
+    while page:
+        pending = None
+        if len(page) == page_size:
+            pending = _get_io_executor().submit(
+                _select_page, table, filters, key, page[-1].get(key), page_size)
+
+        try:
+            for row in page:
+                yield row
+        except GeneratorExit:
+            # Consumer stopped early: drop the prefetch if it has not started
+            if pending is not None:
+                pending.cancel()
+            raise
+
+        page = pending.result() if pending is not None else None
+
+def _logic_value(value):
+    # Quoted so commas, dots and parentheses in timestamps or emails survive
+    # PostgREST's logic-tree parser; the URL encoding keeps '+' intact
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return quote(f'"{text}"', safe='')
+
+def supabase_select_keyset(table, filters=None, order=('created_at', 'id'),
+                           descending=True, after=None, limit=50):
+    """One page ordered on a (sort column, unique id) pair, starting after `after`
+
+    `after` is the pair from the last row of the previous page. The
+    row-value comparison is spelled as an and/or tree PostgREST understands:
+    (col, id) < (a, b)  <=>  col < a OR (col = a AND id < b).
+    """
+    column, tiebreak = order
+    direction = 'desc' if descending else 'asc'
+    params = [filters] if filters else []
+    if after is not None:
+        op = 'lt' if descending else 'gt'
+        first, second = (_logic_value(v) for v in after)
+        params.append(f'and=(or({column}.{op}.{first},and({column}.eq.{first},{tiebreak}.{op}.{second})))')
+    params.append(f'order={column}.{direction},{tiebreak}.{direction}&limit={limit}')
+
+    url = f"{SUPABASE_URL}/rest/v1/{table}?{'&'.join(params)}"
+    headers = {
+        'apikey': SUPABASE_KEY,
+        'Authorization': f'Bearer {SUPABASE_KEY}'
+    }
+    response = http_pool.get(url, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f"Keyset select failed for {table}: {response.status_code} - {response.text[:200]}")
+    return response.json()
+
+def supabase_select_keyset_iter(table, filters=None, order=('created_at', 'id'),
+                                descending=True, page_size=None):
+    """Yield every matching row in (sort column, id) order, one keyset page at a time"""
+    page_size = page_size or SELECT_PAGE_SIZE
+    after = None
+    while True:
+        rows = supabase_select_keyset(table, filters, order=order, descending=descending,
+                                      after=after, limit=page_size)
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1].get(order[0]), rows[-1].get(order[1]))
+
+def supabase_count(table, filters=None):
+    """Count matching rows server-side with a HEAD request (no rows transferred)"""
+    try:
+        url = f"{SUPABASE_URL}/rest/v1/{table}"
+        if filters:
+            url += f"?{filters}"
+        headers = {
+            'apikey': SUPABASE_KEY,
+            'Authorization': f'Bearer {SUPABASE_KEY}',
+            'Prefer': 'count=exact'
+        }
+        response = http_pool.head(url, headers=headers)
+        
+        # Content-Range looks like "0-24/3573" or "*/0"
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code in [200, 206] and '/' in content_range:
+            return int(content_range.rsplit('/', 1)[1])
+        print(f"[ERROR] Count failed for {table}: {response.status_code}")
+        return None
+    except Exception as e:
+        print(f"[ERROR] Count error for {table}: {e}")
+        return None
+
+def supabase_rpc(function, params=None):
+    """Call a Postgres function exposed by PostgREST"""
+    try:
+        url = f"{SUPABASE_URL}/rest/v1/rpc/{function}"
+        headers = {
+            'apikey': SUPABASE_KEY,
+            'Authorization': f'Bearer {SUPABASE_KEY}',
+            'Content-Type': 'application/json'
+        }
+        response = http_pool.post(url, json=params or {}, headers=headers)
+        
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 204:
+            return True  # void function
+        print(f"[ERROR] RPC {function} failed: {response.status_code} - {response.text[:200]}")
+        return None
+    except Exception as e:
+        print(f"[ERROR] RPC {function} error: {e}")
+        return None
+
+def supabase_update(table, data, filter_col, filter_val, extra_filters=None):
     """Update data in Supabase table"""
     try:
         url = f"{SUPABASE_URL}/rest/v1/{table}?{filter_col}=eq.{filter_val}"
+        if extra_filters:
+            url += f"&{extra_filters}"
         headers = {
             'apikey': SUPABASE_KEY,
             'Authorization': f'Bearer {SUPABASE_KEY}',
             'Content-Type': 'application/json',
             'Prefer': 'return=representation'
         }
-        response = requests.patch(url, json=data, headers=headers)
+        response = http_pool.patch(url, json=data, headers=headers)
         
         # Check for successful status codes (200, 201, 204)
         if response.status_code in [200, 201, 204]:
@@ -82,28 +296,103 @@ def supabase_update(table, data, filter_col, filter_val):
         print(f"[ERROR] Update error: {e}")
         return None
 
+# DATA_BACKEND=sqlite serves the helpers above from a local SQLite file
+# (utils/sqlite_backend.py) with the same arguments and return values
+DATA_BACKEND = os.getenv('DATA_BACKEND', 'postgrest')
+sqlite_backend = None
+
+if DATA_BACKEND == 'sqlite':
+    from utils.sqlite_backend import SQLiteBackend
+    sqlite_backend = SQLiteBackend(os.getenv('SQLITE_PATH', 'hospital.db'))
+    supabase_insert = sqlite_backend.insert
+    supabase_insert_many = sqlite_backend.insert_many
+    supabase_select = sqlite_backend.select
+    _select_page = sqlite_backend.select_page
+    supabase_select_keyset = sqlite_backend.select_keyset
+    supabase_count = sqlite_backend.count
+    supabase_rpc = sqlite_backend.rpc
+    supabase_update = sqlite_backend.update
+elif DATA_BACKEND != 'postgrest':
+    raise ValueError(f"DATA_BACKEND must be 'postgrest' or 'sqlite', not {DATA_BACKEND!r}")
+
+# Per-route metrics for GET /metrics. The data helpers are timed here, after
+# the backend is chosen, so every caller (and each route's figures) sees them.
+route_metrics = RouteMetrics()
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+supabase_insert = route_metrics.instrument('insert', supabase_insert)
+supabase_insert_many = route_metrics.instrument('insert_many', supabase_insert_many)
+supabase_select = route_metrics.instrument('select', supabase_select)
+_select_page = route_metrics.instrument('select_page', _select_page)
+supabase_select_keyset = route_metrics.instrument('select_keyset', supabase_select_keyset)
+supabase_count = route_metrics.instrument('count', supabase_count)
+supabase_rpc = route_metrics.instrument('rpc', supabase_rpc)
+supabase_update = route_metrics.instrument('update', supabase_update)
+
+# User records are read on every login and dashboard page load
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv('USER_CACHE_NEGATIVE_TTL', '5'))
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, negative_ttl=USER_CACHE_NEGATIVE_TTL)
+
+def get_user(email):
+    """Read-through cached user lookup by email; None if no such user"""
+    def load():
+        result = supabase_select('users', f'email=eq.{email}')
+        return result[0] if result else None
+    return user_cache.get_or_load(email, load)
+
+# Verified JWT claims, keyed by a digest of the raw token, kept until the token's exp
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '4096'))
+TOKEN_CACHE_MAX_TTL = float(os.getenv('TOKEN_CACHE_MAX_TTL', '3600'))
+
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_MAX_TTL)
+
+def decode_token(token):
+    """Verify an HS256 token, reusing the claims of an earlier verification"""
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        return claims
+    
+    claims = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    ttl = TOKEN_CACHE_MAX_TTL
+    if claims.get('exp') is not None:
+        ttl = min(ttl, float(claims['exp']) - time.time())
+    token_cache.set(key, claims, ttl=ttl)
+    return claims
+
+def _authenticate(missing_message):
+    """Validate the bearer token; returns an error response or None"""
+    token = None
+    auth_header = request.headers.get('Authorization', '')
+    
+    if auth_header.startswith('Bearer '):
+        token = auth_header.split(' ')[1]
+    
+    if not token:
+        return jsonify({'error': missing_message}), 401
+    
+    try:
+        decoded = decode_token(token)
+    except jwt.ExpiredSignatureError:
+        return jsonify({'error': 'Token has expired'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    request.user_email = decoded.get('email')
+    request.user_role = decoded.get('role')
+    return None
+
 # Authentication Decorators
 def token_required(f):
     """Decorator to require valid JWT token"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization', '')
-        
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'error': 'Authentication token is missing'}), 401
-        
-        try:
-            decoded = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            request.user_email = decoded.get('email')
-            request.user_role = decoded.get('role')
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        error = _authenticate('Authentication token is missing')
+        if error:
+            return error
         
         return f(*args, **kwargs)
     return decorated
@@ -112,30 +401,51 @@ def admin_required(f):
     """Decorator to require admin role"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization', '')
-        
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
+        error = _authenticate('Authentication required')
+        if error:
+            return error
         
-        if not token:
-            return jsonify({'error': 'Authentication required'}), 401
-        
-        try:
-            decoded = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            request.user_email = decoded.get('email')
-            request.user_role = decoded.get('role')
-            
-            if request.user_role != 'admin':
-                return jsonify({'error': 'Admin access required'}), 403
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        if request.user_role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
         
         return f(*args, **kwargs)
     return decorated
 
+# Request correlation: every PostgREST call made for a request carries its id
+@app.before_request
+def bind_correlation_id():
+    request_id = request.headers.get(CORRELATION_HEADER) or uuid.uuid4().hex
+    g.correlation_token = correlation_id.set(request_id)
+
+@app.after_request
+def echo_correlation_id(response):
+    response.headers[CORRELATION_HEADER] = correlation_id.get() or ''
+    return response
+
+@app.teardown_request
+def unbind_correlation_id(exc):
+    token = g.pop('correlation_token', None)
+    if token is not None:
+        correlation_id.reset(token)
+
+# Request metrics: the middleware records each request when its body is
+# closed; this names the route it was recorded under
+app.wsgi_app = route_metrics.middleware(app.wsgi_app)
+
+@app.before_request
+def tag_metrics_route():
+    rule = request.url_rule
+    request.environ[ROUTE_KEY] = rule.rule if rule is not None else 'unmatched'
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (per worker); needs METRICS_TOKEN as a bearer token if set"""
+    # With METRICS_TOKEN unset the endpoint, route names included, is public
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                                 f'Bearer {METRICS_TOKEN}'.encode()):
+        return jsonify({'error': 'Authentication required'}), 401
+    return app.response_class(route_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Frontend Routes
 @app.route('/')
 def index():
@@ -174,17 +484,46 @@ def admin_messages_page():
     return render_template('admin/messages.html')
 
 # API Routes
+# Conditional GET: polls that already hold the current ETag get a bodyless 304
+def _dumps_compact(obj):
+    # Same encoding jsonify uses outside debug mode
+    return app.json.dumps(obj, separators=(',', ':'))
+
+def _to_json_body(payload):
+    return _dumps_compact(payload) + '\n'
+
+def _etag_response(etag, body, cache_control):
+    """200 with the serialized body, or 304 when If-None-Match already names etag"""
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def _json_etag_response(payload, cache_control):
+    """For routes without a local data version: the ETag is a hash of the body"""
+    body = _to_json_body(payload)
+    return _etag_response(body_etag(body), body, cache_control)
+
+ADMIN_CACHE_CONTROL = 'private, no-cache'
+
+HOSPITAL_CONFIG = {
+    'hospital_name': 'City General Hospital',
+    'departments': ['General Medicine', 'Pediatrics', 'Cardiology', 'Orthopedics', 'Neurology'],
+    'consultation_modes': ['In-person', 'Video Call', 'Phone Call'],
+    'currency': 'INR',
+    'tax_rate': 18,
+    'razorpay_key': 'rzp_test_demo123456789',
+    'payment_gateway': 'razorpay'
+}
+config_body = VersionedBody(_to_json_body)
+
 @app.route('/api/config')
 def get_config():
-    return jsonify({
-        'hospital_name': 'City General Hospital',
-        'departments': ['General Medicine', 'Pediatrics', 'Cardiology', 'Orthopedics', 'Neurology'],
-        'consultation_modes': ['In-person', 'Video Call', 'Phone Call'],
-        'currency': 'INR',
-        'tax_rate': 18,
-        'razorpay_key': 'rzp_test_demo123456789',
-        'payment_gateway': 'razorpay'
-    })
+    etag, body = config_body.get('static', lambda: HOSPITAL_CONFIG)
+    return _etag_response(etag, body, 'public, max-age=300')
 
 @app.route('/api/health')
 def health_check():
@@ -194,6 +533,16 @@ def health_check():
         'version': '1.0.0'
     })
 
+# Login events are written behind the response, in bulk
+login_history_queue = WriteBehindQueue(
+    'login-history',
+    lambda rows: supabase_insert_many('login_history', rows),
+    max_size=int(os.getenv('LOGIN_HISTORY_QUEUE_SIZE', '10000')),
+    batch_size=int(os.getenv('LOGIN_HISTORY_BATCH_SIZE', '100')),
+    flush_interval=float(os.getenv('LOGIN_HISTORY_FLUSH_INTERVAL', '1.0')),
+    overflow=os.getenv('LOGIN_HISTORY_OVERFLOW', 'drop')
+)
+
 # Authentication Routes
 @app.route('/api/auth/signup', methods=['POST'])
 def signup():
@@ -219,6 +568,7 @@ def signup():
         }
         
         result = supabase_insert('users', user_data)
+        user_cache.invalidate(email)
         
         # Generate token
         token = jwt.encode({
@@ -273,10 +623,9 @@ def login():
             return jsonify({'error': 'Please use a Gmail address'}), 401
         
         # Check if user exists in Supabase
-        result = supabase_select('users', f'email=eq.{email}')
+        user = get_user(email)
         
-        if result and len(result) > 0:
-            user = result[0]
+        if user:
             role = user.get('role', 'patient')
             name = user.get('name', email.split('@')[0].title())
         else:
@@ -293,6 +642,7 @@ def login():
                 'created_at': datetime.now().isoformat()
             }
             supabase_insert('users', user_data)
+            user_cache.invalidate(email)
         
         # Save login history
         login_data = {
@@ -304,7 +654,7 @@ def login():
             'browser': request.headers.get('User-Agent', 'Unknown')[:100],
             'os': 'Windows'
         }
-        supabase_insert('login_history', login_data)
+        login_history_queue.put(login_data)
         
         # Generate token
         token = jwt.encode({
@@ -317,7 +667,7 @@ def login():
             'message': 'Login successful',
             'token': token,
             'user': {
-                'id': user.get('id', 'user-123') if result and len(result) > 0 else 'new-user',
+                'id': user.get('id', 'user-123') if user else 'new-user',
                 'name': name,
                 'email': email,
                 'role': role
@@ -337,14 +687,13 @@ def get_profile():
             return jsonify({'error': 'No token provided'}), 401
         
         token = auth_header.split(' ')[1]
-        decoded = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        decoded = decode_token(token)
         email = decoded.get('email')
         
-        # Get user from Supabase
-        result = supabase_select('users', f'email=eq.{email}')
+        # Get user from Supabase (through the user cache)
+        user = get_user(email)
         
-        if result and len(result) > 0:
-            user = result[0]
+        if user:
             return jsonify({
                 'user': {
                     'id': user.get('id', ''),
@@ -379,7 +728,7 @@ def update_profile():
             return jsonify({'error': 'No token provided'}), 401
         
         token = auth_header.split(' ')[1]
-        decoded = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        decoded = decode_token(token)
         email = decoded.get('email')
         
         data = request.get_json()
@@ -395,6 +744,7 @@ def update_profile():
         
         # Update in Supabase
         result = supabase_update('users', update_data, 'email', email)
+        user_cache.invalidate(email)
         
         if result:
             print(f"✅ Profile updated for: {email}")
@@ -415,6 +765,7 @@ def update_profile():
                 user_data['password'] = data.get('password')
             
             supabase_insert('users', user_data)
+            user_cache.invalidate(email)
             print(f"✅ Profile created for: {email}")
             
             return jsonify({
@@ -452,6 +803,77 @@ def contact_form():
         return jsonify({'error': str(e)}), 500
 
 # Appointments
+SLOT_INDEX_TTL = float(os.getenv('SLOT_INDEX_TTL', '30'))
+
+slot_index = SlotIndex(ttl=SLOT_INDEX_TTL)
+
+CONSULTATION_FEE = 500
+
+def _load_booked_slots(booking_date):
+    """Active (non-cancelled) bookings for one date, for the slot index"""
+    filters = f'select=id,appointment_id,time&date=eq.{booking_date}&{NOT_CANCELLED}'
+    return list(supabase_select_iter('appointments', filters))
+
+def _load_nearby_slots(booking_date, first, before):
+    """Active bookings for one date with first <= time < before, checked before a booking is accepted"""
+    filters = f'select=id,appointment_id,time&date=eq.{booking_date}&time=gte.{first}&time=lt.{before}&{NOT_CANCELLED}'
+    return supabase_select('appointments', filters) or []
+
+def _warm_slot_index(dates, refresh=False):
+    """Load every uncached date in `dates` into the slot index with a single query
+
+    With refresh=True cached dates are read again too, so bookings that
+    other workers made since they were cached are merged in.
+    """
+    missing = list(dates) if refresh else [d for d in dates if not slot_index.has(d)]
+    if not missing:
+        return
+    by_date = {d: [] for d in missing}
+    filters = f'select=id,appointment_id,date,time&date=in.({",".join(missing)})&{NOT_CANCELLED}'
+    for row in supabase_select_iter('appointments', filters):
+        if row.get('date') in by_date:
+            by_date[row.get('date')].append(row)
+    for d, rows in by_date.items():
+        if refresh:
+            slot_index.refresh(d, rows)
+        else:
+            slot_index.load(d, rows, replace=False)
+
+def _booking_hours_error(booking_time):
+    """Working-hours check (8:00 AM to 8:00 PM); returns an error message or None"""
+    try:
+        time_obj = datetime.strptime(booking_time, '%H:%M').time()
+    except (TypeError, ValueError):
+        return 'Invalid time format'
+    start_time = datetime.strptime('08:00', '%H:%M').time()
+    end_time = datetime.strptime('20:00', '%H:%M').time()
+    if not (start_time <= time_obj <= end_time):
+        return 'Appointments can only be booked between 8:00 AM and 8:00 PM.'
+    return None
+
+def _slot_conflict_error(conflict):
+    kind, apt_time = conflict[:2]
+    if kind == 'exact':
+        return 'This time slot is already allotted to another person.'
+    return f'Please maintain a 20-minute gap. Slot at {apt_time} is already booked.'
+
+def _appointment_row(apt_id, patient_name, patient_email, patient_phone, data):
+    return {
+        'appointment_id': apt_id,
+        'patient_name': patient_name,
+        'patient_email': patient_email,
+        'patient_phone': patient_phone,
+        'department': data.get('department'),
+        'date': data.get('date'),
+        'time': data.get('time'),
+        'mode': data.get('mode'),
+        'symptoms': data.get('symptoms', ''),
+        'status': 'pending',
+        'payment_status': 'pending',
+        'consultation_fee': CONSULTATION_FEE,
+        'created_at': datetime.now().isoformat()
+    }
+
 @app.route('/api/appointments/book', methods=['POST'])
 @token_required
 def book_appointment():
@@ -466,74 +888,39 @@ def book_appointment():
         booking_time = data.get('time')
         
         # Validate working hours (8:00 AM to 8:00 PM)
-        try:
-            time_obj = datetime.strptime(booking_time, '%H:%M').time()
-            start_time = datetime.strptime('08:00', '%H:%M').time()
-            end_time = datetime.strptime('20:00', '%H:%M').time()
-            
-            if not (start_time <= time_obj <= end_time):
-                return jsonify({
-                    'error': 'Appointments can only be booked between 8:00 AM and 8:00 PM.'
-                }), 400
-        except:
-            return jsonify({'error': 'Invalid time format'}), 400
-        
-        # Check if slot is already booked (exact time)
-        existing = supabase_select('appointments', f'date=eq.{booking_date}&time=eq.{booking_time}')
-        if existing and len(existing) > 0:
-            return jsonify({
-                'error': 'This time slot is already allotted to another person.'
-            }), 400
+        hours_error = _booking_hours_error(booking_time)
+        if hours_error:
+            return jsonify({'error': hours_error}), 400
         
-        # Check 20-minute gap rule
-        all_appointments = supabase_select('appointments', f'date=eq.{booking_date}')
-        if all_appointments:
-            booking_datetime = datetime.strptime(f"{booking_date} {booking_time}", '%Y-%m-%d %H:%M')
-            
-            for apt in all_appointments:
-                apt_time = apt.get('time')
-                if apt_time:
-                    apt_datetime = datetime.strptime(f"{booking_date} {apt_time}", '%Y-%m-%d %H:%M')
-                    time_diff = abs((booking_datetime - apt_datetime).total_seconds() / 60)
-                    
-                    if time_diff < 20:
-                        return jsonify({
-                            'error': f'Please maintain a 20-minute gap. Slot at {apt_time} is already booked.'
-                        }), 400
-        
-        # Generate IDs
-        apt_id = f"APT{random.randint(1000, 9999)}"
-        invoice_no = f"INV-2024-{random.randint(1000, 9999)}"
+        # Time-ordered, collision-free ID (the invoice number is assigned on payment)
+        apt_id = appointment_ids.next()
+        
+        # Check exact slot and 20-minute gap rule against the per-date index;
+        # a cached date still gets one narrow query, so bookings other
+        # workers made since it was loaded are seen
+        conflict = slot_index.reserve(booking_date, booking_time, apt_id, _load_booked_slots, _load_nearby_slots)
+        if conflict:
+            return jsonify({'error': _slot_conflict_error(conflict)}), 400
         
         # Calculate fees
-        consultation_fee = 500
+        consultation_fee = CONSULTATION_FEE
         tax = consultation_fee * 0.18
         total = consultation_fee + tax
         
         # Save to Supabase
-        appointment_data = {
-            'appointment_id': apt_id,
-            'patient_name': user_name,
-            'patient_email': user_email,
-            'patient_phone': '+1234567890',
-            'department': data.get('department'),
-            'date': booking_date,
-            'time': booking_time,
-            'mode': data.get('mode'),
-            'symptoms': data.get('symptoms', ''),
-            'status': 'pending',
-            'payment_status': 'pending',
-            'consultation_fee': consultation_fee,
-            'created_at': datetime.now().isoformat()
-        }
+        appointment_data = _appointment_row(apt_id, user_name, user_email, '+1234567890', data)
         
         result = supabase_insert('appointments', appointment_data)
+        if result:
+            dashboard_aggregate.apply(None, result[0])
+        else:
+            slot_index.release(booking_date, apt_id)
         
         return jsonify({
             'message': 'Appointment created! Please proceed with payment.',
             'appointment': appointment_data,
             'payment': {
-                'order_id': f"order_{random.randint(100000, 999999)}",
+                'order_id': order_ids.next(),
                 'amount': int(total * 100),
                 'currency': 'INR',
                 'razorpay_key': 'rzp_test_demo123456789'
@@ -544,6 +931,156 @@ def book_appointment():
         print(f"Booking error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+BOOK_BATCH_MAX = int(os.getenv('BOOK_BATCH_MAX', '200'))
+BATCH_REQUIRED_FIELDS = ('patient_name', 'patient_email', 'patient_phone', 'department', 'date', 'time', 'mode')
+
+@app.route('/api/appointments/book-batch', methods=['POST'])
+@admin_required
+def book_appointment_batch():
+    """Front-desk import: validate a list of bookings in memory and insert the valid ones in one request"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('appointments')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Please provide a non-empty appointments list'}), 400
+    if len(items) > BOOK_BATCH_MAX:
+        return jsonify({'error': f'A batch can contain at most {BOOK_BATCH_MAX} appointments'}), 400
+    
+    try:
+        results = [None] * len(items)
+        
+        def reject(index, error):
+            results[index] = {'index': index, 'status': 'rejected', 'error': error}
+        
+        valid_dates = set()
+        for item in items:
+            if isinstance(item, dict):
+                try:
+                    valid_dates.add(datetime.strptime(str(item.get('date')), '%Y-%m-%d').date().isoformat())
+                except ValueError:
+                    pass
+        # One query brings every date of the batch up to date, so the items
+        # below are checked against the index without a query each
+        _warm_slot_index(sorted(valid_dates), refresh=True)
+        
+        # Items reserve their slots in order, so a later item that clashes
+        # with an earlier one in the same batch is rejected like any other conflict
+        batch_ids = {}
+        rows = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                reject(index, 'Invalid appointment entry')
+                continue
+            missing = [field for field in BATCH_REQUIRED_FIELDS if not item.get(field)]
+            if missing:
+                reject(index, f"Missing required fields: {', '.join(missing)}")
+                continue
+            if item.get('date') not in valid_dates:
+                reject(index, 'Invalid date format')
+                continue
+            hours_error = _booking_hours_error(item.get('time'))
+            if hours_error:
+                reject(index, hours_error)
+                continue
+            
+            apt_id = appointment_ids.next()
+            conflict = slot_index.reserve(item['date'], item['time'], apt_id, _load_booked_slots, None)
+            if conflict:
+                if conflict[2] in batch_ids:
+                    reject(index, f'Conflicts with item {batch_ids[conflict[2]]} of this batch at {conflict[1]}.')
+                else:
+                    reject(index, _slot_conflict_error(conflict))
+                continue
+            
+            batch_ids[apt_id] = index
+            rows.append(_appointment_row(apt_id, item['patient_name'], item['patient_email'], item['patient_phone'], item))
+        
+        # One array insert for the whole batch (a single transaction)
+        inserted = supabase_insert_many('appointments', rows, returning=True, chunk_size=len(rows)) if rows else []
+        if inserted is None:
+            for row in rows:
+                slot_index.release(row['date'], row['appointment_id'])
+                reject(batch_ids[row['appointment_id']], 'Database insert failed')
+        else:
+            for row in inserted:
+                dashboard_aggregate.apply(None, row)
+            for row in rows:
+                index = batch_ids[row['appointment_id']]
+                results[index] = {
+                    'index': index,
+                    'status': 'booked',
+                    'appointment_id': row['appointment_id'],
+                    'date': row['date'],
+                    'time': row['time']
+                }
+        
+        booked = sum(1 for r in results if r['status'] == 'booked')
+        print(f"[BATCH] Booked {booked}/{len(items)} appointments")
+        return jsonify({
+            'results': results,
+            'booked': booked,
+            'rejected': len(items) - booked
+        }), 200
+        
+    except Exception as e:
+        print(f"Batch booking error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+AVAILABILITY_MAX_DAYS = 14
+
+@app.route('/api/appointments/availability', methods=['GET'])
+def appointment_availability():
+    """Free booking slots for `days` consecutive days starting at `date`"""
+    try:
+        start = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Please provide date as YYYY-MM-DD'}), 400
+    
+    try:
+        days = max(1, min(int(request.args.get('days', 7)), AVAILABILITY_MAX_DAYS))
+    except ValueError:
+        return jsonify({'error': 'days must be a number'}), 400
+    
+    try:
+        dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+        
+        # Load every uncached day of the range with a single query. This is
+        # a snapshot for display only: bookings on these days are still
+        # checked against the database before they are accepted
+        _warm_slot_index(dates)
+        
+        availability = []
+        for d in dates:
+            free_slots = slot_index.free_slots(d) or []
+            availability.append({
+                'date': d,
+                'free_slots': free_slots,
+                'free_count': len(free_slots),
+                'total_slots': len(SLOT_STARTS)
+            })
+        
+        return jsonify({
+            'availability': availability,
+            'slot_minutes': SLOT_MINUTES
+        }), 200
+        
+    except Exception as e:
+        print(f"Availability error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Gapless per-year invoice numbers, reserved from the database in blocks
+INVOICE_BLOCK_SIZE = int(os.getenv('INVOICE_BLOCK_SIZE', '50'))
+
+def _reserve_invoice_block(year, size):
+    block = supabase_rpc('reserve_invoice_block', {'p_year': year, 'p_size': size})
+    if not block:
+        return None
+    return block['start_no'], block['end_no']
+
+def _release_invoice_block(year, first, last):
+    supabase_rpc('release_invoice_block', {'p_year': year, 'p_start': first, 'p_end': last})
+
+invoice_numbers = InvoiceNumberAllocator(_reserve_invoice_block, _release_invoice_block, block_size=INVOICE_BLOCK_SIZE)
+
 @app.route('/api/appointments/verify-payment', methods=['POST'])
 def verify_payment():
     try:
@@ -557,11 +1094,39 @@ def verify_payment():
             'payment_status': 'completed'
         }
         
-        supabase_update('appointments', update_data, 'appointment_id', appointment_id)
+        # The invoice number is only written while the appointment has none, so
+        # a repeated verify keeps its number and the spare one is reused
+        invoice_no = invoice_numbers.next()
+        allocated = invoice_no is not None
+        if not allocated:
+            print("[WARNING] Invoice counter unavailable, using a time-ordered invoice number")
+            invoice_no = f"INV-{datetime.now().year}-{order_ids.next()[len('order_'):]}"
+        result = supabase_update('appointments', {**update_data, 'invoice_no': invoice_no},
+                                 'appointment_id', appointment_id, 'invoice_no=is.null')
+        
+        if isinstance(result, list) and result:
+            # First payment: booking left the appointment pending/pending
+            for row in result:
+                dashboard_aggregate.apply({**row, 'status': 'pending', 'payment_status': 'pending'}, row)
+                # Picks up bookings made by other workers since the date was cached
+                slot_index.add(row.get('date'), row.get('time'), row.get('appointment_id'))
+        else:
+            if allocated:
+                if result == []:
+                    # Matched no row: the appointment already has a number
+                    invoice_numbers.give_back(invoice_no)
+                else:
+                    # Failed or timed out, possibly after saving (or on a
+                    # unique invoice_no conflict): never hand it out again
+                    print(f"[WARNING] Invoice number {invoice_no} dropped after a failed update")
+                    invoice_numbers.drop(invoice_no)
+            result = supabase_update('appointments', update_data, 'appointment_id', appointment_id)
+            invoice_no = result[0].get('invoice_no') if isinstance(result, list) and result else None
         
         return jsonify({
             'success': True,
-            'message': 'Payment successful! Your appointment is confirmed.'
+            'message': 'Payment successful! Your appointment is confirmed.',
+            'invoice_id': invoice_no
         }), 200
         
     except Exception as e:
@@ -620,7 +1185,7 @@ def delete_appointment(appointment_id):
         print(f"[DELETE] Supabase KEY: {'Present' if SUPABASE_KEY else 'MISSING!'}")
         
         # Check if Supabase is configured
-        if not SUPABASE_URL or not SUPABASE_KEY:
+        if DATA_BACKEND == 'postgrest' and (not SUPABASE_URL or not SUPABASE_KEY):
             print(f"[ERROR] Supabase credentials not configured!")
             return jsonify({
                 'error': 'Database not configured. Please check .env file.'
@@ -648,42 +1213,23 @@ def delete_appointment(appointment_id):
         
         print(f"[DELETE] Updating with data: {update_data}")
         
-        # Direct HTTP request to Supabase
-        try:
-            url = f"{SUPABASE_URL}/rest/v1/appointments?appointment_id=eq.{appointment_id}"
-            headers = {
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Content-Type': 'application/json',
-                'Prefer': 'return=representation'
-            }
-            
-            print(f"[DELETE] Making PATCH request to: {url}")
-            response = requests.patch(url, json=update_data, headers=headers)
-            print(f"[DELETE] Response status: {response.status_code}")
-            print(f"[DELETE] Response text: {response.text[:200]}")
-            
-            if response.status_code in [200, 201, 204]:
-                print(f"[SUCCESS] Cancelled appointment: {appointment_id}")
-                print(f"{'='*60}\n")
-                return jsonify({
-                    'success': True,
-                    'message': 'Appointment cancelled successfully'
-                }), 200
-            else:
-                print(f"[ERROR] Update failed with status {response.status_code}")
-                print(f"[ERROR] Response: {response.text}")
-                print(f"{'='*60}\n")
-                return jsonify({
-                    'error': f'Database update failed: {response.status_code}'
-                }), 400
-                
-        except requests.exceptions.RequestException as req_err:
-            print(f"[ERROR] Request exception: {str(req_err)}")
+        result = supabase_update('appointments', update_data, 'appointment_id', appointment_id)
+        
+        if result is not None:
+            dashboard_aggregate.apply(appointment, {**appointment, **update_data})
+            slot_index.release(appointment.get('date'), appointment_id)
+            print(f"[SUCCESS] Cancelled appointment: {appointment_id}")
             print(f"{'='*60}\n")
             return jsonify({
-                'error': f'Network error: {str(req_err)}'
-            }), 500
+                'success': True,
+                'message': 'Appointment cancelled successfully'
+            }), 200
+        else:
+            print(f"[ERROR] Update failed for appointment: {appointment_id}")
+            print(f"{'='*60}\n")
+            return jsonify({
+                'error': 'Database update failed'
+            }), 400
         
     except Exception as e:
         print(f"[ERROR] Delete appointment exception: {str(e)}")
@@ -693,15 +1239,77 @@ def delete_appointment(appointment_id):
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 # Admin Routes
+# Admin lists: ?limit=&cursor= return one keyset page plus next_cursor
+PAGE_LIMIT_DEFAULT = 50
+PAGE_LIMIT_MAX = 200
+
+def _page_request(key_size, paged_by_default=False, key_types=(str, int)):
+    """(limit, cursor key) for a paged request, or None when the caller wants every row
+
+    Raises ValueError (InvalidCursor) with a client-facing message, also
+    for a cursor whose values are not of `key_types`.
+    """
+    limit_arg = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit_arg is None and cursor is None and not paged_by_default:
+        return None
+    try:
+        limit = int(limit_arg) if limit_arg is not None else PAGE_LIMIT_DEFAULT
+    except ValueError:
+        raise ValueError('limit must be a number')
+    limit = max(1, min(limit, PAGE_LIMIT_MAX))
+    return limit, decode_cursor(cursor, key_size, key_types) if cursor else None
+
+def _keyset_page(table, filters, order, limit, after):
+    """(rows, next_cursor) for one page ordered newest first on `order`"""
+    rows = supabase_select_keyset(table, filters, order=order, after=after, limit=limit + 1)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1].get(order[0]), rows[-1].get(order[1])])
+
+# ?stream=1 sends the full list as chunked JSON encoded row by row
+def _wants_stream():
+    return request.args.get('stream', '').lower() in ('1', 'true')
+
+def _prefetched(rows):
+    """Fetch the first row before committing to a streamed 200, so an
+    unreachable PostgREST still takes the route's normal error path"""
+    rows = iter(rows)
+    first = next(rows, None)
+    return chain([first], rows) if first is not None else iter(())
+
+def _stream_list_response(list_key, rows, trailer=None):
+    """Chunked JSON response with the same shape as the buffered one"""
+    rows = _prefetched(rows)
+    
+    def generate():
+        try:
+            yield from iter_json_object(list_key, rows, _dumps_compact, trailer)
+        except Exception as e:
+            # Headers are gone; aborting the chunked body tells the client it is incomplete
+            print(f"[ERROR] Streamed {list_key} response aborted: {e}")
+            raise
+    
+    response = app.response_class(generate(), mimetype='application/json')
+    response.headers['Cache-Control'] = ADMIN_CACHE_CONTROL
+    return response
+
 @app.route('/api/login-activity/all', methods=['GET'])
 @admin_required
 def login_activity():
     try:
-        result = supabase_select('login_history', 'order=timestamp.desc&limit=50')
+        page = _page_request(2, paged_by_default=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        result, next_cursor = _keyset_page('login_history', None, ('timestamp', 'id'), *page)
         
         return jsonify({
             'login_activity': result,
-            'count': len(result)
+            'count': len(result),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -712,6 +1320,29 @@ def login_activity():
 @admin_required
 def admin_messages():
     try:
+        page = _page_request(2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        if page is not None:
+            result, next_cursor = _keyset_page('contact_messages', None, ('created_at', 'id'), *page)
+            return jsonify({
+                'messages': result,
+                'count': len(result),
+                'next_cursor': next_cursor
+            }), 200
+        
+        if _wants_stream():
+            counted = {'count': 0}
+            
+            def messages():
+                for message in supabase_select_keyset_iter('contact_messages'):
+                    counted['count'] += 1
+                    yield message
+            
+            return _stream_list_response('messages', messages(), lambda: counted)
+        
         result = supabase_select('contact_messages', 'order=created_at.desc')
         
         return jsonify({
@@ -727,16 +1358,44 @@ def admin_messages():
 @admin_required
 def all_appointments():
     try:
+        page = _page_request(2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        if page is not None:
+            # Cancelled rows are filtered in the query so pages stay full
+            result, next_cursor = _keyset_page('appointments', NOT_CANCELLED, ('created_at', 'id'), *page)
+            return _json_etag_response({
+                'appointments': result,
+                'count': len(result),
+                'next_cursor': next_cursor
+            }, ADMIN_CACHE_CONTROL)
+        
+        if _wants_stream():
+            counted = {'count': 0}
+            emails = set()
+            
+            def appointments():
+                for apt in supabase_select_keyset_iter('appointments', NOT_CANCELLED):
+                    counted['count'] += 1
+                    if apt.get('patient_email'):
+                        emails.add(apt.get('patient_email'))
+                    yield apt
+            
+            return _stream_list_response('appointments', appointments(),
+                                         lambda: {**counted, 'total_patients': len(emails)})
+        
         result = supabase_select('appointments', 'order=created_at.desc')
         
         # Filter out cancelled appointments - they should not appear in the list
         active_appointments = [apt for apt in result if apt.get('status') != 'cancelled']
         
-        return jsonify({
+        return _json_etag_response({
             'appointments': active_appointments,
             'count': len(active_appointments),
             'total_patients': len(set(apt.get('patient_email') for apt in active_appointments if apt.get('patient_email')))
-        }), 200
+        }, ADMIN_CACHE_CONTROL)
         
     except Exception as e:
         print(f"Get all appointments error: {str(e)}")
@@ -769,71 +1428,153 @@ def send_admin_message():
         print(f"Send message error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Revenue includes consultation fee + 18% tax
+TAX_RATE = 0.18
+
+# 'pushdown' recomputes stats in PostgREST on every load; 'incremental'
+# serves them from the per-worker aggregate kept current by the handlers
+DASHBOARD_STATS_MODE = os.getenv('DASHBOARD_STATS_MODE', 'pushdown')
+DASHBOARD_RECONCILE_INTERVAL = float(os.getenv('DASHBOARD_RECONCILE_INTERVAL', '300'))
+
+dashboard_aggregate = DashboardAggregate()
+
+def _reconcile_dashboard():
+    """Re-derive the dashboard aggregate from the database"""
+    columns = 'select=id,status,payment_status,date,patient_email,consultation_fee'
+    dashboard_aggregate.reconcile(supabase_select_iter('appointments', columns))
+    correction = dashboard_aggregate.last_correction
+    print(f"[STATS] Dashboard aggregate reconciled, correction={correction}")
+
+dashboard_reconciler = PeriodicTask('dashboard-reconcile', DASHBOARD_RECONCILE_INTERVAL, _reconcile_dashboard)
+
+def _dashboard_stats_scan(today, current_month):
+    """Compute dashboard stats by streaming every appointment row"""
+    total_appointments = 0
+    todays_appointments = 0
+    pending_appointments = 0
+    completed_appointments = 0
+    monthly_revenue_base = 0.0
+    refunded_base = 0.0
+    patient_emails = set()
+    
+    # Single streamed pass over all appointments (cancelled rows only count towards refunds)
+    for a in supabase_select_iter('appointments'):
+        payment_status = a.get('payment_status')
+        in_current_month = (a.get('date') or '').startswith(current_month)
+        
+        if payment_status == 'refunded' and in_current_month:
+            refunded_base += float(a.get('consultation_fee', 0))
+        
+        if a.get('status') == 'cancelled':
+            continue
+        
+        total_appointments += 1
+        if a.get('status') == 'pending':
+            pending_appointments += 1
+        if payment_status == 'completed':
+            completed_appointments += 1
+            if a.get('date') == today:
+                todays_appointments += 1
+            # MONTHLY revenue (only completed appointments in current month, not cancelled or refunded)
+            if in_current_month:
+                monthly_revenue_base += float(a.get('consultation_fee', 0))
+        if a.get('patient_email'):
+            patient_emails.add(a.get('patient_email'))
+    
+    return {
+        'total_appointments': total_appointments,
+        'todays_appointments': todays_appointments,
+        'pending_appointments': pending_appointments,
+        'completed_appointments': completed_appointments,
+        'revenue_base': monthly_revenue_base,
+        'refunded_base': refunded_base,
+        'unique_patients': len(patient_emails)
+    }
+
+def _dashboard_stats_pushdown(today, current_month):
+    """Compute dashboard stats with server-side counts and one aggregate RPC
+
+    Returns None if any piece is unavailable (e.g. the RPC from
+    SUPABASE_FUNCTIONS.sql has not been installed) so the caller can fall
+    back to the streamed scan.
+    """
+    executor = _get_io_executor()
+    counts = {
+        'total_appointments': executor.submit(supabase_count, 'appointments', NOT_CANCELLED),
+        'pending_appointments': executor.submit(supabase_count, 'appointments', 'status=eq.pending'),
+        'completed_appointments': executor.submit(
+            supabase_count, 'appointments', f'{NOT_CANCELLED}&payment_status=eq.completed'),
+        'todays_appointments': executor.submit(
+            supabase_count, 'appointments', f'{NOT_CANCELLED}&payment_status=eq.completed&date=eq.{today}'),
+    }
+    aggregates = supabase_rpc('dashboard_aggregates', {'p_month_start': f'{current_month}-01'})
+    
+    stats = {name: future.result() for name, future in counts.items()}
+    if aggregates is None or any(value is None for value in stats.values()):
+        return None
+    
+    stats['revenue_base'] = float(aggregates.get('revenue_base') or 0)
+    stats['refunded_base'] = float(aggregates.get('refunded_base') or 0)
+    stats['unique_patients'] = int(aggregates.get('unique_patients') or 0)
+    return stats
+
+def _dashboard_payload(stats):
+    """Dashboard response body from one of the stats helpers' results"""
+    # Subtract refunded amounts (with tax) from revenue, round to 2 decimal places
+    monthly_revenue = stats['revenue_base'] * (1 + TAX_RATE)
+    refunded_amount = stats['refunded_base'] * (1 + TAX_RATE)
+    monthly_revenue = round(monthly_revenue - refunded_amount, 2)
+    
+    # Get unique patients (exclude cancelled)
+    unique_patients = stats['unique_patients']
+    todays_appointments = stats['todays_appointments']
+    
+    print(f"[STATS] Dashboard Stats: Patients={unique_patients}, Today={todays_appointments}, Monthly Revenue={monthly_revenue}")
+    
+    return {
+        'stats': {
+            'total_patients': unique_patients,
+            'todays_appointments': todays_appointments,
+            'monthly_revenue': monthly_revenue,
+            'low_stock_items': 0,  # Not implemented
+            'pending_appointments': stats['pending_appointments'],
+            'total_appointments': stats['total_appointments'],
+            'total_staff': 0,  # Not implemented
+            'completed_appointments': stats['completed_appointments']
+        }
+    }
+
+dashboard_body = VersionedBody(_to_json_body)
+
 @app.route('/api/reports/dashboard', methods=['GET'])
 @admin_required
 def dashboard_stats():
     """Get dashboard statistics"""
     try:
-        # Get all appointments (exclude cancelled)
-        all_appointments = supabase_select('appointments')
-        active_appointments = [a for a in all_appointments if a.get('status') != 'cancelled']
-        
         # Get today's date and current month
         today = datetime.now().date().isoformat()
         current_month = datetime.now().strftime('%Y-%m')
         
-        # Calculate stats (exclude cancelled)
-        total_appointments = len(active_appointments)
-        todays_appointments = len([a for a in active_appointments 
-                                   if a.get('date') == today and a.get('payment_status') == 'completed'])
-        pending_appointments = len([a for a in active_appointments if a.get('status') == 'pending'])
-        completed_appointments = len([a for a in active_appointments if a.get('payment_status') == 'completed'])
-        
-        # Calculate MONTHLY revenue (only completed appointments in current month, not cancelled or refunded)
-        # Revenue includes consultation fee + 18% tax
-        TAX_RATE = 0.18
-        
-        monthly_revenue_base = sum(
-            float(a.get('consultation_fee', 0)) 
-            for a in active_appointments 
-            if a.get('payment_status') == 'completed' 
-            and a.get('date', '').startswith(current_month)
-        )
-        
-        # Add tax to revenue
-        monthly_revenue = monthly_revenue_base * (1 + TAX_RATE)
-        
-        # Subtract refunded amounts (with tax) from revenue
-        refunded_base = sum(
-            float(a.get('consultation_fee', 0))
-            for a in all_appointments
-            if a.get('payment_status') == 'refunded'
-            and a.get('date', '').startswith(current_month)
-        )
-        
-        refunded_amount = refunded_base * (1 + TAX_RATE)
-        monthly_revenue = monthly_revenue - refunded_amount
-        
-        # Round to 2 decimal places
-        monthly_revenue = round(monthly_revenue, 2)
-        
-        # Get unique patients (exclude cancelled)
-        unique_patients = len(set(a.get('patient_email') for a in active_appointments if a.get('patient_email')))
+        stats = None
+        if DASHBOARD_STATS_MODE == 'incremental':
+            dashboard_reconciler.ensure_started()
+            if not dashboard_aggregate.ready:
+                dashboard_reconciler.run_once()
+            if dashboard_aggregate.ready:
+                # The aggregate's generation versions the body: unchanged polls
+                # are answered without rebuilding or reserializing it
+                version = (dashboard_aggregate.generation, today, current_month)
+                etag, body = dashboard_body.get(version, lambda: _dashboard_payload(
+                    dashboard_aggregate.snapshot(today, current_month)))
+                return _etag_response(etag, body, ADMIN_CACHE_CONTROL)
+        else:
+            stats = _dashboard_stats_pushdown(today, current_month)
         
-        print(f"[STATS] Dashboard Stats: Patients={unique_patients}, Today={todays_appointments}, Monthly Revenue={monthly_revenue}")
+        if stats is None:
+            print("[STATS] Aggregate unavailable, falling back to full scan")
+            stats = _dashboard_stats_scan(today, current_month)
         
-        return jsonify({
-            'stats': {
-                'total_patients': unique_patients,
-                'todays_appointments': todays_appointments,
-                'monthly_revenue': monthly_revenue,
-                'low_stock_items': 0,  # Not implemented
-                'pending_appointments': pending_appointments,
-                'total_appointments': total_appointments,
-                'total_staff': 0,  # Not implemented
-                'completed_appointments': completed_appointments
-            }
-        }), 200
+        return _json_etag_response(_dashboard_payload(stats), ADMIN_CACHE_CONTROL)
         
     except Exception as e:
         print(f"[ERROR] Dashboard stats error: {str(e)}")
@@ -847,32 +1588,195 @@ def dashboard_stats():
             'total_staff': 0
         }}), 200
 
+# Appointment/revenue export; revenue columns follow the dashboard's rules
+EXPORT_HEADER = [
+    'Appointment ID', 'Date', 'Time', 'Patient Name', 'Patient Email', 'Patient Phone',
+    'Department', 'Mode', 'Status', 'Payment Status', 'Invoice No',
+    'Consultation Fee', 'Tax', 'Total', 'Revenue', 'Refunded', 'Created At'
+]
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def _export_record(apt):
+    fee = float(apt.get('consultation_fee') or 0)
+    tax = round(fee * TAX_RATE, 2)
+    total = round(fee + tax, 2)
+    paid = apt.get('payment_status') == 'completed' and apt.get('status') != 'cancelled'
+    refunded = apt.get('payment_status') == 'refunded'
+    return [
+        apt.get('appointment_id'), apt.get('date'), apt.get('time'),
+        apt.get('patient_name'), apt.get('patient_email'), apt.get('patient_phone'),
+        apt.get('department'), apt.get('mode'), apt.get('status'), apt.get('payment_status'),
+        apt.get('invoice_no'), fee, tax, total,
+        total if paid else 0, total if refunded else 0, apt.get('created_at')
+    ]
+
+@app.route('/api/reports/export', methods=['GET'])
+@admin_required
+def export_appointments():
+    """Download appointments (and their revenue) as CSV or XLSX, optionally for a date range"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'xlsx'):
+        return jsonify({'error': 'format must be csv or xlsx'}), 400
+    
+    filters = []
+    bounds = {}
+    for arg, op in (('from', 'gte'), ('to', 'lte')):
+        value = request.args.get(arg)
+        if not value:
+            continue
+        try:
+            bounds[arg] = datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+        except ValueError:
+            return jsonify({'error': f'{arg} must be a date as YYYY-MM-DD'}), 400
+        filters.append(f'date={op}.{bounds[arg]}')
+    
+    filename = f"appointments_{bounds.get('from', 'start')}_{bounds.get('to', 'today')}.{export_format}"
+    
+    try:
+        # Oldest first, one keyset page at a time
+        rows = supabase_select_keyset_iter('appointments', '&'.join(filters) or None,
+                                           order=('date', 'id'), descending=False)
+        records = (_export_record(apt) for apt in _prefetched(rows))
+        
+        if export_format == 'xlsx':
+            # A zip cannot be sent before it is finished; rows spool to a temp file
+            path = write_xlsx(EXPORT_HEADER, records, sheet_title='Appointments')
+            response = app.response_class(iter_file(path), mimetype=XLSX_MIMETYPE)
+            response.headers['Content-Length'] = str(os.path.getsize(path))
+            response.call_on_close(lambda: remove_quietly(path))
+        else:
+            def generate():
+                try:
+                    yield from iter_csv(EXPORT_HEADER, records)
+                except Exception as e:
+                    print(f"[ERROR] CSV export aborted: {e}")
+                    raise
+            response = app.response_class(generate(), mimetype='text/csv')
+        
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+        
+    except Exception as e:
+        print(f"[ERROR] Export error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Rendered invoice PDFs, keyed by content; month-end runs render in a process pool
+invoice_cache = InvoiceRenderCache(os.getenv('INVOICE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'hospital-invoices')))
+bulk_invoice_renderer = BulkInvoiceRenderer(invoice_cache, workers=int(os.getenv('INVOICE_RENDER_WORKERS', '0')) or None)
+
+def _month_bounds(month):
+    """First instant of a YYYY-MM month and of the month after it"""
+    start = datetime.strptime(month, '%Y-%m')
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+@app.route('/api/billing/invoices/bulk', methods=['GET'])
+@admin_required
+def bulk_invoices():
+    """Download every invoice issued in ?month=YYYY-MM as PDFs in one ZIP"""
+    try:
+        start, end = _month_bounds(request.args.get('month', ''))
+    except ValueError:
+        return jsonify({'error': 'month must be given as YYYY-MM'}), 400
+    
+    filters = f'created_at=gte.{start.isoformat()}&created_at=lt.{end.isoformat()}&invoice_no=not.is.null'
+    
+    try:
+        rows = supabase_select_keyset_iter('appointments', filters, order=('created_at', 'id'), descending=False)
+        invoices = (build_invoice(apt['invoice_no'], apt, tax_rate=TAX_RATE) for apt in _prefetched(rows))
+        
+        def generate():
+            # Members are added in the order their PDFs finish rendering
+            try:
+                pdfs = bulk_invoice_renderer.iter_pdfs(invoices)
+                yield from iter_zip((f"{invoice['invoice_no']}.pdf", path) for invoice, path in pdfs)
+            except Exception as e:
+                print(f"[ERROR] Bulk invoice download aborted: {e}")
+                raise
+        
+        response = app.response_class(generate(), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="invoices_{start:%Y-%m}.zip"'
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+        
+    except Exception as e:
+        print(f"[ERROR] Bulk invoice error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _add_patient_row(patients_dict, apt):
+    email = apt.get('patient_email')
+    if not email:
+        return
+    if email not in patients_dict:
+        patients_dict[email] = {
+            'id': apt.get('id', ''),
+            'name': apt.get('patient_name', 'Unknown'),
+            'email': email,
+            'phone': apt.get('patient_phone', '+1234567890'),
+            'total_appointments': 0,
+            'last_visit': apt.get('date', '')
+        }
+    
+    patients_dict[email]['total_appointments'] += 1
+    # Update last visit if this appointment is more recent
+    if apt.get('date', '') > patients_dict[email]['last_visit']:
+        patients_dict[email]['last_visit'] = apt.get('date', '')
+
+def _iter_patients(after_email=None):
+    """Patients in email order, each yielded once all of its appointments are seen"""
+    filters = f'patient_email=gt.{quote(after_email, safe="")}' if after_email else 'patient_email=not.is.null'
+    current = {}
+    for apt in supabase_select_keyset_iter('appointments', filters, order=('patient_email', 'id'), descending=False):
+        if current and apt.get('patient_email') not in current:
+            yield from current.values()
+            current = {}
+        _add_patient_row(current, apt)
+    yield from current.values()
+
+def _patients_page(limit, after_email):
+    """Up to `limit` patients after `after_email`, plus the cursor for the next page"""
+    patients = []
+    for patient in _iter_patients(after_email):
+        if len(patients) == limit:
+            # A further patient exists
+            return patients, encode_cursor([patients[-1]['email']])
+        patients.append(patient)
+    return patients, None
+
 @app.route('/api/admin/patients', methods=['GET'])
 @admin_required
 def get_admin_patients():
     """Get all patients from appointments"""
     try:
-        all_appointments = supabase_select('appointments')
+        # The cursor is the last patient's email
+        page = _page_request(1, key_types=(str,))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        if page is not None:
+            limit, after = page
+            patients, next_cursor = _patients_page(limit, after[0] if after else None)
+            return jsonify({
+                'patients': patients,
+                'count': len(patients),
+                'next_cursor': next_cursor
+            }), 200
         
-        # Get unique patients
-        patients_dict = {}
-        for apt in all_appointments:
-            email = apt.get('patient_email')
-            if email and email not in patients_dict:
-                patients_dict[email] = {
-                    'id': apt.get('id', ''),
-                    'name': apt.get('patient_name', 'Unknown'),
-                    'email': email,
-                    'phone': apt.get('patient_phone', '+1234567890'),
-                    'total_appointments': 0,
-                    'last_visit': apt.get('date', '')
-                }
+        if _wants_stream():
+            counted = {'count': 0}
+            
+            def patients():
+                for patient in _iter_patients():
+                    counted['count'] += 1
+                    yield patient
             
-            if email:
-                patients_dict[email]['total_appointments'] += 1
-                # Update last visit if this appointment is more recent
-                if apt.get('date', '') > patients_dict[email]['last_visit']:
-                    patients_dict[email]['last_visit'] = apt.get('date', '')
+            return _stream_list_response('patients', patients(), lambda: counted)
+        
+        # Get unique patients (streamed page by page)
+        patients_dict = {}
+        for apt in supabase_select_iter('appointments'):
+            _add_patient_row(patients_dict, apt)
         
         patients = list(patients_dict.values())
         
@@ -885,22 +1789,76 @@ def get_admin_patients():
         print(f"Get patients error: {str(e)}")
         return jsonify({'patients': []}), 200
 
+@app.route('/api/admin/runtime-stats', methods=['GET'])
+@admin_required
+def runtime_stats():
+    """Per-worker counters used to size pools and caches"""
+    return jsonify({
+        'http_pool': http_pool.stats(),
+        'data_backend': sqlite_backend.stats() if sqlite_backend else {'backend': DATA_BACKEND},
+        'slot_index': slot_index.stats(),
+        'user_cache': user_cache.stats(),
+        'token_cache': token_cache.stats(),
+        'review_stats': review_stats.stats(),
+        'login_history_queue': login_history_queue.stats(),
+        'invoice_numbers': invoice_numbers.stats(),
+        'invoice_renderer': bulk_invoice_renderer.stats(),
+        'response_bodies': {
+            'config': config_body.stats(),
+            'reviews': reviews_body.stats(),
+            'dashboard': dashboard_body.stats()
+        },
+        'dashboard_aggregate': {
+            'mode': DASHBOARD_STATS_MODE,
+            'reconcile_interval': DASHBOARD_RECONCILE_INTERVAL,
+            **dashboard_aggregate.stats()
+        }
+    }), 200
+
 # Reviews API
+REVIEW_REFRESH_INTERVAL = float(os.getenv('REVIEW_REFRESH_INTERVAL', '60'))
+
+review_stats = ReviewStats(top_n=6, min_rating=4)
+
+def _refresh_review_stats():
+    """Reload review count, rating sum and the top-6 list from the database"""
+    summary = supabase_rpc('review_summary', {'p_min_rating': 4, 'p_limit': 6})
+    if summary is None:
+        # RPC not installed: count server-side, stream only the rating column
+        count = supabase_count('reviews')
+        if count is None:
+            raise RuntimeError('Review count unavailable')
+        rating_sum = sum(int(r.get('rating') or 0) for r in supabase_select_iter('reviews', 'select=id,rating'))
+        top = supabase_select('reviews', 'rating=gte.4&order=created_at.desc&limit=6')
+        summary = {'count': count, 'rating_sum': rating_sum, 'top': top}
+    
+    review_stats.refresh(summary['count'], summary['rating_sum'], summary.get('top') or [])
+
+review_refresher = PeriodicTask('review-refresh', REVIEW_REFRESH_INTERVAL, _refresh_review_stats)
+
+def _reviews_payload():
+    result, count, avg_rating = review_stats.snapshot()
+    return {
+        'reviews': result,
+        'count': count,
+        'average_rating': round(avg_rating, 1)
+    }
+
+reviews_body = VersionedBody(_to_json_body)
+
 @app.route('/api/reviews', methods=['GET'])
 def get_reviews():
     """Get all reviews for homepage"""
     try:
-        result = supabase_select('reviews', 'rating=gte.4&order=created_at.desc&limit=6')
+        # Served from memory; the refresher keeps it in step with the database
+        review_refresher.ensure_started()
+        if not review_stats.ready:
+            review_refresher.run_once()
+        if not review_stats.ready:
+            raise RuntimeError('Review stats not loaded')
         
-        # Calculate average rating
-        all_reviews = supabase_select('reviews')
-        avg_rating = sum(r.get('rating', 0) for r in all_reviews) / len(all_reviews) if all_reviews else 0
-        
-        return jsonify({
-            'reviews': result,
-            'count': len(all_reviews),
-            'average_rating': round(avg_rating, 1)
-        }), 200
+        etag, body = reviews_body.get(review_stats.generation, _reviews_payload)
+        return _etag_response(etag, body, 'public, no-cache')
         
     except Exception as e:
         print(f"Get reviews error: {str(e)}")
@@ -940,6 +1898,8 @@ def add_review():
         }
         
         result = supabase_insert('reviews', review_data)
+        if result:
+            review_stats.record(result[0])
         
         return jsonify({
             'message': 'Thank you for your review!',
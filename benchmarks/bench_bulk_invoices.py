@@ -0,0 +1,105 @@
+"""
+Benchmark: /api/billing/invoices/bulk throughput (invoices/s) by render worker count
+
+Each worker count runs in a fresh child process with an empty invoice
+cache. The child patches app_supabase's keyset reader with the synthetic
+appointments from bench_streaming_rss.py (every one carrying an
+invoice_no), downloads one month's ZIP through the Flask test client, and
+then downloads it again. The first ("cold") pass renders every PDF in the
+process pool; the second ("warm") pass only reads cached files. Worker
+count 1 renders inline, without a pool.
+
+Run from the repository root:
+    python benchmarks/bench_bulk_invoices.py
+    python benchmarks/bench_bulk_invoices.py --invoices 2000 --workers 1,2,4,8
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SUPABASE_URL', 'http://postgrest.invalid')
+os.environ.setdefault('SUPABASE_KEY', 'benchmark')
+
+from bench_streaming_rss import make_row  # noqa: E402
+
+
+def child(workers, invoices):
+    os.environ['INVOICE_RENDER_WORKERS'] = str(workers)
+    os.environ['INVOICE_CACHE_DIR'] = tempfile.mkdtemp(prefix='bench-invoices-')
+    import jwt
+    import app_supabase
+
+    def invoice_row(i):
+        row = make_row(i)
+        row['invoice_no'] = f'INV-2024-{i + 1:06d}'
+        return row
+
+    def fake_keyset(table, filters=None, order=('created_at', 'id'), descending=True, after=None, limit=50):
+        start = int(after[1]) + 1 if after is not None else 0
+        return json.loads(json.dumps([invoice_row(i) for i in range(start, min(start + limit, invoices))]))
+
+    app_supabase.supabase_select_keyset = fake_keyset
+
+    client = app_supabase.app.test_client()
+    token = jwt.encode({'email': 'admin@123', 'role': 'admin'}, app_supabase.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    result = {'workers': workers, 'invoices': invoices, 'cpus': os.cpu_count()}
+    for run in ('cold', 'warm'):
+        started = time.perf_counter()
+        response = client.get('/api/billing/invoices/bulk?month=2024-06', headers=headers)
+        body = response.get_data()
+        elapsed = time.perf_counter() - started
+        members = len(zipfile.ZipFile(io.BytesIO(body)).namelist())
+        if response.status_code != 200 or members != invoices:
+            raise RuntimeError(f'{run} run returned {response.status_code} with {members} invoices')
+        result[f'{run}_seconds'] = round(elapsed, 2)
+        result[f'{run}_invoices_per_second'] = round(invoices / elapsed, 1)
+    result['zip_mb'] = round(len(body) / 2 ** 20, 1)
+    app_supabase.bulk_invoice_renderer.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=500)
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated render worker counts')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = child(args.child, args.invoices)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for workers in args.workers.split(','):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', workers, '--invoices', str(args.invoices)],
+            check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Bulk download of {args.invoices:,} invoice PDFs ({os.cpu_count()} CPUs)")
+    print(f"{'workers':<9}{'cold s':>8}{'cold inv/s':>12}{'warm s':>8}{'warm inv/s':>12}{'zip MB':>8}")
+    for r in results:
+        print(f"{r['workers']:<9}{r['cold_seconds']:>8}{r['cold_invoices_per_second']:>12}"
+              f"{r['warm_seconds']:>8}{r['warm_invoices_per_second']:>12}{r['zip_mb']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark: /api/reports/dashboard full-scan path vs. PostgREST pushdown path
+
+PostgREST is replaced by an in-process wire model: every response is
+serialized to JSON bytes and decoded again, so the client-side cost
+(payload size, JSON decoding, Python aggregation) is real while the
+database's own work is excluded. An optional --rtt-ms adds a simulated
+network round trip to every call.
+
+Run from the repository root:
+    python benchmarks/bench_dashboard_stats.py
+    python benchmarks/bench_dashboard_stats.py --sizes 10000,100000 --rtt-ms 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SUPABASE_URL', 'http://postgrest.invalid')
+os.environ.setdefault('SUPABASE_KEY', 'benchmark')
+
+import app_supabase  # noqa: E402
+
+TODAY = datetime.now().date().isoformat()
+CURRENT_MONTH = datetime.now().strftime('%Y-%m')
+STATUSES = ['pending', 'confirmed', 'cancelled']
+PAYMENT_STATUSES = ['pending', 'completed', 'refunded']
+
+
+def make_row(i):
+    """Deterministic synthetic appointment shaped like the real table"""
+    return {
+        'id': f'{i:010d}',
+        'appointment_id': f'APT{i:07d}',
+        'patient_name': f'Patient {i % 5000}',
+        'patient_email': f'patient{i % 5000}@gmail.com',
+        'patient_phone': '+1234567890',
+        'department': 'General Medicine',
+        'date': TODAY if i % 30 == 0 else f'{CURRENT_MONTH}-{(i % 28) + 1:02d}' if i % 4 else '2023-06-15',
+        'time': f'{8 + (i % 12):02d}:{(i % 3) * 20:02d}',
+        'mode': 'In-person',
+        'symptoms': 'Routine check-up',
+        'status': STATUSES[i % 3],
+        'payment_status': PAYMENT_STATUSES[(i // 3) % 3],
+        'consultation_fee': 500,
+        'created_at': '2024-01-15T10:30:00'
+    }
+
+
+class WireModel:
+    """Stands in for PostgREST and accounts for bytes and round trips"""
+
+    def __init__(self, size, rtt):
+        self.size = size
+        self.rtt = rtt
+        self.reset()
+
+    def reset(self):
+        self.bytes = 0
+        self.round_trips = 0
+        self.server_seconds = 0.0
+
+    def _respond(self, payload, server_started):
+        body = json.dumps(payload).encode()
+        self.server_seconds += time.perf_counter() - server_started
+        self.bytes += len(body)
+        self.round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+        return json.loads(body)
+
+    def select_page(self, table, filters, key, after, page_size):
+        started = time.perf_counter()
+        start = int(after) + 1 if after is not None else 0
+        page = [make_row(i) for i in range(start, min(start + page_size, self.size))]
+        return self._respond(page, started)
+
+    def precompute(self):
+        """Answers the database would produce; computed outside the timed section"""
+        counts = {'total': 0, 'pending': 0, 'completed': 0, 'today': 0}
+        revenue_base = refunded_base = 0.0
+        patients = set()
+        for i in range(self.size):
+            row = make_row(i)
+            in_month = row['date'].startswith(CURRENT_MONTH)
+            if row['payment_status'] == 'refunded' and in_month:
+                refunded_base += row['consultation_fee']
+            if row['status'] == 'cancelled':
+                continue
+            counts['total'] += 1
+            counts['pending'] += row['status'] == 'pending'
+            if row['payment_status'] == 'completed':
+                counts['completed'] += 1
+                counts['today'] += row['date'] == TODAY
+                if in_month:
+                    revenue_base += row['consultation_fee']
+            patients.add(row['patient_email'])
+        self.counts = counts
+        self.aggregates = {
+            'revenue_base': revenue_base,
+            'refunded_base': refunded_base,
+            'unique_patients': len(patients)
+        }
+
+    def count(self, table, filters=None):
+        started = time.perf_counter()
+        filters = filters or ''
+        if 'date=eq.' in filters:
+            value = self.counts['today']
+        elif 'payment_status=eq.completed' in filters:
+            value = self.counts['completed']
+        elif 'status=eq.pending' in filters:
+            value = self.counts['pending']
+        else:
+            value = self.counts['total']
+        # HEAD response: no body, only the Content-Range header
+        header = f'Content-Range: */{value}'.encode()
+        self.server_seconds += time.perf_counter() - started
+        self.bytes += len(header)
+        self.round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+        return value
+
+    def rpc(self, function, params=None):
+        return self._respond(self.aggregates, time.perf_counter())
+
+
+def run_path(name, model, fn):
+    model.reset()
+    started = time.perf_counter()
+    stats = fn(TODAY, CURRENT_MONTH)
+    wall = time.perf_counter() - started
+    return {
+        'path': name,
+        'wall_seconds': round(wall, 4),
+        'client_seconds': round(max(wall - model.server_seconds, 0.0), 4),
+        'bytes': model.bytes,
+        'round_trips': model.round_trips,
+        'stats': stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--page-size', type=int, default=app_supabase.SELECT_PAGE_SIZE)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        model = WireModel(size, args.rtt_ms / 1000.0)
+        model.precompute()
+
+        app_supabase._select_page = model.select_page
+        app_supabase.supabase_count = model.count
+        app_supabase.supabase_rpc = model.rpc
+        app_supabase.SELECT_PAGE_SIZE = args.page_size
+
+        scan = run_path('scan', model, app_supabase._dashboard_stats_scan)
+        pushdown = run_path('pushdown', model, app_supabase._dashboard_stats_pushdown)
+        assert scan['stats'] == pushdown['stats'], (scan['stats'], pushdown['stats'])
+        results.append({'appointments': size, 'scan': scan, 'pushdown': pushdown})
+
+        if not args.json:
+            print(f"\n{size:,} appointments")
+            for r in (scan, pushdown):
+                print(f"  {r['path']:<9} wall={r['wall_seconds']:>9.4f}s  client={r['client_seconds']:>9.4f}s  "
+                      f"bytes={r['bytes']:>13,}  round_trips={r['round_trips']}")
+
+    if args.json:
+        for r in results:
+            r['scan'].pop('stats')
+            r['pushdown'].pop('stats')
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+Benchmark: per-endpoint throughput and latency under a mixed request load
+
+Concurrent clients send a weighted mix of requests through the real route
+table, either in-process (Flask's test client, no sockets) or over HTTP to
+a gunicorn started with gunicorn.conf.py. The endpoints in the mix are:
+
+    landing          GET  /api/reviews (the HTML templates are not in this
+                          tree; this is the data the homepage loads)
+    login            POST /api/auth/login
+    book             POST /api/appointments/book (every request takes a new
+                          free slot, so none hit the conflict rules)
+    my_appointments  GET  /api/appointments/my-appointments
+    admin_dashboard  GET  /api/reports/dashboard
+
+--app supabase runs app_supabase on the embedded SQLite backend
+(DATA_BACKEND=sqlite, a fresh temporary database), so no PostgREST is
+needed. --app test runs app_no_firebase; under gunicorn it uses
+TEST_STORE=shared. Each client's schedule is seeded and the request count
+is fixed, so every run sends the same requests. --json prints sorted keys
+and fixed rounding, so the output of two commits can be diffed.
+
+Run from the repository root:
+    python benchmarks/bench_endpoints.py
+    python benchmarks/bench_endpoints.py --server gunicorn --workers 2 --concurrency 32
+    python benchmarks/bench_endpoints.py --mix landing=1,book=1 --json > before.json
+"""
+
+import argparse
+import contextlib
+import importlib
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SUPABASE_URL', 'http://postgrest.invalid')
+os.environ.setdefault('SUPABASE_KEY', 'benchmark')
+
+import jwt  # noqa: E402
+import requests  # noqa: E402
+
+from bench_serving_modes import ROOT, SECRET_KEY, free_port, percentile, wait_until_up  # noqa: E402
+from utils.slot_index import SLOT_STARTS  # noqa: E402
+
+APPS = {'supabase': 'app_supabase', 'test': 'app_no_firebase'}
+DEFAULT_MIX = 'landing=30,login=15,book=15,my_appointments=30,admin_dashboard=10'
+FIRST_BOOKING_DATE = date(2030, 1, 7)
+PATIENTS = 500
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f'unknown endpoint {name!r} (choose from {", ".join(ENDPOINTS)})')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def token(email, role):
+    return jwt.encode({'email': email, 'role': role}, SECRET_KEY, algorithm='HS256')
+
+
+class Slots:
+    """Hands out distinct (date, time) booking slots; one per slot start, day after day"""
+
+    def __init__(self):
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            n = next(self._counter)
+        day, index = divmod(n, len(SLOT_STARTS))
+        minute = SLOT_STARTS[index]
+        return (FIRST_BOOKING_DATE + timedelta(days=day)).isoformat(), f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def landing(client, ctx):
+    return client('GET', '/api/reviews')
+
+
+def login(client, ctx):
+    return client('POST', '/api/auth/login', json={'email': ctx['email'], 'password': 'benchmark'})
+
+
+def book(client, ctx):
+    booking_date, booking_time = ctx['slots'].next()
+    return client('POST', '/api/appointments/book', headers=ctx['auth'], json={
+        'department': 'General Medicine',
+        'date': booking_date,
+        'time': booking_time,
+        'mode': 'offline',
+        'symptoms': 'benchmark'
+    })
+
+
+def my_appointments(client, ctx):
+    return client('GET', '/api/appointments/my-appointments', headers=ctx['auth'])
+
+
+def admin_dashboard(client, ctx):
+    return client('GET', '/api/reports/dashboard', headers=ctx['admin_auth'])
+
+
+ENDPOINTS = {
+    'landing': landing,
+    'login': login,
+    'book': book,
+    'my_appointments': my_appointments,
+    'admin_dashboard': admin_dashboard,
+}
+
+
+def in_process_client(app):
+    """Returns a callable(method, path, **kwargs) -> status code, backed by a Flask test client"""
+    test_client = app.test_client()
+
+    def call(method, path, **kwargs):
+        # buffered: read and close the body the way a server would
+        return test_client.open(path, method=method, buffered=True, **kwargs).status_code
+    return call
+
+
+def http_client(base_url):
+    """Returns a callable(method, path, **kwargs) -> status code, over one keep-alive session"""
+    session = requests.Session()
+
+    def call(method, path, **kwargs):
+        return session.request(method, base_url + path, timeout=30, **kwargs).status_code
+    return call
+
+
+def schedule(mix, count, seed):
+    rng = random.Random(seed)
+    names = sorted(mix)
+    return rng.choices(names, weights=[mix[name] for name in names], k=count)
+
+
+def run_load(make_client, mix, concurrency, total, seed, slots):
+    """Send `total` requests from `concurrency` clients; returns (samples, elapsed seconds)"""
+    admin_auth = {'Authorization': f"Bearer {token('admin@123', 'admin')}"}
+    samples = []
+    lock = threading.Lock()
+    start = threading.Barrier(concurrency + 1)
+
+    def client(index, count):
+        email = f'patient{index % PATIENTS}@gmail.com'
+        ctx = {
+            'email': email,
+            'auth': {'Authorization': f"Bearer {token(email, 'patient')}"},
+            'admin_auth': admin_auth,
+            'slots': slots
+        }
+        call = make_client()
+        plan = schedule(mix, count, seed * 1000 + index)
+        mine = []
+        start.wait()
+        for name in plan:
+            started = time.perf_counter()
+            try:
+                status = ENDPOINTS[name](call, ctx)
+            except Exception:
+                status = 'error'
+            mine.append((name, status, time.perf_counter() - started))
+        with lock:
+            samples.extend(mine)
+
+    per_client, extra = divmod(total, concurrency)
+    threads = [threading.Thread(target=client, args=(i, per_client + (i < extra)))
+               for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    start.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """Aggregate (endpoint, status, seconds) samples per endpoint and overall"""
+    def block(rows):
+        latencies = sorted(seconds for _, _, seconds in rows)
+        statuses = {}
+        for _, status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for _, status, _ in rows if status == 'error' or status >= 400),
+            'statuses': statuses,
+            'requests_per_second': round(len(rows) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+
+    endpoints = {}
+    for name in sorted({name for name, _, _ in samples}):
+        endpoints[name] = block([s for s in samples if s[0] == name])
+    return {'total': block(samples), 'endpoints': endpoints, 'elapsed_s': round(elapsed, 2)}
+
+
+def app_env(app_name, data_dir):
+    if app_name == 'supabase':
+        return {'DATA_BACKEND': 'sqlite', 'SQLITE_PATH': os.path.join(data_dir, 'bench.db')}
+    return {'TEST_STORE': 'shared', 'TEST_STORE_PATH': os.path.join(data_dir, 'bench.log')}
+
+
+def bench_in_process(args, data_dir):
+    if args.app == 'supabase':
+        # One process: test mode keeps its default per-process store
+        os.environ.update(app_env(args.app, data_dir))
+    # The handlers log every request; keep that out of the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        module = importlib.import_module(APPS[args.app])
+        make_client = lambda: in_process_client(module.app)  # noqa: E731
+        slots = Slots()
+        run_load(make_client, args.mix, args.concurrency, args.warmup, args.seed + 1, slots)
+        result = run_load(make_client, args.mix, args.concurrency, args.requests, args.seed, slots)
+        if hasattr(module, 'login_history_queue'):
+            module.login_history_queue.close()
+        return result
+
+
+def bench_gunicorn(args, data_dir):
+    port = free_port()
+    env = dict(os.environ,
+               PORT=str(port),
+               WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_WORKER_CLASS='gthread',
+               GUNICORN_THREADS=str(args.threads),
+               **app_env(args.app, data_dir))
+    env.pop('SUPABASE_POOL_SIZE', None)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', f'{APPS[args.app]}:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        wait_until_up(f'{base}/api/health')
+        make_client = lambda: http_client(base)  # noqa: E731
+        slots = Slots()
+        run_load(make_client, args.mix, args.concurrency, args.warmup, args.seed + 1, slots)
+        return run_load(make_client, args.mix, args.concurrency, args.requests, args.seed, slots)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--app', choices=sorted(APPS), default='supabase')
+    parser.add_argument('--server', choices=['inprocess', 'gunicorn'], default='inprocess')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'endpoint=weight,... (default {DEFAULT_MIX})')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='measured requests, across all clients')
+    parser.add_argument('--warmup', type=int, default=200, help='unmeasured requests sent first')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='handler threads per gunicorn worker')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='bench-endpoints-')
+    if args.server == 'gunicorn':
+        samples, elapsed = bench_gunicorn(args, data_dir)
+    else:
+        samples, elapsed = bench_in_process(args, data_dir)
+
+    config = {
+        'app': args.app,
+        'server': args.server,
+        'mix': args.mix,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'seed': args.seed,
+    }
+    if args.server == 'gunicorn':
+        config.update(workers=args.workers, threads=args.threads)
+    result = {'config': config, **summarize(samples, elapsed)}
+
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+        return
+
+    print(f"{args.app} app, {args.server}, {args.concurrency} clients, "
+          f"{args.requests} requests in {result['elapsed_s']} s")
+    print(f"{'endpoint':<17}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, r in [*result['endpoints'].items(), ('total', result['total'])]:
+        print(f"{name:<17}{r['requests']:>9}{r['errors']:>8}{r['requests_per_second']:>9}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}")
+
+
+if __name__ == '__main__':
+    main()
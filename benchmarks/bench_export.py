@@ -0,0 +1,101 @@
+"""
+Benchmark: /api/reports/export download throughput and peak RSS
+
+Each format runs in a fresh child process against the synthetic
+appointments fixture from bench_streaming_rss.py (keyset pages go through
+a JSON encode/decode, as they would from PostgREST). The child downloads
+the export through the Flask test client and reports rows/s, MB/s and
+peak RSS above its post-import baseline. "scrape" is the old workaround
+for comparison: one buffered GET /api/appointments/all.
+
+Run from the repository root:
+    python benchmarks/bench_export.py
+    python benchmarks/bench_export.py --rows 250000 --formats csv,xlsx
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SUPABASE_URL', 'http://postgrest.invalid')
+os.environ.setdefault('SUPABASE_KEY', 'benchmark')
+
+from bench_streaming_rss import peak_rss_mb, wire  # noqa: E402
+
+
+def child(export_format, rows):
+    import jwt
+    import app_supabase
+
+    def fake_keyset(table, filters=None, order=('created_at', 'id'), descending=True, after=None, limit=50):
+        start = int(after[1]) + 1 if after is not None else 0
+        return wire(start, min(start + limit, rows))
+
+    app_supabase.supabase_select_keyset = fake_keyset
+    app_supabase.supabase_select = lambda table, filters=None: wire(0, rows)
+
+    client = app_supabase.app.test_client()
+    token = jwt.encode({'email': 'admin@123', 'role': 'admin'}, app_supabase.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    path = '/api/appointments/all' if export_format == 'scrape' else f'/api/reports/export?format={export_format}'
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    response = client.get(path, headers=headers, buffered=False)
+    size = 0
+    for chunk in response.iter_encoded():
+        size += len(chunk)
+    response.close()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'format': export_format,
+        'rows': rows,
+        'status': response.status_code,
+        'body_mb': round(size / 2 ** 20, 1),
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(rows / elapsed),
+        'mb_per_second': round(size / 2 ** 20 / elapsed, 1),
+        'peak_over_baseline_mb': round(peak_rss_mb() - baseline, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--formats', default='csv,xlsx,scrape', help='comma-separated: csv, xlsx, scrape')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = child(args.child, args.rows)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for export_format in args.formats.split(','):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', export_format, '--rows', str(args.rows)],
+            check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Export of {args.rows:,} appointments")
+    print(f"{'format':<8}{'body MB':>9}{'seconds':>9}{'rows/s':>10}{'MB/s':>7}{'peak RSS over baseline MB':>27}")
+    for r in results:
+        print(f"{r['format']:<8}{r['body_mb']:>9}{r['seconds']:>9}{r['rows_per_second']:>10}"
+              f"{r['mb_per_second']:>7}{r['peak_over_baseline_mb']:>27}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Microbenchmark: HS256 token verification with and without the verified-JWT cache
+
+Measures decode throughput for jwt.decode on every call versus
+app_supabase.decode_token with a warm cache, then the same comparison
+through an @admin_required route with the Flask test client.
+
+Run from the repository root:
+    python benchmarks/bench_jwt_cache.py [--iterations 50000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SUPABASE_URL', 'http://postgrest.invalid')
+os.environ.setdefault('SUPABASE_KEY', 'benchmark')
+
+import jwt  # noqa: E402
+
+import app_supabase  # noqa: E402
+
+
+def rate(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50000)
+    args = parser.parse_args()
+
+    secret = app_supabase.app.config['SECRET_KEY']
+    token = jwt.encode({
+        'email': 'admin@123',
+        'role': 'admin',
+        'exp': datetime.utcnow() + timedelta(days=30)
+    }, secret, algorithm='HS256')
+
+    uncached = rate(lambda: jwt.decode(token, secret, algorithms=['HS256']), args.iterations)
+    app_supabase.decode_token(token)
+    cached = rate(lambda: app_supabase.decode_token(token), args.iterations)
+
+    print(f"decode, uncached (jwt.decode):     {uncached:>12,.0f} tokens/s")
+    print(f"decode, cached (decode_token):     {cached:>12,.0f} tokens/s  ({cached / uncached:.1f}x)")
+
+    # A cheap admin route, so the decorator dominates the request cost
+    client = app_supabase.app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    requests = max(args.iterations // 10, 1)
+
+    original = app_supabase.decode_token
+    app_supabase.decode_token = lambda t: jwt.decode(t, secret, algorithms=['HS256'])
+    try:
+        route_uncached = rate(lambda: client.get('/api/admin/runtime-stats', headers=headers), requests)
+    finally:
+        app_supabase.decode_token = original
+    route_cached = rate(lambda: client.get('/api/admin/runtime-stats', headers=headers), requests)
+
+    print(f"@admin_required route, uncached:   {route_uncached:>12,.0f} req/s")
+    print(f"@admin_required route, cached:     {route_cached:>12,.0f} req/s  ({route_cached / route_uncached:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: test-mode appointment lookups, plain list scans vs. AppointmentStore
+
+Fills both with the same synthetic appointments (default 100k over 2,000
+patients) and times the operations app_no_firebase.py performs per
+request: fetching one appointment, confirming a payment, and listing a
+patient's paid appointments newest first. "list" is the previous
+implementation (linear scans plus a sort); "store" is utils.memory_store;
+"shared" is utils.shared_store (TEST_STORE=shared) on a temporary log
+file, where each write is an flock + pwrite and each read a catch-up check.
+
+Run from the repository root:
+    python benchmarks/bench_memory_store.py
+    python benchmarks/bench_memory_store.py --records 250000 --patients 5000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.memory_store import AppointmentStore  # noqa: E402
+from utils.shared_store import SharedAppointmentStore, SharedLog  # noqa: E402
+
+BASE_TIME = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def make_appointment(i, patients):
+    return {
+        'appointment_id': f'APT{i:08d}',
+        'patient_email': f'patient{i % patients}@gmail.com',
+        'department': 'General Medicine',
+        'date': '2024-06-10',
+        'time': '10:00',
+        'payment_status': 'completed' if i % 3 else 'pending',
+        'invoice_no': f'INV-2024-{i + 1:06d}',
+        'created_at': (BASE_TIME + timedelta(seconds=i)).isoformat()
+    }
+
+
+# The previous list-based implementation, as the handlers did it
+def list_get(storage, appointment_id):
+    for apt in storage:
+        if apt['appointment_id'] == appointment_id:
+            return apt
+
+
+def list_verify(storage, appointment_id):
+    for apt in storage:
+        if apt['appointment_id'] == appointment_id:
+            apt['payment_status'] = 'completed'
+            return apt
+
+
+def list_my_appointments(storage, email):
+    rows = [apt for apt in storage if apt['patient_email'] == email and apt.get('payment_status') == 'completed']
+    rows.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+    return rows
+
+
+def timed(fn, args_list):
+    started = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - started) / len(args_list) * 1e6
+
+
+def run(records, patients, lookups):
+    rng = random.Random(42)
+    rows = [make_appointment(i, patients) for i in range(records)]
+    storage = [dict(row) for row in rows]
+    store = AppointmentStore()
+    shared = SharedAppointmentStore(SharedLog(os.path.join(tempfile.mkdtemp(), 'bench.log')))
+
+    fill_seconds = {}
+    for name, target in (('store', store), ('shared', shared)):
+        started = time.perf_counter()
+        for row in rows:
+            target.add(row)
+        fill_seconds[name] = round(time.perf_counter() - started, 2)
+
+    ids = [f'APT{rng.randrange(records):08d}' for _ in range(lookups)]
+    emails = [f'patient{rng.randrange(patients)}@gmail.com' for _ in range(lookups)]
+
+    results = []
+    for operation, list_fn, method, args in (
+            ('get', list_get, lambda s, apt_id: s.get(apt_id), ids),
+            ('verify_payment', list_verify,
+             lambda s, apt_id: s.update(apt_id, {'payment_status': 'completed'}), ids),
+            ('my_appointments', list_my_appointments,
+             lambda s, email: s.for_patient(email, payment_status='completed'), emails)):
+        list_us = timed(list_fn, [(storage, a) for a in args])
+        store_us = timed(method, [(store, a) for a in args])
+        shared_us = timed(method, [(shared, a) for a in args])
+        results.append({
+            'operation': operation,
+            'list_us': round(list_us, 1),
+            'store_us': round(store_us, 1),
+            'shared_us': round(shared_us, 1),
+            'speedup': round(list_us / store_us, 1)
+        })
+    return {'records': records, 'patients': patients, 'fill_seconds': fill_seconds, 'operations': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    result = run(args.records, args.patients, args.lookups)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{result['records']:,} appointments over {result['patients']:,} patients "
+          f"(filled in {result['fill_seconds']['store']} s in memory, {result['fill_seconds']['shared']} s shared)")
+    print(f"{'operation':<18}{'list us':>12}{'store us':>12}{'shared us':>12}{'list/store':>12}")
+    for r in result['operations']:
+        print(f"{r['operation']:<18}{r['list_us']:>12}{r['store_us']:>12}{r['shared_us']:>12}{r['speedup']:>11}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Benchmark: gunicorn sync workers vs. gthread workers against a slow PostgREST
+
+Starts the latency-injected PostgREST stand-in (postgrest_standin.py) and,
+for each serving mode, a gunicorn running app_supabase with
+gunicorn.conf.py. Client threads then hammer
+GET /api/appointments/my-appointments, which costs one PostgREST round
+trip per request, for a fixed duration. The report gives throughput and
+latency percentiles per mode.
+
+Run from the repository root:
+    python benchmarks/bench_serving_modes.py
+    python benchmarks/bench_serving_modes.py --latency-ms 50 --concurrency 128 --threads 64
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import jwt
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET_KEY = 'test-secret-key'  # app.config['SECRET_KEY'] in app_supabase
+ENDPOINT = '/api/appointments/my-appointments'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def run_load(url, headers, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        mine = []
+        failed = 0
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = session.get(url, headers=headers, timeout=30)
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            if ok:
+                mine.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def bench_mode(name, worker_class, threads, args, postgrest_url, headers):
+    port = free_port()
+    env = dict(os.environ,
+               PORT=str(port),
+               SUPABASE_URL=postgrest_url,
+               SUPABASE_KEY='benchmark',
+               WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_WORKER_CLASS=worker_class,
+               GUNICORN_THREADS=str(threads))
+    env.pop('SUPABASE_POOL_SIZE', None)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app_supabase:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        wait_until_up(f'{base}/api/health')
+        run_load(base + ENDPOINT, headers, args.concurrency, min(args.duration, 1.0))  # warm-up
+        result = run_load(base + ENDPOINT, headers, args.concurrency, args.duration)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    result.update({'mode': name, 'workers': args.workers, 'threads': threads})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=32, help='handler threads per gthread worker')
+    parser.add_argument('--concurrency', type=int, default=64, help='concurrent client connections')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of load per mode')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='stand-in PostgREST latency')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    standin_port = free_port()
+    standin = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'postgrest_standin.py'),
+         '--port', str(standin_port), '--latency-ms', str(args.latency_ms)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    postgrest_url = f'http://127.0.0.1:{standin_port}'
+    try:
+        wait_until_up(f'{postgrest_url}/rest/v1/appointments')
+        token = jwt.encode({'email': 'patient@gmail.com', 'role': 'patient'}, SECRET_KEY, algorithm='HS256')
+        headers = {'Authorization': f'Bearer {token}'}
+        results = [
+            bench_mode('sync', 'sync', 1, args, postgrest_url, headers),
+            bench_mode('gthread', 'gthread', args.threads, args, postgrest_url, headers),
+        ]
+    finally:
+        standin.terminate()
+        standin.wait(timeout=10)
+
+    if args.json:
+        print(json.dumps({'latency_ms': args.latency_ms, 'concurrency': args.concurrency,
+                          'results': results}, indent=2))
+        return
+
+    print(f"GET {ENDPOINT}, PostgREST latency {args.latency_ms}ms, {args.concurrency} clients")
+    print(f"{'mode':<9}{'workers':>8}{'threads':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for r in results:
+        print(f"{r['mode']:<9}{r['workers']:>8}{r['threads']:>8}{r['requests_per_second']:>10}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['errors']:>8}")
+    sync, threaded = results
+    if sync['requests_per_second']:
+        print(f"gthread / sync throughput: {threaded['requests_per_second'] / sync['requests_per_second']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
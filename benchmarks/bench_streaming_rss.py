@@ -0,0 +1,152 @@
+"""
+Benchmark: peak RSS of buffered vs. streamed (?stream=1) admin list responses
+
+Each mode runs in a fresh child process so peak RSS is not shared. The
+child patches app_supabase's PostgREST helpers with a synthetic fixture
+(default 100k appointments), requests the endpoint through the Flask test
+client and reads the body chunk by chunk. Every fixture response goes
+through the same JSON encode/decode a real PostgREST response would, but
+the full table is never held by the fixture itself. The child reports its
+peak RSS above the post-import baseline.
+
+Run from the repository root:
+    python benchmarks/bench_streaming_rss.py
+    python benchmarks/bench_streaming_rss.py --rows 100000 --endpoint /api/admin/messages
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SUPABASE_URL', 'http://postgrest.invalid')
+os.environ.setdefault('SUPABASE_KEY', 'benchmark')
+
+BASE_TIME = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def make_row(i):
+    """Synthetic appointment/message, newest first by index"""
+    return {
+        'id': f'{i:010d}',
+        'appointment_id': f'APT{i:07d}',
+        'patient_name': f'Patient {i % 5000}',
+        'patient_email': f'patient{i % 5000}@gmail.com',
+        'patient_phone': '+1234567890',
+        'department': 'General Medicine',
+        'date': f'2024-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}',
+        'time': f'{8 + (i % 12):02d}:{(i % 3) * 20:02d}',
+        'mode': 'In-person',
+        'symptoms': 'Routine check-up with a short free-text description',
+        'status': 'confirmed',
+        'payment_status': 'completed',
+        'consultation_fee': 500,
+        'created_at': (BASE_TIME - timedelta(seconds=i)).isoformat()
+    }
+
+
+def wire(start, stop):
+    """Rows [start, stop) as the client sees them: bytes on the wire, then decoded"""
+    content = ('[' + ','.join(json.dumps(make_row(i)) for i in range(start, stop)) + ']').encode()
+    return json.loads(content)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, rows, endpoint):
+    import jwt
+    import app_supabase
+
+    def fake_select(table, filters=None):
+        return wire(0, rows)
+
+    # Patients are walked in (patient_email, id) order; same key as make_row
+    by_email = sorted(range(rows), key=lambda i: (f'patient{i % 5000}@gmail.com', i)) \
+        if endpoint == '/api/admin/patients' else []
+    email_position = {i: pos for pos, i in enumerate(by_email)}
+
+    def fake_keyset(table, filters=None, order=('created_at', 'id'), descending=True, after=None, limit=50):
+        if order[0] == 'patient_email':
+            start = email_position[int(after[1])] + 1 if after is not None else 0
+            content = json.dumps([make_row(i) for i in by_email[start:start + limit]]).encode()
+            return json.loads(content)
+        start = int(after[1]) + 1 if after is not None else 0
+        return wire(start, min(start + limit, rows))
+
+    app_supabase.supabase_select = fake_select
+    app_supabase.supabase_select_keyset = fake_keyset
+    app_supabase.supabase_select_iter = lambda table, filters=None, **kwargs: (
+        row for start in range(0, rows, 1000) for row in wire(start, min(start + 1000, rows)))
+
+    client = app_supabase.app.test_client()
+    token = jwt.encode({'email': 'admin@123', 'role': 'admin'}, app_supabase.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    path = endpoint + ('?stream=1' if mode == 'streamed' else '')
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    response = client.get(path, headers=headers, buffered=False)
+    size = 0
+    for chunk in response.iter_encoded():
+        size += len(chunk)
+    response.close()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'mode': mode,
+        'endpoint': endpoint,
+        'rows': rows,
+        'status': response.status_code,
+        'body_mb': round(size / 2 ** 20, 1),
+        'baseline_rss_mb': round(baseline, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_over_baseline_mb': round(peak_rss_mb() - baseline, 1),
+        'seconds': round(elapsed, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--endpoint', default='/api/appointments/all',
+                        choices=['/api/appointments/all', '/api/admin/messages', '/api/admin/patients'])
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--child', choices=['buffered', 'streamed'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Keep the app's logging out of the child's JSON output
+        with contextlib.redirect_stdout(sys.stderr):
+            result = child(args.child, args.rows, args.endpoint)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for mode in ('buffered', 'streamed'):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', mode,
+             '--rows', str(args.rows), '--endpoint', args.endpoint],
+            check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"GET {args.endpoint}, {args.rows:,} rows")
+    print(f"{'mode':<10}{'body MB':>9}{'peak RSS MB':>13}{'over baseline':>15}{'seconds':>9}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['body_mb']:>9}{r['peak_rss_mb']:>13}{r['peak_over_baseline_mb']:>15}{r['seconds']:>9}")
+
+
+if __name__ == '__main__':
+    main()
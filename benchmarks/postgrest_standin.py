@@ -0,0 +1,199 @@
+"""
+Local PostgREST stand-in with injected latency and round-trip accounting.
+
+Implements the part of PostgREST that app_supabase.py uses, on top of
+utils.sqlite_backend (same tables, same query-string parser, same RPCs):
+
+- GET /rest/v1/<table>?<filters>: eq./neq./gt./gte./lt./lte./in./is.,
+  not., or=/and= trees, select=, order=, limit=, offset=
+- HEAD with Prefer: count=exact: Content-Range */<count>
+- POST: insert one row or an array; the rows come back unless the request
+  says Prefer: return=minimal
+- PATCH ?<column>=eq.<value>[&<filters>]: the updated rows come back with
+  Prefer: return=representation, otherwise 204
+- POST /rest/v1/rpc/<function>: the functions from SUPABASE_FUNCTIONS.sql
+
+Every request is delayed by --latency-ms (plus up to --jitter-ms), which
+stands in for the network round trip and query time of the hosted
+database. Requests are counted per X-Request-Id (utils.http_pool sends the
+id of the app request that made them); GET /_standin/round-trips?request_id=<id>
+returns the count, so tests and benchmarks can hold endpoints to a
+round-trip budget.
+
+Run standalone:
+    python benchmarks/postgrest_standin.py --port 54321 --latency-ms 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.http_pool import CORRELATION_HEADER  # noqa: E402
+from utils.sqlite_backend import SQLiteBackend  # noqa: E402
+
+
+class StandIn:
+    """Tables, latency settings and round-trip counters shared by all handler threads"""
+
+    def __init__(self, latency=0.0, jitter=0.0, path=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.backend = SQLiteBackend(path or os.path.join(tempfile.mkdtemp(prefix='postgrest-standin-'), 'standin.db'))
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.round_trips = {}
+
+    def delay(self, request_id=None):
+        with self.lock:
+            self.requests += 1
+            if request_id:
+                self.round_trips[request_id] = self.round_trips.get(request_id, 0) + 1
+        wait = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if wait > 0:
+            time.sleep(wait)
+
+    def round_trips_for(self, request_id):
+        """PostgREST requests made on behalf of one app request"""
+        with self.lock:
+            return self.round_trips.get(request_id, 0)
+
+    def seed(self, table, rows):
+        """Insert rows directly, without latency or accounting"""
+        return self.backend.insert_many(table, list(rows), returning=True)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def make_handler(standin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _route(self):
+            parts = urlsplit(self.path)
+            if not parts.path.startswith('/rest/v1/'):
+                return None, parts.query
+            return parts.path[len('/rest/v1/'):], parts.query
+
+        def _send(self, status, body=None, headers=None):
+            payload = b'' if body is None else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(payload)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'null')
+
+        def _prefers(self, option):
+            return option in (self.headers.get('Prefer') or '')
+
+        def _start(self):
+            """Count and delay the request; returns (table, query) for /rest/v1/ paths"""
+            table, query = self._route()
+            if table is not None:
+                standin.delay(self.headers.get(CORRELATION_HEADER))
+            return table, query
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            if parts.path == '/_standin/round-trips':
+                request_id = parse_qs(parts.query).get('request_id', [''])[0]
+                return self._send(200, {'request_id': request_id,
+                                        'round_trips': standin.round_trips_for(request_id)})
+            table, query = self._start()
+            if table is None:
+                return self._send(404, {'message': 'not found'})
+            self._send(200, standin.backend.select(table, query))
+
+        def do_HEAD(self):
+            table, query = self._start()
+            count = standin.backend.count(table, query) if table else None
+            if count is None:
+                return self._send(400)
+            self._send(200, headers={'Content-Range': f'*/{count}'})
+
+        def do_POST(self):
+            table, _ = self._start()
+            body = self._body()
+            if table is None:
+                return self._send(404, {'message': 'not found'})
+            if table.startswith('rpc/'):
+                result = standin.backend.rpc(table[len('rpc/'):], body)
+                if result is None:
+                    return self._send(404, {'message': f'function {table[len("rpc/"):]} failed'})
+                return self._send(200, None if result is True else result)
+            if isinstance(body, list):
+                rows = standin.backend.insert_many(table, body, returning=True)
+            else:
+                rows = standin.backend.insert(table, body)
+            if rows is None:
+                return self._send(400, {'message': f'insert into {table} failed'})
+            if self._prefers('return=minimal'):
+                return self._send(201)
+            self._send(201, rows)
+
+        def do_PATCH(self):
+            table, query = self._start()
+            body = self._body()
+            first, _, rest = query.partition('&')
+            column, _, value = first.partition('=')
+            if table is None or not value.startswith('eq.'):
+                return self._send(400, {'message': 'PATCH needs <column>=eq.<value> first'})
+            rows = standin.backend.update(table, body, column, value[len('eq.'):], rest or None)
+            if rows is None:
+                return self._send(400, {'message': f'update of {table} failed'})
+            if self._prefers('return=representation'):
+                return self._send(200, rows)
+            self._send(204)
+
+    return Handler
+
+
+def serve(standin, host='127.0.0.1', port=0):
+    """Start the stand-in on a background thread; returns (server, base_url)"""
+    server = _Server((host, port), make_handler(standin))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--db', help='SQLite file for the tables (default: a new temporary file)')
+    args = parser.parse_args()
+
+    standin = StandIn(args.latency_ms / 1000, args.jitter_ms / 1000, args.db)
+    server, url = serve(standin, args.host, args.port)
+    print(f"PostgREST stand-in on {url} (latency {args.latency_ms}ms, jitter {args.jitter_ms}ms)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
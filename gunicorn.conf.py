@@ -0,0 +1,40 @@
+"""
+Gunicorn settings for app_supabase (used by render.yaml):
+    gunicorn -c gunicorn.conf.py app_supabase:app
+
+Handlers spend most of their time waiting on PostgREST, so by default each
+worker runs a gthread pool and keeps GUNICORN_THREADS requests in flight
+instead of one. Set GUNICORN_WORKER_CLASS=sync (or GUNICORN_THREADS=1) to
+get the old one-request-per-worker behaviour back.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '32')) if worker_class == 'gthread' else 1
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# One pooled PostgREST connection per handler thread plus the app's 4-thread
+# fan-out executor, unless set explicitly. Workers import the app after this
+# file runs, so utils.http_pool picks it up.
+os.environ.setdefault('SUPABASE_POOL_SIZE', str(threads + 4))
+
+
+def pre_fork(server, worker):
+    # Runs in the master: give the new worker the lowest worker slot (0-31)
+    # no live worker holds, so replacements reuse the slot they free up
+    taken = {getattr(w, 'id_worker_slot', None) for w in server.WORKERS.values()}
+    free = [slot for slot in range(32) if slot not in taken]
+    if not free:
+        raise RuntimeError('utils/ids.py has worker bits for at most 32 workers per instance')
+    worker.id_worker_slot = free[0]
+
+
+def post_fork(server, worker):
+    # Distinct worker bits for the time-ordered IDs in utils/ids.py; give each
+    # instance its own ID_INSTANCE (0-31) when running more than one
+    instance = int(os.getenv('ID_INSTANCE', '0'))
+    os.environ['ID_WORKER_ID'] = str((instance * 32 + worker.id_worker_slot) % 1024)
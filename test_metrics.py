@@ -0,0 +1,44 @@
+"""
+Per-route metrics (utils/metrics.py): counts survive the threads that
+recorded them, and threads that have exited do not leave shards behind.
+"""
+
+import threading
+
+from utils.metrics import ROUTE_KEY, RouteMetrics
+
+
+def _app(environ, start_response):
+    environ[ROUTE_KEY] = '/api/health'
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [b'{"status": "ok"}']
+
+
+def _request(wsgi_app):
+    body = wsgi_app({'REQUEST_METHOD': 'GET'}, lambda status, headers, exc_info=None: None)
+    for _ in body:
+        pass
+    body.close()
+
+
+def test_short_lived_threads_do_not_accumulate_shards():
+    metrics = RouteMetrics()
+    wsgi_app = metrics.middleware(_app)
+
+    # One thread per request, like the dev server's threaded mode
+    for _ in range(300):
+        thread = threading.Thread(target=_request, args=(wsgi_app,))
+        thread.start()
+        thread.join()
+    assert len(metrics._shards) < 64
+
+    routes, _ = metrics.snapshot()
+    assert routes[('GET', '/api/health')].count == 300
+    assert routes[('GET', '/api/health')].bytes_out == 300 * len(b'{"status": "ok"}')
+    assert len(metrics._shards) == 0
+
+    # Retired counts stay in the total after later requests
+    _request(wsgi_app)
+    routes, _ = metrics.snapshot()
+    assert routes[('GET', '/api/health')].count == 301
+    assert 'http_requests_total{pid=' in metrics.render()
@@ -0,0 +1,158 @@
+"""
+PostgREST round-trip budgets for app_supabase endpoints.
+
+Runs the app in-process against the local PostgREST stand-in
+(benchmarks/postgrest_standin.py) and counts the database requests each
+app request makes, by the X-Request-Id header utils.http_pool forwards.
+A failure here means an endpoint started making more round trips than
+it is allowed to.
+"""
+
+import os
+import sys
+import uuid
+
+import jwt
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+os.environ.setdefault('SUPABASE_URL', 'http://postgrest.invalid')
+os.environ.setdefault('SUPABASE_KEY', 'test')
+
+import app_supabase  # noqa: E402
+from postgrest_standin import StandIn, serve  # noqa: E402
+
+PATIENT = 'roundtrip.patient@gmail.com'
+
+
+def _token(email, role):
+    return jwt.encode({'email': email, 'role': role}, app_supabase.app.config['SECRET_KEY'], algorithm='HS256')
+
+
+@pytest.fixture(scope='module')
+def standin():
+    if app_supabase.DATA_BACKEND != 'postgrest':
+        pytest.skip('round trips are only made with DATA_BACKEND=postgrest')
+    standin = StandIn()
+    server, url = serve(standin)
+    original_url = app_supabase.SUPABASE_URL
+    app_supabase.SUPABASE_URL = url
+    standin.seed('users', [{'name': 'Patient', 'email': PATIENT, 'password': 'secret',
+                            'role': 'patient', 'is_active': True, 'created_at': '2024-01-01T09:00:00'}])
+    app_supabase.user_cache.invalidate(PATIENT)
+    yield standin
+    # Send what would otherwise be written at exit while the stand-in is still up
+    app_supabase.login_history_queue.close()
+    app_supabase.invoice_numbers.close()
+    app_supabase.SUPABASE_URL = original_url
+    server.shutdown()
+
+
+@pytest.fixture(scope='module')
+def call(standin):
+    client = app_supabase.app.test_client()
+
+    def call(method, path, token=None, **kwargs):
+        """Returns (response, PostgREST round trips it took)"""
+        request_id = uuid.uuid4().hex
+        headers = {'X-Request-Id': request_id}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        response = client.open(path, method=method, headers=headers, **kwargs)
+        assert response.headers['X-Request-Id'] == request_id
+        return response, standin.round_trips_for(request_id)
+    return call
+
+
+def test_login_takes_at_most_one_round_trip(call):
+    response, round_trips = call('POST', '/api/auth/login', json={'email': PATIENT, 'password': 'secret'})
+    assert response.status_code == 200
+    assert round_trips <= 1
+
+    # The user record is cached and login history is written behind the response
+    response, round_trips = call('POST', '/api/auth/login', json={'email': PATIENT, 'password': 'secret'})
+    assert response.status_code == 200
+    assert round_trips == 0
+
+
+@pytest.mark.parametrize('path, role, budget', [
+    ('/api/reviews', None, 1),
+    ('/api/auth/profile', 'patient', 1),
+    ('/api/appointments/my-appointments', 'patient', 1),
+    ('/api/appointments/all', 'admin', 1),
+    ('/api/appointments/availability?date=2030-01-07', 'patient', 1),
+    # Four counts fanned out in parallel plus one aggregate RPC
+    ('/api/reports/dashboard', 'admin', 5),
+])
+def test_read_endpoint_budgets(call, path, role, budget):
+    token = _token('admin@123' if role == 'admin' else PATIENT, role) if role else None
+    response, round_trips = call('GET', path, token)
+    assert response.status_code == 200
+    assert round_trips <= budget
+
+
+def test_booking_and_payment_budgets(call):
+    token = _token(PATIENT, 'patient')
+    booking = {'department': 'Cardiology', 'date': '2030-02-04', 'time': '10:00', 'mode': 'offline'}
+
+    # The first booking on a date loads that date's slots; later ones only
+    # check the minutes around their own time
+    response, round_trips = call('POST', '/api/appointments/book', token, json=booking)
+    assert response.status_code == 201
+    assert round_trips <= 2
+    response, round_trips = call('POST', '/api/appointments/book', token, json={**booking, 'time': '11:00'})
+    assert response.status_code == 201
+    assert round_trips <= 2
+
+    appointment_id = response.get_json()['appointment']['appointment_id']
+    response, round_trips = call('POST', '/api/appointments/verify-payment', token,
+                                 json={'appointment_id': appointment_id, 'payment_id': 'pay_test', 'order_id': 'order_test'})
+    assert response.status_code == 200
+    # An update, plus one RPC whenever a new block of invoice numbers is reserved
+    assert round_trips <= 2
+
+
+def _other_worker_booking(standin, appointment_id, booking_date, booking_time):
+    """A booking this worker's slot index has not seen"""
+    standin.seed('appointments', [{'appointment_id': appointment_id, 'patient_name': 'Other', 'patient_email': 'other@gmail.com',
+                                   'date': booking_date, 'time': booking_time, 'status': 'pending'}])
+
+
+def test_booking_sees_other_workers_on_a_cached_date(standin, call):
+    token = _token(PATIENT, 'patient')
+    booking = {'department': 'Cardiology', 'date': '2030-03-04', 'time': '09:00', 'mode': 'offline'}
+    response, _ = call('POST', '/api/appointments/book', token, json=booking)
+    assert response.status_code == 201
+
+    _other_worker_booking(standin, 'APTOTHER1', '2030-03-04', '10:00')
+    response, _ = call('POST', '/api/appointments/book', token, json={**booking, 'time': '10:00'})
+    assert response.status_code == 400
+    response, _ = call('POST', '/api/appointments/book', token, json={**booking, 'time': '10:10'})
+    assert response.status_code == 400
+    response, _ = call('POST', '/api/appointments/book', token, json={**booking, 'time': '10:20'})
+    assert response.status_code == 201
+
+    _other_worker_booking(standin, 'APTOTHER2', '2030-03-04', '12:00')
+    response, round_trips = call('POST', '/api/appointments/book-batch', _token('admin@123', 'admin'), json={'appointments': [
+        {'patient_name': 'A', 'patient_email': 'a@gmail.com', 'patient_phone': '1', 'department': 'Cardiology',
+         'date': '2030-03-04', 'time': '12:00', 'mode': 'offline'},
+        {'patient_name': 'B', 'patient_email': 'b@gmail.com', 'patient_phone': '2', 'department': 'Cardiology',
+         'date': '2030-03-04', 'time': '13:00', 'mode': 'offline'}]})
+    assert [r['status'] for r in response.get_json()['results']] == ['rejected', 'booked']
+    # One query for the batch's dates and one insert, however many items
+    assert round_trips <= 2
+
+
+def test_browsed_dates_do_not_skip_the_booking_check(standin, call):
+    token = _token(PATIENT, 'patient')
+    # Viewing availability caches the whole week in the slot index
+    response, _ = call('GET', '/api/appointments/availability?date=2031-03-03', token)
+    assert response.status_code == 200
+    assert '10:00' in response.get_json()['availability'][1]['free_slots']
+
+    _other_worker_booking(standin, 'APTOTHER3', '2031-03-04', '10:00')
+    response, _ = call('POST', '/api/appointments/book', token,
+                       json={'department': 'Cardiology', 'date': '2031-03-04', 'time': '10:00', 'mode': 'offline'})
+    assert response.status_code == 400
+    assert len(standin.backend.select('appointments', 'date=eq.2031-03-04&time=eq.10:00')) == 1
@@ -0,0 +1,111 @@
+"""
+PostgREST filter translation in utils.sqlite_backend.
+
+parse_query() backs both DATA_BACKEND=sqlite and the PostgREST stand-in
+the round-trip tests run against, so a mistake in it returns the wrong
+rows in both places without any error. These tests run the filters the
+app sends against a small appointments table and check which rows come
+back.
+"""
+
+import pytest
+
+from utils.sqlite_backend import QueryError, SQLiteBackend, parse_query
+
+ROWS = [
+    ('APT1', '2030-01-07', '09:00', None),
+    ('APT2', '2030-01-07', '09:20', 'pending'),
+    ('APT3', '2030-01-07', '10:00', 'cancelled'),
+    ('APT4', '2030-01-08', '09:00', 'confirmed'),
+    ('APT5', '2030-01-09', '11:00', 'completed'),
+]
+
+
+@pytest.fixture(scope='module')
+def backend(tmp_path_factory):
+    backend = SQLiteBackend(str(tmp_path_factory.mktemp('sqlite-query') / 'query.db'))
+    backend.insert_many('appointments', [
+        {'appointment_id': appointment_id, 'patient_name': 'Patient', 'patient_email': f'{appointment_id.lower()}@gmail.com',
+         'date': booking_date, 'time': booking_time, 'status': status}
+        for appointment_id, booking_date, booking_time, status in ROWS])
+    return backend
+
+
+def ids(backend, query):
+    return sorted(row['appointment_id'] for row in backend._query('appointments', query))
+
+
+def test_simple_comparisons(backend):
+    assert ids(backend, 'date=eq.2030-01-07') == ['APT1', 'APT2', 'APT3']
+    assert ids(backend, 'date=gt.2030-01-07&date=lte.2030-01-09') == ['APT4', 'APT5']
+    assert ids(backend, 'date=eq.2030-01-07&time=gte.09:01&time=lt.10:00') == ['APT2']
+
+
+def test_neq_drops_nulls_like_postgrest(backend):
+    assert ids(backend, 'status=neq.cancelled') == ['APT2', 'APT4', 'APT5']
+
+
+def test_is_null_and_not_is_null(backend):
+    assert ids(backend, 'status=is.null') == ['APT1']
+    assert ids(backend, 'status=not.is.null') == ['APT2', 'APT3', 'APT4', 'APT5']
+
+
+def test_in_and_not_in(backend):
+    assert ids(backend, 'date=in.(2030-01-08,2030-01-09)') == ['APT4', 'APT5']
+    assert ids(backend, 'status=not.in.(cancelled,completed)') == ['APT2', 'APT4']
+    # Quoted list items may contain commas and parentheses
+    assert ids(backend, 'appointment_id=in.("APT1","APT,(9)")') == ['APT1']
+
+
+def test_or_keeps_null_status(backend):
+    assert ids(backend, 'or=(status.is.null,status.neq.cancelled)') == ['APT1', 'APT2', 'APT4', 'APT5']
+
+
+def test_nested_or_and(backend):
+    query = 'or=(and(date.eq.2030-01-07,time.gte.09:20),and(date.gt.2030-01-07,status.eq.completed))'
+    assert ids(backend, query) == ['APT2', 'APT3', 'APT5']
+
+    # The keyset condition supabase_select_keyset sends: (date, id) > ('2030-01-07', 'APT2')
+    query = 'and=(or(date.gt."2030-01-07",and(date.eq."2030-01-07",appointment_id.gt."APT2")))'
+    assert ids(backend, query) == ['APT3', 'APT4', 'APT5']
+
+
+def test_negated_trees(backend):
+    assert ids(backend, 'not.or=(date.eq.2030-01-07,status.eq.completed)') == ['APT4']
+    assert ids(backend, 'and=(date.eq.2030-01-07,not.or(status.is.null,time.eq.10:00))') == ['APT2']
+
+
+def test_filters_are_bound_parameters(backend):
+    parsed = parse_query("patient_email=eq.x'); DROP TABLE appointments; --", 'appointments',
+                         backend._table_columns('appointments'))
+    assert parsed['where'] == ['"patient_email" = ?']
+    assert parsed['params'] == ["x'); DROP TABLE appointments; --"]
+    assert ids(backend, 'date=eq.2030-01-08') == ['APT4']
+
+
+@pytest.mark.parametrize('query', [
+    'nonexistent=eq.1',
+    'date"=eq.1',
+    'or=(date.eq.2030-01-07,"status".eq.x)',
+    'and=(or(secret.is.null))',
+    'select=appointment_id,password',
+    'order=created_at.desc,nope.asc',
+])
+def test_unknown_columns_are_rejected(backend, query):
+    with pytest.raises(QueryError):
+        parse_query(query, 'appointments', backend._table_columns('appointments'))
+    # select() reports the error and returns no rows instead of guessing
+    assert backend.select('appointments', query) == []
+
+
+@pytest.mark.parametrize('query', [
+    'date=like.2030*',
+    'status=is.maybe',
+    'date=in.2030-01-07',
+    'or=()',
+    'limit=ten',
+    'order=date.sideways',
+])
+def test_unsupported_syntax_is_rejected(backend, query):
+    with pytest.raises(QueryError):
+        parse_query(query, 'appointments', backend._table_columns('appointments'))
@@ -0,0 +1,59 @@
+"""
+Fork-safe periodic background tasks.
+
+Threads do not survive fork, so tasks are started lazily from inside the
+worker that needs them (ensure_started) and restarted if the process id
+changes. Failures are logged and retried on the next tick.
+"""
+
+import os
+import threading
+import time
+
+
+class PeriodicTask:
+    """Run fn() every `interval` seconds on a daemon thread in this process"""
+
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._wake = threading.Event()
+        self.runs = 0
+        self.failures = 0
+        self.last_run_at = None
+
+    def ensure_started(self):
+        """Start the thread once per process; cheap to call on every request"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def trigger(self):
+        """Run the task as soon as possible instead of waiting for the next tick"""
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.run_once()
+
+    def run_once(self):
+        try:
+            self.fn()
+            self.runs += 1
+        except Exception as e:
+            self.failures += 1
+            print(f"[ERROR] Background task {self.name} failed: {e}")
+        finally:
+            self.last_run_at = time.time()
@@ -0,0 +1,133 @@
+"""
+Incrementally maintained dashboard counters.
+
+Handlers report each appointment change as (before, after) row pairs and
+the aggregate updates its counters in O(1). A periodic reconcile rebuilds
+the same counters from the database and swaps them in, which corrects any
+drift from other workers or missed updates. Reads are O(1) snapshots.
+"""
+
+import threading
+import time
+from collections import Counter
+
+
+def _month(row):
+    return (row.get('date') or '')[:7]
+
+
+def _fee(row):
+    return float(row.get('consultation_fee') or 0)
+
+
+class _Counters:
+    """The raw counters; mutated only while DashboardAggregate holds its lock"""
+
+    def __init__(self):
+        self.total = 0
+        self.pending = 0
+        self.completed = 0
+        self.patients = Counter()
+        self.completed_by_date = Counter()
+        self.revenue_by_month = Counter()
+        self.refunds_by_month = Counter()
+
+    def apply(self, row, sign):
+        # Mirrors the rules of dashboard_stats: refunds count even when the
+        # appointment is cancelled, everything else only for active rows.
+        if row.get('payment_status') == 'refunded':
+            self.refunds_by_month[_month(row)] += sign * _fee(row)
+
+        if row.get('status') == 'cancelled':
+            return
+
+        self.total += sign
+        if row.get('status') == 'pending':
+            self.pending += sign
+        if row.get('payment_status') == 'completed':
+            self.completed += sign
+            self.completed_by_date[row.get('date')] += sign
+            self.revenue_by_month[_month(row)] += sign * _fee(row)
+
+        email = row.get('patient_email')
+        if email:
+            self.patients[email] += sign
+            if self.patients[email] <= 0:
+                del self.patients[email]
+
+    def diff(self, other):
+        """Size of the correction needed to turn self into other"""
+        counts = (abs(self.total - other.total)
+                  + abs(self.pending - other.pending)
+                  + abs(self.completed - other.completed)
+                  + abs(len(self.patients) - len(other.patients)))
+        amount = 0.0
+        for mine, theirs in ((self.revenue_by_month, other.revenue_by_month),
+                             (self.refunds_by_month, other.refunds_by_month)):
+            for key in set(mine) | set(theirs):
+                amount += abs(mine.get(key, 0) - theirs.get(key, 0))
+        return {'counts': counts, 'amount': round(amount, 2)}
+
+
+class DashboardAggregate:
+    """Per-worker dashboard totals kept current by handlers and a reconciler"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = _Counters()
+        self.ready = False
+        self.generation = 0
+        self.reconciles = 0
+        self.last_reconcile_at = None
+        self.last_reconcile_seconds = None
+        self.last_correction = None
+
+    def apply(self, before, after):
+        """Record an appointment change; before/after is None for insert/delete"""
+        with self._lock:
+            if before:
+                self._counters.apply(before, -1)
+            if after:
+                self._counters.apply(after, 1)
+            self.generation += 1
+
+    def reconcile(self, rows):
+        """Rebuild the counters from an iterable of appointment rows"""
+        started = time.time()
+        fresh = _Counters()
+        for row in rows:
+            fresh.apply(row, 1)
+
+        with self._lock:
+            self.last_correction = self._counters.diff(fresh) if self.ready else None
+            self._counters = fresh
+            self.ready = True
+            self.generation += 1
+            self.reconciles += 1
+            self.last_reconcile_at = time.time()
+            self.last_reconcile_seconds = round(self.last_reconcile_at - started, 4)
+
+    def snapshot(self, today, current_month):
+        """Same shape as the dashboard_stats scan/pushdown helpers"""
+        with self._lock:
+            c = self._counters
+            return {
+                'total_appointments': c.total,
+                'todays_appointments': c.completed_by_date.get(today, 0),
+                'pending_appointments': c.pending,
+                'completed_appointments': c.completed,
+                'revenue_base': c.revenue_by_month.get(current_month, 0.0),
+                'refunded_base': c.refunds_by_month.get(current_month, 0.0),
+                'unique_patients': len(c.patients)
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'generation': self.generation,
+                'reconciles': self.reconciles,
+                'last_reconcile_at': self.last_reconcile_at,
+                'last_reconcile_seconds': self.last_reconcile_seconds,
+                'last_correction': self.last_correction
+            }
@@ -0,0 +1,114 @@
+"""
+Constant-memory CSV and XLSX writers for report exports.
+
+Both take a header row and an iterable of records (lists of cell values)
+and never hold more than one chunk of output. CSV is yielded as it is
+written. XLSX goes through an openpyxl write-only workbook, which spools
+rows to a temporary file, and is then read back in chunks; a zip archive
+cannot be streamed before it is complete.
+
+iter_zip() is the exception for archives of files that already exist:
+each member is written with a trailing data descriptor, so the archive
+can be sent as it is built.
+
+Text cells that a spreadsheet would treat as a formula (=, +, -, @) are
+prefixed with a quote so patient-entered text is never evaluated.
+"""
+
+import csv
+import io
+import os
+import tempfile
+import zipfile
+
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def safe_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(header, records, chunk_bytes=65536):
+    """Yield CSV text in chunks of roughly chunk_bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for record in records:
+        writer.writerow([safe_cell(value) for value in record])
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx(header, records, sheet_title='Export'):
+    """Write records to a temporary .xlsx file and return its path (caller deletes it)"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_title)
+    sheet.append(header)
+    for record in records:
+        sheet.append([safe_cell(value) for value in record])
+
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+
+def iter_file(path, chunk_bytes=65536):
+    """Yield a file's bytes in chunks"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                return
+            yield chunk
+
+
+def remove_quietly(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class _ChunkSink:
+    """Write-only, unseekable target that collects bytes until they are taken"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def iter_zip(members, chunk_bytes=65536):
+    """Yield a ZIP of (arcname, path) members as it is written; members are stored, not deflated"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for arcname, path in members:
+            archive.write(path, arcname)
+            if sink.size >= chunk_bytes:
+                yield sink.take()
+    yield sink.take()
@@ -0,0 +1,51 @@
+"""
+Helpers for conditional GET (ETag / If-None-Match).
+
+body_etag() derives a strong validator from the serialized body, so every
+worker produces the same tag for the same content. VersionedBody memoizes
+the serialized body and its tag for one data version (e.g. a cache
+generation), so polls that find the version unchanged skip both building
+and serializing the response.
+"""
+
+import hashlib
+import threading
+
+_UNSET = object()
+
+
+def body_etag(body):
+    """Strong ETag value (unquoted) for a serialized body"""
+    if isinstance(body, str):
+        body = body.encode()
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class VersionedBody:
+    """Last (etag, body) built, keyed by the data version it was built from"""
+
+    def __init__(self, serialize):
+        self.serialize = serialize
+        self._lock = threading.Lock()
+        self._version = _UNSET
+        self._entry = None
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, version, build):
+        """(etag, body) for `version`; build() returns the payload on a miss"""
+        with self._lock:
+            if self._version == version:
+                self.hits += 1
+                return self._entry
+        body = self.serialize(build())
+        entry = (body_etag(body), body)
+        with self._lock:
+            self._version = version
+            self._entry = entry
+            self.builds += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'builds': self.builds}
@@ -0,0 +1,185 @@
+"""
+Pooled, keep-alive HTTP session used for every PostgREST call.
+
+Each worker process owns one requests.Session with a bounded connection
+pool. The session is rebuilt after fork so gunicorn workers never share
+sockets with the master. Every call gets connect/read timeouts, and
+idempotent reads are retried a bounded number of times with jittered
+exponential backoff.
+
+While correlation_id is set (app_supabase binds it per incoming request),
+every call carries it in an X-Request-Id header, so the database side can
+tie its requests to the app request that caused them.
+"""
+
+import contextvars
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = int(os.getenv('SUPABASE_POOL_SIZE', '10'))
+POOL_TIMEOUT = float(os.getenv('SUPABASE_POOL_TIMEOUT', '5'))
+CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('SUPABASE_READ_TIMEOUT', '10'))
+MAX_RETRIES = int(os.getenv('SUPABASE_MAX_RETRIES', '2'))
+RETRY_BACKOFF = float(os.getenv('SUPABASE_RETRY_BACKOFF', '0.1'))
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+CORRELATION_HEADER = 'X-Request-Id'
+correlation_id = contextvars.ContextVar('correlation_id', default=None)
+
+
+class PoolTimeout(requests.exceptions.ConnectionError):
+    """Raised when no pooled connection frees up within the pool timeout"""
+
+
+class PooledSession:
+    """Thread-safe, fork-aware wrapper around a pooled requests.Session"""
+
+    def __init__(self, pool_size=POOL_SIZE, pool_timeout=POOL_TIMEOUT,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._reset()
+
+    def _reset(self):
+        # Called at construction and in a freshly forked child: the parent's
+        # sockets, locks and counters must not leak into the new worker.
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._session = None
+        self._pid = os.getpid()
+        self._in_flight = 0
+        self._counters = {
+            'requests': 0,
+            'retries': 0,
+            'errors': 0,
+            'peak_in_flight': 0,
+            'saturated_waits': 0,
+            'pool_timeouts': 0,
+        }
+
+    def _get_session(self):
+        if self._pid != os.getpid():
+            self._reset()
+        session = self._session
+        if session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+                session = self._session
+        return session
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size,
+                              pool_block=False, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counters['saturated_waits'] += 1
+            if not self._slots.acquire(timeout=self.pool_timeout):
+                with self._lock:
+                    self._counters['pool_timeouts'] += 1
+                raise PoolTimeout(f'No pooled connection available after {self.pool_timeout}s')
+        with self._lock:
+            self._in_flight += 1
+            self._counters['requests'] += 1
+            if self._in_flight > self._counters['peak_in_flight']:
+                self._counters['peak_in_flight'] = self._in_flight
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """Send a request through the pool, retrying idempotent methods"""
+        method = method.upper()
+        session = self._get_session()
+        request_id = correlation_id.get()
+        if request_id is not None:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), CORRELATION_HEADER: request_id}
+        attempts = 1 + (self.max_retries if method in IDEMPOTENT_METHODS else 0)
+
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 >= attempts
+            self._acquire()
+            try:
+                response = session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    with self._lock:
+                        self._counters['errors'] += 1
+                    raise
+            else:
+                if last_attempt or response.status_code not in RETRY_STATUSES:
+                    return response
+                response.close()
+            finally:
+                self._release()
+
+            with self._lock:
+                self._counters['retries'] += 1
+            # Full jitter keeps retrying workers from hammering PostgREST in lockstep
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def stats(self):
+        """Pool sizing counters for this worker"""
+        opened = 0
+        issued = 0
+        session = self._session
+        if session is not None and self._pid == os.getpid():
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        opened += pool.num_connections
+                        issued += pool.num_requests
+
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = self._in_flight
+
+        reused = max(issued - opened, 0)
+        stats.update({
+            'pid': self._pid,
+            'pool_size': self.pool_size,
+            'connections_opened': opened,
+            'connections_reused': reused,
+            'hit_ratio': round(reused / issued, 4) if issued else 0.0,
+        })
+        return stats
+
+
+http_pool = PooledSession()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=http_pool._reset)
@@ -0,0 +1,218 @@
+"""
+Time-ordered unique IDs and gapless yearly invoice numbers.
+
+IdGenerator hands out Snowflake-style 64-bit IDs: 41 bits of milliseconds
+since 2024-01-01 UTC, 10 bits of worker id and a 12-bit per-millisecond
+sequence. They are rendered as 13 Crockford base32 characters behind a
+prefix (APT..., order_...), so string order is creation order. The
+worker id comes from ID_WORKER_ID (gunicorn.conf.py sets one per worker)
+or is drawn at random per process.
+
+InvoiceNumberAllocator numbers invoices INV-<year>-<6 digits> without gaps.
+Numbers are taken from blocks reserved in one round trip
+(reserve_invoice_block in SUPABASE_FUNCTIONS.sql). Unused numbers from a
+block are handed back at exit, or when the invoice they were drawn for is
+certainly not saved, and are reused first. A number whose write failed or
+timed out is dropped instead (drop()): it may have been saved after all,
+and reusing it would collide with the unique invoice_no.
+"""
+
+import atexit
+import heapq
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ENCODED_LENGTH = 13
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32, ascending in ASCII
+
+
+def encode(value):
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+class IdGenerator:
+    """Monotonic per-process Snowflake IDs with a fixed prefix"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._worker_id = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    def worker_id(self):
+        if self._worker_id is None:
+            configured = os.getenv('ID_WORKER_ID')
+            if configured is not None:
+                self._worker_id = int(configured) & MAX_WORKER_ID
+            else:
+                self._worker_id = random.SystemRandom().randint(0, MAX_WORKER_ID)
+        return self._worker_id
+
+    def next_int(self):
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            now = int(time.time() * 1000) - EPOCH_MS
+            # Never step backwards when the clock does; borrow from the
+            # next millisecond when the sequence runs out instead of sleeping
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    self._last_ms += 1
+                    self._sequence = 0
+            return (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id() << SEQUENCE_BITS) | self._sequence
+
+    def next(self):
+        return self.prefix + encode(self.next_int())
+
+
+def format_invoice_number(year, number):
+    return f'INV-{year}-{number:06d}'
+
+
+def parse_invoice_number(invoice_no):
+    """'INV-2026-000123' -> (2026, 123), or None"""
+    try:
+        _, year, number = invoice_no.split('-')
+        return int(year), int(number)
+    except (AttributeError, ValueError):
+        return None
+
+
+class InvoiceNumberAllocator:
+    """Gapless per-year invoice numbers handed out from reserved blocks
+
+    reserve_block(year, size) returns the (first, last) numbers of a block
+    or None when the shared counter is unavailable; release_block(year,
+    first, last) gives numbers back. Without a reserve_block the counter is
+    local to the process.
+    """
+
+    def __init__(self, reserve_block=None, release_block=None, block_size=50):
+        self.reserve_block = reserve_block
+        self.release_block = release_block
+        self.block_size = block_size
+        self._atexit_registered = False
+        self._reset()
+
+    def _reset(self):
+        # A forked child must not hand out the parent's numbers again
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._blocks = {}    # year -> [next, last]
+        self._returned = {}  # year -> heap of numbers to reuse first
+        self._local_next = {}
+        self._counters = {'issued': 0, 'reused': 0, 'blocks_reserved': 0, 'given_back': 0, 'dropped': 0, 'fallbacks': 0}
+
+    def _reserve(self, year):
+        if self.reserve_block is None:
+            first = self._local_next.get(year, 1)
+            self._local_next[year] = first + self.block_size
+            return first, first + self.block_size - 1
+        return self.reserve_block(year, self.block_size)
+
+    def next(self, year=None):
+        """Next invoice number for `year` (default: the current year)"""
+        if self._pid != os.getpid():
+            self._reset()
+        year = year or datetime.now().year
+        with self._lock:
+            returned = self._returned.get(year)
+            if returned:
+                self._counters['reused'] += 1
+                self._counters['issued'] += 1
+                return format_invoice_number(year, heapq.heappop(returned))
+
+            block = self._blocks.get(year)
+            if block is None or block[0] > block[1]:
+                reserved = self._reserve(year)
+                if reserved is None:
+                    self._counters['fallbacks'] += 1
+                    return None
+                block = self._blocks[year] = [reserved[0], reserved[1]]
+                self._counters['blocks_reserved'] += 1
+                if not self._atexit_registered:
+                    atexit.register(self.close)
+                    self._atexit_registered = True
+
+            number = block[0]
+            block[0] += 1
+            self._counters['issued'] += 1
+            return format_invoice_number(year, number)
+
+    def give_back(self, invoice_no):
+        """Return a number the database certainly did not store, so it is reused next"""
+        parsed = parse_invoice_number(invoice_no)
+        if parsed is None or self._pid != os.getpid():
+            return
+        year, number = parsed
+        with self._lock:
+            heapq.heappush(self._returned.setdefault(year, []), number)
+            self._counters['given_back'] += 1
+
+    def drop(self, invoice_no):
+        """Give up a number whose write may or may not have been saved, leaving a gap"""
+        if parse_invoice_number(invoice_no) is None:
+            return
+        with self._lock:
+            self._counters['dropped'] += 1
+
+    def close(self):
+        """Hand every unused number back to the shared counter"""
+        if self._pid != os.getpid() or self.release_block is None:
+            return
+        with self._lock:
+            unused = {}
+            for year, (first, last) in self._blocks.items():
+                unused.setdefault(year, []).extend(range(first, last + 1))
+            for year, numbers in self._returned.items():
+                unused.setdefault(year, []).extend(numbers)
+            self._blocks = {}
+            self._returned = {}
+
+        for year, numbers in unused.items():
+            numbers.sort()
+            run_start = previous = None
+            for number in numbers + [None]:
+                if number is not None and previous is not None and number == previous + 1:
+                    previous = number
+                    continue
+                if run_start is not None:
+                    self.release_block(year, run_start, previous)
+                run_start = previous = number
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['unused_in_blocks'] = sum(max(last - first + 1, 0) for first, last in self._blocks.values())
+            stats['returned_pending'] = sum(len(numbers) for numbers in self._returned.values())
+        stats['block_size'] = self.block_size
+        return stats
+
+
+appointment_ids = IdGenerator('APT')
+order_ids = IdGenerator('order_')
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=appointment_ids._reset)
+    os.register_at_fork(after_in_child=order_ids._reset)
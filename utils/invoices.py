@@ -0,0 +1,328 @@
+"""
+Invoice rendering (HTML and PDF) with a content-addressed file cache.
+
+build_invoice() binds an appointment to the fields an invoice shows.
+The HTML template is compiled once at import; PDFs are laid out with
+ReportLab. Rendered files are stored under a key hashed from the
+invoice's fields plus the template/layout version, so a download of an
+unchanged invoice is a file read, and any change to the data (e.g. the
+payment status) or to the template produces a new key and a fresh render.
+
+BulkInvoiceRenderer fans PDF rendering out to a process pool for
+month-end runs and yields each file as soon as it is ready.
+"""
+
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from jinja2 import Environment
+
+HOSPITAL = {
+    'name': 'City General Hospital',
+    'address': '123 Medical Center Drive, City, State 12345',
+    'phone': '+1-234-567-8900',
+    'email': 'info@cityhospital.com'
+}
+
+PAYMENT_LABELS = {'completed': 'PAID', 'refunded': 'REFUNDED'}
+
+TEMPLATE_SOURCE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Invoice - {{ invoice.invoice_no }}</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 40px; }
+        .header { text-align: center; margin-bottom: 30px; }
+        .invoice-details { margin: 20px 0; }
+        table { width: 100%; border-collapse: collapse; margin: 20px 0; }
+        th, td { padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }
+        th { background-color: #2196F3; color: white; }
+        .total { font-size: 18px; font-weight: bold; text-align: right; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>&#127973; {{ hospital.name }}</h1>
+        <p>{{ hospital.address }}</p>
+        <p>Phone: {{ hospital.phone }} | Email: {{ hospital.email }}</p>
+    </div>
+
+    <h2>INVOICE</h2>
+
+    <div class="invoice-details">
+        <p><strong>Invoice No:</strong> {{ invoice.invoice_no }}</p>
+        <p><strong>Date:</strong> {{ invoice.invoice_date }}</p>
+        <p><strong>Patient Name:</strong> {{ invoice.patient_name }}</p>
+        <p><strong>Appointment ID:</strong> {{ invoice.appointment_id }}</p>
+        <p><strong>Appointment:</strong> {{ invoice.department }}, {{ invoice.appointment_date }} {{ invoice.appointment_time }}</p>
+    </div>
+
+    <table>
+        <thead>
+            <tr>
+                <th>Description</th>
+                <th>Amount</th>
+            </tr>
+        </thead>
+        <tbody>
+            {% for item in invoice['items'] %}
+            <tr>
+                <td>{{ item.description }}</td>
+                <td>&#8377;{{ item.amount | money }}</td>
+            </tr>
+            {% endfor %}
+        </tbody>
+    </table>
+
+    <p class="total">Total Amount: &#8377;{{ invoice.total | money }}</p>
+    <p class="total">Payment Status: <span style="color: {{ 'green' if invoice.payment_label == 'PAID' else '#c62828' }};">{{ invoice.payment_label }}</span></p>
+
+    <div style="margin-top: 40px; text-align: center; color: #666;">
+        <p>Thank you for choosing {{ hospital.name }}!</p>
+        <p>For any queries, please contact us at {{ hospital.email }}</p>
+    </div>
+
+    <script>
+        // Auto print on load
+        window.onload = function() { window.print(); }
+    </script>
+</body>
+</html>
+"""
+
+_environment = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+_environment.filters['money'] = lambda value: f'{value:,.2f}'
+INVOICE_TEMPLATE = _environment.from_string(TEMPLATE_SOURCE)
+
+# Bump when render_pdf's layout changes; the template source is hashed directly
+PDF_LAYOUT_VERSION = 1
+RENDER_VERSION = hashlib.sha256(f'{TEMPLATE_SOURCE}|{PDF_LAYOUT_VERSION}'.encode()).hexdigest()[:12]
+
+
+def build_invoice(invoice_no, appointment, tax_rate=0.18):
+    """Fields shown on an appointment's invoice"""
+    fee = round(float(appointment.get('consultation_fee') or 0), 2)
+    tax = round(fee * tax_rate, 2)
+    issued = str(appointment.get('created_at') or '')[:10]
+    try:
+        invoice_date = datetime.strptime(issued, '%Y-%m-%d').strftime('%B %d, %Y')
+    except ValueError:
+        invoice_date = issued
+    payment_status = appointment.get('payment_status') or 'pending'
+    return {
+        'invoice_no': invoice_no,
+        'invoice_date': invoice_date,
+        'patient_name': appointment.get('patient_name') or '',
+        'patient_email': appointment.get('patient_email') or '',
+        'appointment_id': appointment.get('appointment_id') or '',
+        'department': appointment.get('department') or '',
+        'appointment_date': appointment.get('date') or '',
+        'appointment_time': appointment.get('time') or '',
+        'items': [
+            {'description': f"Consultation Fee - {appointment.get('department') or 'General'}", 'amount': fee},
+            {'description': f'Tax ({round(tax_rate * 100)}%)', 'amount': tax}
+        ],
+        'total': round(fee + tax, 2),
+        'payment_status': payment_status,
+        'payment_label': PAYMENT_LABELS.get(payment_status, payment_status.upper())
+    }
+
+
+def invoice_key(invoice):
+    """Content hash of an invoice's fields and the render version"""
+    canonical = json.dumps(invoice, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{RENDER_VERSION}|{canonical}'.encode()).hexdigest()
+
+
+def render_html(invoice):
+    return INVOICE_TEMPLATE.render(invoice=invoice, hospital=HOSPITAL)
+
+
+def render_pdf(invoice, path):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    # Helvetica has no rupee sign; invariant=1 keeps the bytes reproducible
+    doc = SimpleDocTemplate(path, pagesize=A4, title=f"Invoice {invoice['invoice_no']}", invariant=1)
+    money = lambda value: f'Rs. {value:,.2f}'
+
+    rows = [['Description', 'Amount']]
+    rows += [[item['description'], money(item['amount'])] for item in invoice['items']]
+    rows.append(['Total Amount', money(invoice['total'])])
+    table = Table(rows, colWidths=[330, 120])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2196F3')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.5, colors.HexColor('#dddddd')),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('PADDING', (0, 0), (-1, -1), 8),
+    ]))
+
+    details = [
+        ('Invoice No', invoice['invoice_no']),
+        ('Date', invoice['invoice_date']),
+        ('Patient Name', invoice['patient_name']),
+        ('Appointment ID', invoice['appointment_id']),
+        ('Appointment', f"{invoice['department']}, {invoice['appointment_date']} {invoice['appointment_time']}"),
+        ('Payment Status', invoice['payment_label']),
+    ]
+    story = [
+        Paragraph(HOSPITAL['name'], styles['Title']),
+        Paragraph(HOSPITAL['address'], styles['Normal']),
+        Paragraph(f"Phone: {HOSPITAL['phone']} | Email: {HOSPITAL['email']}", styles['Normal']),
+        Spacer(1, 20),
+        Paragraph('INVOICE', styles['Heading2']),
+    ]
+    for label, value in details:
+        story.append(Paragraph(f'<b>{label}:</b> {_escape(value)}', styles['Normal']))
+    story += [Spacer(1, 16), table, Spacer(1, 30),
+              Paragraph(f"Thank you for choosing {HOSPITAL['name']}!", styles['Normal'])]
+    doc.build(story)
+
+
+def _escape(value):
+    return str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+class InvoiceRenderCache:
+    """Rendered invoices on disk, one immutable file per (content key, format)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+
+    def path_for(self, invoice, fmt):
+        key = invoice_key(invoice)
+        return os.path.join(self.directory, key[:2], f'{key}.{fmt}'), key
+
+    def lookup(self, invoice, fmt):
+        """Path of an already rendered invoice, or None"""
+        path, _ = self.path_for(invoice, fmt)
+        if not os.path.exists(path):
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def get(self, invoice, fmt):
+        """(path, key) of the rendered invoice; renders it on the first request"""
+        path, key = self.path_for(invoice, fmt)
+        if os.path.exists(path):
+            with self._lock:
+                self.hits += 1
+            return path, key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(handle)
+        try:
+            if fmt == 'pdf':
+                render_pdf(invoice, tmp_path)
+            else:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(render_html(invoice))
+            # Atomic, so a concurrent reader never sees a half-written file
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self.count_renders(1)
+        return path, key
+
+    def count_renders(self, n):
+        with self._lock:
+            self.renders += n
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'renders': self.renders, 'directory': self.directory}
+
+
+def _render_pdf_job(directory, invoice):
+    # Runs in a pool process; writes straight into the shared cache directory
+    path, _ = InvoiceRenderCache(directory).get(invoice, 'pdf')
+    return invoice, path
+
+
+class BulkInvoiceRenderer:
+    """Renders many invoice PDFs in a process pool, reusing cached files"""
+
+    def __init__(self, cache, workers=None):
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._atexit_registered = False
+
+    def _get_pool(self):
+        # Pools don't survive a fork; each gunicorn worker starts its own on first use.
+        # That happens with handler threads running, so the renderers come from a
+        # forkserver rather than a fork of this process, which could inherit a held lock.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('forkserver'))
+                self._pid = os.getpid()
+                if not self._atexit_registered:
+                    atexit.register(self.close)
+                    self._atexit_registered = True
+            return self._pool
+
+    def iter_pdfs(self, invoices):
+        """Yield (invoice, path) as each PDF becomes available, not in input order"""
+        if self.workers == 1:
+            for invoice in invoices:
+                yield invoice, self.cache.get(invoice, 'pdf')[0]
+            return
+
+        pool = self._get_pool()
+        # Bounded so a month of invoices is never queued (or held) all at once
+        window = self.workers * 4
+        pending = set()
+        try:
+            for invoice in invoices:
+                path = self.cache.lookup(invoice, 'pdf')
+                if path:
+                    yield invoice, path
+                    continue
+                pending.add(pool.submit(_render_pdf_job, self.cache.directory, invoice))
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self._finished(done)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self._finished(done)
+        finally:
+            # Client went away or a render failed: drop what hasn't started
+            for future in pending:
+                future.cancel()
+
+    def _finished(self, futures):
+        self.cache.count_renders(len(futures))
+        for future in futures:
+            yield future.result()
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._pid = None
+
+    def stats(self):
+        return {'workers': self.workers, 'pool_started': self._pid == os.getpid(), **self.cache.stats()}
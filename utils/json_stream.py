@@ -0,0 +1,32 @@
+"""
+Incremental JSON encoding for large list responses.
+
+iter_json_object() writes {"<list_key>": [row, row, ...], <trailer>} one
+row at a time and yields it in chunks of roughly chunk_bytes. Only the
+current chunk is held in memory, never the whole list or its serialized
+form. Trailer keys (counts and the like) are computed after the last row.
+"""
+
+
+def iter_json_object(list_key, rows, dumps, trailer=None, chunk_bytes=65536):
+    """Yield the JSON text of {list_key: [rows...], **trailer()} in chunks"""
+    parts = ['{', dumps(list_key), ':[']
+    size = 0
+    first = True
+    for row in rows:
+        if not first:
+            parts.append(',')
+        first = False
+        text = dumps(row)
+        parts.append(text)
+        size += len(text)
+        if size >= chunk_bytes:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+
+    parts.append(']')
+    for key, value in (trailer() if trailer else {}).items():
+        parts.extend([',', dumps(key), ':', dumps(value)])
+    parts.append('}\n')
+    yield ''.join(parts)
@@ -0,0 +1,125 @@
+"""
+Indexed, thread-safe in-memory stores for the test-mode app.
+
+AppointmentStore keeps appointments in a dict by appointment_id (and
+invoice_no), a per-patient list and a created_at-ordered index, all
+updated together under one lock. Lookups by ID are O(1); a patient's
+appointments and a created_at range are O(log n + k). Callers get
+copies, so a row is never read while another thread is changing it.
+
+ReviewStore keeps the running count and rating sum, so the homepage
+summary does not walk every review.
+"""
+
+import bisect
+import threading
+
+
+class AppointmentStore:
+    """Appointments indexed by appointment_id, invoice_no, patient_email and created_at"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_invoice = {}
+        # email -> [(created_at, appointment_id)] and one global list, both sorted
+        self._by_email = {}
+        self._by_created = []
+
+    def add(self, appointment):
+        """Store a new appointment; returns False if its appointment_id is taken"""
+        apt = dict(appointment)
+        key = (apt.get('created_at') or '', apt['appointment_id'])
+        with self._lock:
+            if apt['appointment_id'] in self._by_id:
+                return False
+            self._by_id[apt['appointment_id']] = apt
+            if apt.get('invoice_no'):
+                self._by_invoice[apt['invoice_no']] = apt
+            bisect.insort(self._by_email.setdefault(apt.get('patient_email'), []), key)
+            bisect.insort(self._by_created, key)
+        return True
+
+    def get(self, appointment_id):
+        with self._lock:
+            apt = self._by_id.get(appointment_id)
+            return dict(apt) if apt is not None else None
+
+    def get_by_invoice(self, invoice_no):
+        with self._lock:
+            apt = self._by_invoice.get(invoice_no)
+            return dict(apt) if apt is not None else None
+
+    def update(self, appointment_id, changes):
+        """Apply changes to one appointment and return the updated copy (None if unknown)
+
+        created_at, appointment_id and patient_email are indexed and cannot change.
+        """
+        with self._lock:
+            apt = self._by_id.get(appointment_id)
+            if apt is None:
+                return None
+            if changes.get('invoice_no') and changes['invoice_no'] != apt.get('invoice_no'):
+                self._by_invoice.pop(apt.get('invoice_no'), None)
+                self._by_invoice[changes['invoice_no']] = apt
+            apt.update(changes)
+            return dict(apt)
+
+    def for_patient(self, email, payment_status=None):
+        """A patient's appointments, newest first"""
+        with self._lock:
+            rows = (self._by_id[apt_id] for _, apt_id in reversed(self._by_email.get(email, ())))
+            return [dict(apt) for apt in rows
+                    if payment_status is None or apt.get('payment_status') == payment_status]
+
+    def created_between(self, start, end):
+        """Appointments with start <= created_at < end, oldest first (ISO strings compare in order)"""
+        with self._lock:
+            lo = bisect.bisect_left(self._by_created, (start,))
+            hi = bisect.bisect_left(self._by_created, (end,))
+            return [dict(self._by_id[apt_id]) for _, apt_id in self._by_created[lo:hi]]
+
+    def newest(self):
+        """Every appointment, newest first"""
+        with self._lock:
+            return [dict(self._by_id[apt_id]) for _, apt_id in reversed(self._by_created)]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_id)
+
+    def stats(self):
+        with self._lock:
+            return {'appointments': len(self._by_id), 'patients': len(self._by_email)}
+
+
+class ReviewStore:
+    """Reviews plus their running count and rating sum"""
+
+    def __init__(self, reviews=(), top_rating=4, top_limit=6):
+        self._lock = threading.Lock()
+        self.top_rating = top_rating
+        self.top_limit = top_limit
+        self._reviews = []
+        self._top = []
+        self._rating_sum = 0
+        for review in reviews:
+            self.add(review)
+
+    def add(self, review):
+        """Store a review, numbering it if it has no id; returns the stored copy"""
+        review = dict(review)
+        with self._lock:
+            review.setdefault('id', str(len(self._reviews) + 1))
+            self._reviews.append(review)
+            self._rating_sum += review['rating']
+            # The homepage shows the first well-rated reviews
+            if review['rating'] >= self.top_rating and len(self._top) < self.top_limit:
+                self._top.append(review)
+            return dict(review)
+
+    def summary(self):
+        """(top reviews, count, average rating)"""
+        with self._lock:
+            count = len(self._reviews)
+            return [dict(r) for r in self._top], count, self._rating_sum / count if count else 0
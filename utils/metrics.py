@@ -0,0 +1,314 @@
+"""
+Per-route request metrics, exported in the Prometheus text format.
+
+RouteMetrics.middleware() wraps the WSGI app and records each request when
+the server closes its body, so streamed responses count their full time
+and size. For every route (the URL rule, which the app stores in
+environ[ROUTE_KEY], so /api/appointments/<appointment_id> is one series)
+it keeps a latency histogram, a count per status
+code, bytes in and out, and how many PostgREST helper calls the requests
+made and how long those took. Helper calls are timed by wrapping the
+supabase_* helpers with instrument(); calls made while a request is being
+served (including ones fanned out to the io executor, which copies the
+request's context) are charged to that request's route.
+
+Everything is pre-aggregated on the hot path without locks: each thread
+updates its own shard, and render() sums the shards when /metrics is
+scraped. A shard whose thread has exited is folded into a retired total
+and dropped, so servers that start a thread per connection do not grow
+the shard list without bound. Numbers are per process; under gunicorn
+each worker reports its own series, labelled with its pid.
+"""
+
+import bisect
+import contextvars
+import os
+import threading
+import time
+from functools import wraps
+
+# Upper bounds in seconds; one more bucket (+Inf) catches the rest
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ROUTE_KEY = 'metrics.route'
+
+_current = contextvars.ContextVar('request_tally', default=None)
+
+
+class _RequestTally:
+    """PostgREST calls and seconds for the request being served"""
+
+    __slots__ = ('lock', 'calls', 'seconds')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.seconds = 0.0
+
+    def add(self, seconds):
+        # Only this request's own fanned-out calls ever contend here
+        with self.lock:
+            self.calls += 1
+            self.seconds += seconds
+
+
+class _RouteStats:
+    __slots__ = ('buckets', 'count', 'seconds', 'statuses', 'backend_calls',
+                 'backend_seconds', 'bytes_in', 'bytes_out')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.statuses = {}
+        self.backend_calls = 0
+        self.backend_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+class _RecordedBody:
+    """WSGI response body that counts bytes sent and records the request on close()"""
+
+    __slots__ = ('metrics', 'body', 'environ', 'started', 'tally', 'token', 'status', 'sent')
+
+    def __init__(self, metrics, body, environ, started, tally, token, status):
+        self.metrics = metrics
+        self.body = body
+        self.environ = environ
+        self.started = started
+        self.tally = tally
+        self.token = token
+        self.status = status
+        self.sent = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            close = getattr(self.body, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            try:
+                _current.reset(self.token)
+            except ValueError:
+                # Closed in a different context than it started in
+                pass
+            environ = self.environ
+            self.metrics.finish_request(
+                environ['REQUEST_METHOD'], environ.get(ROUTE_KEY, 'unmatched'), self.status[0],
+                time.perf_counter() - self.started, self.tally,
+                int(environ.get('CONTENT_LENGTH') or 0), self.sent)
+
+
+class _Shard:
+    """One thread's counters; only that thread writes to it"""
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.routes = {}    # (method, route) -> _RouteStats
+        self.helpers = {}   # helper name -> [calls, seconds]
+
+    def fold(self, other):
+        """Add another shard's counters to this one"""
+        # list() copies under the GIL, so a thread adding a key cannot break the walk
+        for key, stats in list(other.routes.items()):
+            total = self.routes.get(key)
+            if total is None:
+                total = self.routes[key] = _RouteStats()
+            total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+            total.count += stats.count
+            total.seconds += stats.seconds
+            for status, count in list(stats.statuses.items()):
+                total.statuses[status] = total.statuses.get(status, 0) + count
+            total.backend_calls += stats.backend_calls
+            total.backend_seconds += stats.backend_seconds
+            total.bytes_in += stats.bytes_in
+            total.bytes_out += stats.bytes_out
+        for name, (calls, seconds) in list(other.helpers.items()):
+            total = self.helpers.setdefault(name, [0, 0.0])
+            total[0] += calls
+            total[1] += seconds
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RouteMetrics:
+    """Lock-free per-thread counters for every route and PostgREST helper"""
+
+    def __init__(self):
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Called at construction and in a freshly forked child: a worker
+        # starts from zero instead of repeating the master's numbers
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._prune_at = 64
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+                # Also prune between scrapes, whenever the list has doubled
+                if len(self._shards) >= self._prune_at:
+                    self._prune()
+                    self._prune_at = max(64, 2 * len(self._shards))
+        return shard
+
+    def _prune(self):
+        """Fold the shards of exited threads into the retired total; call with the lock held"""
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                self._retired.fold(shard)
+        self._shards = alive
+
+    # -- requests ----------------------------------------------------------
+
+    def middleware(self, wsgi_app):
+        """Wrap a WSGI app so every request it serves is recorded"""
+        def recorded(environ, start_response):
+            started = time.perf_counter()
+            tally = _RequestTally()
+            token = _current.set(tally)
+            status = [0]
+
+            def capture_status(status_line, headers, exc_info=None):
+                status[0] = int(status_line[:3])
+                return start_response(status_line, headers, exc_info)
+
+            try:
+                body = wsgi_app(environ, capture_status)
+            except BaseException:
+                _current.reset(token)
+                raise
+            return _RecordedBody(self, body, environ, started, tally, token, status)
+        return recorded
+
+    def finish_request(self, method, route, status, seconds, tally, bytes_in, bytes_out):
+        """Record one finished request"""
+        shard = self._shard()
+        stats = shard.routes.get((method, route))
+        if stats is None:
+            stats = shard.routes[(method, route)] = _RouteStats()
+        stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        stats.count += 1
+        stats.seconds += seconds
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.backend_calls += tally.calls
+        stats.backend_seconds += tally.seconds
+        stats.bytes_in += bytes_in
+        stats.bytes_out += bytes_out
+
+    # -- PostgREST helpers ---------------------------------------------------
+
+    def instrument(self, name, fn):
+        """Wrap a supabase_* helper so its calls and time are counted
+
+        A helper called from inside another instrumented helper (e.g.
+        supabase_insert handing a list to supabase_insert_many) is not
+        counted twice.
+        """
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            local = self._local
+            if getattr(local, 'in_helper', False):
+                return fn(*args, **kwargs)
+            local.in_helper = True
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                local.in_helper = False
+                self._record_helper(name, elapsed)
+        return timed
+
+    def _record_helper(self, name, seconds):
+        shard = self._shard()
+        totals = shard.helpers.get(name)
+        if totals is None:
+            totals = shard.helpers[name] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+        tally = _current.get()
+        if tally is not None:
+            tally.add(seconds)
+
+    # -- export ----------------------------------------------------------------
+
+    def snapshot(self):
+        """Sum every thread's shard; returns (routes, helpers)"""
+        total = _Shard()
+        with self._lock:
+            self._prune()
+            total.fold(self._retired)
+            shards = list(self._shards)
+        for shard in shards:
+            total.fold(shard)
+        return total.routes, total.helpers
+
+    def render(self):
+        """Prometheus text exposition (format 0.0.4) of every counter"""
+        routes, helpers = self.snapshot()
+        pid = os.getpid()
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def labels(method, route, **extra):
+            pairs = [('pid', pid), ('method', method), ('route', route), *extra.items()]
+            return ','.join(f'{key}="{_label(value)}"' for key, value in pairs)
+
+        ordered = sorted(routes.items())
+
+        family('http_request_duration_seconds', 'histogram', 'Request latency, by route')
+        for (method, route), stats in ordered:
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), stats.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels(method, route, le=bound)}}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels(method, route)}}} {stats.seconds:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels(method, route)}}} {stats.count}')
+
+        family('http_requests_total', 'counter', 'Requests, by route and status code')
+        for (method, route), stats in ordered:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'http_requests_total{{{labels(method, route, status=status)}}} {count}')
+
+        for name, attr, help_text in (
+                ('http_request_bytes_total', 'bytes_in', 'Request body bytes received, by route'),
+                ('http_response_bytes_total', 'bytes_out', 'Response body bytes sent, by route'),
+                ('postgrest_calls_total', 'backend_calls', 'PostgREST helper calls made while serving the route'),
+                ('postgrest_seconds_total', 'backend_seconds', 'Time spent in PostgREST helpers while serving the route')):
+            family(name, 'counter', help_text)
+            for (method, route), stats in ordered:
+                value = getattr(stats, attr)
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{{labels(method, route)}}} {value}')
+
+        family('postgrest_helper_calls_total', 'counter', 'PostgREST helper calls, including background work')
+        for name, (calls, _) in sorted(helpers.items()):
+            lines.append(f'postgrest_helper_calls_total{{pid="{pid}",helper="{_label(name)}"}} {calls}')
+        family('postgrest_helper_seconds_total', 'counter', 'Time spent in each PostgREST helper')
+        for name, (_, seconds) in sorted(helpers.items()):
+            lines.append(f'postgrest_helper_seconds_total{{pid="{pid}",helper="{_label(name)}"}} {seconds:.6f}')
+
+        return '\n'.join(lines) + '\n'
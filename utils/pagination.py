@@ -0,0 +1,38 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor is the sort key of the last row a client has seen, e.g.
+[created_at, id], as URL-safe base64 JSON. Clients pass it back unchanged
+to get the rows that follow; they should not build or parse it.
+"""
+
+import base64
+import binascii
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size, types=(str, int)):
+    """Cursor string -> list of `size` key values; raises InvalidCursor
+
+    Every value must be an instance of `types` (booleans never are), so a
+    well-formed cursor carrying a list, object or null is refused too.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor')
+    if any(isinstance(value, bool) or not isinstance(value, types) for value in values):
+        raise InvalidCursor('Invalid cursor')
+    return values
@@ -0,0 +1,60 @@
+"""
+Running review aggregates and the cached homepage top list.
+
+Keeps (count, rating sum) and the newest top-rated reviews in memory so
+GET /api/reviews is answered without touching the database. add_review
+updates it in place and a periodic refresh replaces it with the
+database's view, which also picks up reviews written by other workers.
+"""
+
+import threading
+import time
+
+
+class ReviewStats:
+    """Per-worker review count, rating sum and top-N newest good reviews"""
+
+    def __init__(self, top_n=6, min_rating=4):
+        self.top_n = top_n
+        self.min_rating = min_rating
+        self._lock = threading.Lock()
+        self._count = 0
+        self._rating_sum = 0
+        self._top = []
+        self.ready = False
+        self.generation = 0
+        self.refreshed_at = None
+
+    def refresh(self, count, rating_sum, top):
+        with self._lock:
+            self._count = int(count)
+            self._rating_sum = int(rating_sum)
+            self._top = list(top)[:self.top_n]
+            self.ready = True
+            self.generation += 1
+            self.refreshed_at = time.time()
+
+    def record(self, review):
+        """Apply a review that was just inserted"""
+        rating = int(review.get('rating') or 0)
+        with self._lock:
+            self._count += 1
+            self._rating_sum += rating
+            if rating >= self.min_rating:
+                self._top = ([review] + self._top)[:self.top_n]
+            self.generation += 1
+
+    def snapshot(self):
+        """(top reviews, count, average rating)"""
+        with self._lock:
+            average = self._rating_sum / self._count if self._count else 0
+            return list(self._top), self._count, average
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'count': self._count,
+                'generation': self.generation,
+                'refreshed_at': self.refreshed_at
+            }
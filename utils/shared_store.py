@@ -0,0 +1,244 @@
+"""
+Cross-process appointment/review store for the test-mode app.
+
+Under several gunicorn workers each process would otherwise keep its own
+AppointmentStore, so a booking made in one worker is unknown to the
+worker that verifies its payment. SharedLog gives every worker the same
+data through one append-only file, with no server:
+
+- The file is a 64-byte header (magic, slot size, committed slot count)
+  followed by fixed-width slots. A record is a length-prefixed JSON
+  document {"t": kind, "d": data} padded to a whole number of slots.
+- Writers take an exclusive flock, catch up, append the record with
+  pwrite and then bump the committed count; the count is written last,
+  so readers never see a partial record.
+- Readers mmap the file and compare the committed count with what they
+  have applied (no lock, no syscall when nothing changed), then replay
+  new records into their local indexed stores. Every read is served from
+  those local indexes.
+
+A record is the full row after a change, so replay is "last write wins".
+The log is never compacted; it is meant for demos and load rehearsals.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+from utils.memory_store import AppointmentStore, ReviewStore
+
+MAGIC = b'HMSLOG01'
+HEADER = struct.Struct('<8sIIQ')   # magic, slot size, reserved, committed slots
+COMMITTED = struct.Struct('<Q')
+COMMITTED_OFFSET = 16
+HEADER_SIZE = 64
+LENGTH = struct.Struct('<I')
+# The file grows in steps so readers rarely have to remap it
+GROW_BYTES = 1 << 20
+
+
+class SharedLog:
+    """Append-only, memory-mapped record log shared by every process that opens `path`"""
+
+    def __init__(self, path, slot_size=256):
+        self.path = path
+        self.slot_size = slot_size
+        self._lock = threading.RLock()
+        self._appliers = {}
+        self._applied = 0
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._counters = {'records': 0, 'appended': 0, 'catch_ups': 0}
+        self._counter_values = {}
+        self.subscribe('ctr', lambda data: self._counter_values.__setitem__(data['name'], data['value']))
+
+    def subscribe(self, kind, apply):
+        """Call apply(data) for every record of `kind`, in log order"""
+        self._appliers[kind] = apply
+
+    def _ensure_open(self):
+        # flock belongs to the open file, which a fork would share: reopen per process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < HEADER_SIZE:
+                    os.pwrite(fd, HEADER.pack(MAGIC, self.slot_size, 0, 0).ljust(HEADER_SIZE, b'\0'), 0)
+                magic, slot_size, _, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            if magic != MAGIC:
+                os.close(fd)
+                raise ValueError(f'{self.path} is not a shared store log')
+            self.slot_size = slot_size
+            self._fd = fd
+            self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            self._pid = os.getpid()
+
+    def _committed(self):
+        return COMMITTED.unpack_from(self._map, COMMITTED_OFFSET)[0]
+
+    def catch_up(self):
+        """Apply records other processes have appended since the last call"""
+        self._ensure_open()
+        if self._committed() == self._applied:
+            return
+        with self._lock:
+            committed = self._committed()
+            end = HEADER_SIZE + committed * self.slot_size
+            if end > len(self._map):
+                self._map = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+            slot = self._applied
+            while slot < committed:
+                offset = HEADER_SIZE + slot * self.slot_size
+                (length,) = LENGTH.unpack_from(self._map, offset)
+                record = json.loads(self._map[offset + LENGTH.size:offset + LENGTH.size + length])
+                apply = self._appliers.get(record['t'])
+                if apply is not None:
+                    apply(record['d'])
+                slot += self._slots_for(length)
+                self._counters['records'] += 1
+            self._applied = committed
+            self._counters['catch_ups'] += 1
+
+    def _slots_for(self, length):
+        return -(-(LENGTH.size + length) // self.slot_size)
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the log's write lock, caught up with every committed record"""
+        self._ensure_open()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self.catch_up()
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def append(self, kind, data):
+        """Append one record and apply it locally; call inside exclusive()"""
+        payload = json.dumps({'t': kind, 'd': data}, separators=(',', ':')).encode()
+        slots = self._slots_for(len(payload))
+        record = (LENGTH.pack(len(payload)) + payload).ljust(slots * self.slot_size, b'\0')
+        offset = HEADER_SIZE + self._applied * self.slot_size
+        if offset + len(record) > os.fstat(self._fd).st_size:
+            os.ftruncate(self._fd, offset + len(record) + GROW_BYTES)
+        os.pwrite(self._fd, record, offset)
+        # Publish only after the record itself is in place
+        os.pwrite(self._fd, COMMITTED.pack(self._applied + slots), COMMITTED_OFFSET)
+        self.catch_up()
+        self._counters['appended'] += 1
+
+    def next_value(self, name, step=1):
+        """Advance a named counter shared by every process; returns the new value"""
+        with self.exclusive():
+            value = self._counter_values.get(name, 0) + step
+            self.append('ctr', {'name': name, 'value': value})
+        return value
+
+    def stats(self):
+        self._ensure_open()
+        with self._lock:
+            return {
+                'path': self.path,
+                'slot_size': self.slot_size,
+                'committed_slots': self._committed(),
+                'bytes': HEADER_SIZE + self._committed() * self.slot_size,
+                **self._counters
+            }
+
+
+class SharedAppointmentStore:
+    """AppointmentStore interface, backed by a SharedLog"""
+
+    def __init__(self, log):
+        self.log = log
+        self._local = AppointmentStore()
+        log.subscribe('apt', self._apply)
+
+    def _apply(self, apt):
+        if not self._local.add(apt):
+            self._local.update(apt['appointment_id'], apt)
+
+    def add(self, appointment):
+        with self.log.exclusive():
+            if self._local.get(appointment['appointment_id']) is not None:
+                return False
+            self.log.append('apt', appointment)
+        return True
+
+    def update(self, appointment_id, changes):
+        with self.log.exclusive():
+            apt = self._local.get(appointment_id)
+            if apt is None:
+                return None
+            apt.update(changes)
+            self.log.append('apt', apt)
+        return apt
+
+    def get(self, appointment_id):
+        self.log.catch_up()
+        return self._local.get(appointment_id)
+
+    def get_by_invoice(self, invoice_no):
+        self.log.catch_up()
+        return self._local.get_by_invoice(invoice_no)
+
+    def for_patient(self, email, payment_status=None):
+        self.log.catch_up()
+        return self._local.for_patient(email, payment_status)
+
+    def created_between(self, start, end):
+        self.log.catch_up()
+        return self._local.created_between(start, end)
+
+    def newest(self):
+        self.log.catch_up()
+        return self._local.newest()
+
+    def __len__(self):
+        self.log.catch_up()
+        return len(self._local)
+
+    def stats(self):
+        self.log.catch_up()
+        return {**self._local.stats(), 'log': self.log.stats()}
+
+
+class SharedReviewStore:
+    """ReviewStore interface, backed by a SharedLog; seed reviews are written once per log"""
+
+    def __init__(self, log, seed=()):
+        self.log = log
+        self._local = ReviewStore()
+        self._seen = False
+        log.subscribe('rev', self._apply)
+        with log.exclusive():
+            if not self._seen:
+                for review in seed:
+                    log.append('rev', review)
+
+    def _apply(self, review):
+        self._seen = True
+        self._local.add(review)
+
+    def add(self, review):
+        with self.log.exclusive():
+            # Numbered here, under the lock, so every process agrees on the id
+            review = {'id': str(self._local.summary()[1] + 1), **review}
+            self.log.append('rev', review)
+        return review
+
+    def summary(self):
+        self.log.catch_up()
+        return self._local.summary()
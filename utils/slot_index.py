@@ -0,0 +1,218 @@
+"""
+Per-date index of booked appointment times.
+
+Each cached date keeps its booked minute-of-day offsets in a sorted list,
+so a booking conflict check is a bisect plus a look at the two
+neighbours instead of a scan over the whole day. Dates are loaded from
+the database on first use and expire after `ttl` seconds. A cached date
+can miss bookings made by other workers since it was loaded, so it only
+rejects on its own: a booking it would accept is checked once more
+against the database, for the few minutes around the requested time.
+
+Each day also caches an occupancy bitmap over the bookable slots
+(08:00-20:00 every 20 minutes, 37 slots). Bit i is set when slot i would
+be rejected by the same exact/gap rules. The bitmap is dropped whenever
+the day's bookings change.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+SLOT_MINUTES = 20
+OPENING_MINUTE = 8 * 60
+CLOSING_MINUTE = 20 * 60
+SLOT_STARTS = tuple(range(OPENING_MINUTE, CLOSING_MINUTE + 1, SLOT_MINUTES))
+
+
+def slot_label(minute):
+    return f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def to_minutes(value):
+    """'HH:MM' -> minutes after midnight, or None if it does not parse"""
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Day:
+    def __init__(self):
+        self.loaded_at = time.time()
+        self.minutes = []
+        self.entries = []  # (appointment_id, time string), parallel to minutes
+        self.occupancy = None
+
+    def add(self, minute, appointment_id, time_str):
+        if any(entry[0] == appointment_id for entry in self.entries):
+            return
+        i = bisect_left(self.minutes, minute)
+        self.minutes.insert(i, minute)
+        self.entries.insert(i, (appointment_id, time_str))
+        self.occupancy = None
+
+    def remove(self, appointment_id):
+        for i, entry in enumerate(self.entries):
+            if entry[0] == appointment_id:
+                del self.minutes[i]
+                del self.entries[i]
+                self.occupancy = None
+                return
+
+    def conflict(self, minute, gap):
+        """Return ('exact'|'gap', booked time string, appointment_id) or None"""
+        i = bisect_left(self.minutes, minute)
+        if i < len(self.minutes) and self.minutes[i] == minute:
+            return 'exact', self.entries[i][1], self.entries[i][0]
+        # Only the closest booking on each side can be within the gap
+        for j in (i - 1, i):
+            if 0 <= j < len(self.minutes) and abs(self.minutes[j] - minute) < gap:
+                return 'gap', self.entries[j][1], self.entries[j][0]
+        return None
+
+    def bitmap(self, gap):
+        if self.occupancy is None:
+            bits = 0
+            for i, minute in enumerate(SLOT_STARTS):
+                if self.conflict(minute, gap):
+                    bits |= 1 << i
+            self.occupancy = bits
+        return self.occupancy
+
+
+class SlotIndex:
+    """LRU of per-date sorted booking lists, shared by all threads of a worker"""
+
+    def __init__(self, ttl=30, max_dates=400, gap=SLOT_MINUTES):
+        self.ttl = ttl
+        self.max_dates = max_dates
+        self.gap = gap
+        self._lock = threading.Lock()
+        self._days = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rechecks = 0
+
+    def _get(self, date):
+        day = self._days.get(date)
+        if day is None or time.time() - day.loaded_at > self.ttl:
+            return None
+        self._days.move_to_end(date)
+        return day
+
+    def has(self, date):
+        with self._lock:
+            return self._get(date) is not None
+
+    def load(self, date, rows, replace=True):
+        """Cache a date's bookings from rows carrying appointment_id and time
+
+        With replace=False a fresh entry installed meanwhile by another
+        thread wins, so its reservations are not lost.
+        """
+        day = _Day()
+        for row in rows:
+            minute = to_minutes(row.get('time'))
+            if minute is not None:
+                day.add(minute, row.get('appointment_id'), row.get('time'))
+        with self._lock:
+            if not replace:
+                current = self._get(date)
+                if current is not None:
+                    return current
+            self._days[date] = day
+            self._days.move_to_end(date)
+            while len(self._days) > self.max_dates:
+                self._days.popitem(last=False)
+        return day
+
+    def refresh(self, date, rows):
+        """Merge a date's bookings just read from the database into the cache
+
+        Unlike load(), reservations this worker already holds on a cached
+        date are kept.
+        """
+        day = self.load(date, rows, replace=False)
+        with self._lock:
+            for row in rows:
+                minute = to_minutes(row.get('time'))
+                if minute is not None:
+                    day.add(minute, row.get('appointment_id'), row.get('time'))
+        return day
+
+    def reserve(self, date, time_str, appointment_id, loader, nearby):
+        """Atomically check a slot and hold it for appointment_id
+
+        `loader(date)` returns the date's active bookings and is only called
+        when the date is not cached. A cached date can miss bookings other
+        workers made since it was loaded, so it is only trusted to reject:
+        before accepting, `nearby(date, first, before)` must return the
+        date's active bookings with first <= time < before ('HH:MM'), the
+        window in which another booking would conflict. Returns None on
+        success or the (kind, booked time, booked appointment_id) conflict
+        tuple. Pass nearby=None only for a date the caller has just brought
+        up to date with refresh().
+        """
+        minute = to_minutes(time_str)
+        with self._lock:
+            day = self._get(date)
+            found = day.conflict(minute, self.gap) if day is not None else None
+        if found is not None:
+            self.hits += 1
+            return found
+        if day is None:
+            self.misses += 1
+            day = self.load(date, loader(date), replace=False)
+        elif nearby is None:
+            self.hits += 1
+        else:
+            self.hits += 1
+            self.rechecks += 1
+            rows = nearby(date, slot_label(max(0, minute - self.gap + 1)), slot_label(minute + self.gap))
+            with self._lock:
+                for row in rows:
+                    booked = to_minutes(row.get('time'))
+                    if booked is not None:
+                        day.add(booked, row.get('appointment_id'), row.get('time'))
+
+        with self._lock:
+            found = day.conflict(minute, self.gap)
+            if found is None:
+                day.add(minute, appointment_id, time_str)
+            return found
+
+    def occupancy(self, date):
+        """Bitmap of unavailable slots for a cached date (None if not cached)"""
+        with self._lock:
+            day = self._get(date)
+            return day.bitmap(self.gap) if day is not None else None
+
+    def free_slots(self, date):
+        bits = self.occupancy(date)
+        if bits is None:
+            return None
+        return [slot_label(minute) for i, minute in enumerate(SLOT_STARTS) if not bits >> i & 1]
+
+    def add(self, date, time_str, appointment_id):
+        """Record a booking seen elsewhere (e.g. on payment verification)"""
+        minute = to_minutes(time_str)
+        with self._lock:
+            day = self._get(date)
+            if day is not None and minute is not None:
+                day.add(minute, appointment_id, time_str)
+
+    def release(self, date, appointment_id):
+        """Free a slot after a failed insert or a cancellation"""
+        with self._lock:
+            day = self._days.get(date)
+            if day is not None:
+                day.remove(appointment_id)
+
+    def stats(self):
+        with self._lock:
+            dates = len(self._days)
+        return {'dates': dates, 'hits': self.hits, 'misses': self.misses,
+                'rechecks': self.rechecks, 'ttl': self.ttl}
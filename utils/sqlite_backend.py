@@ -0,0 +1,548 @@
+"""
+Embedded SQLite backend behind the app's supabase_* helper contract.
+
+For single-site deployments and load tests: the same tables, indexes and
+RPCs as the hosted database, in one local file, without a network round
+trip per query. The database runs in WAL mode, so readers in every worker
+and thread proceed while one writer commits.
+
+The handlers build PostgREST query strings (eq./gte./in./is., or=/and=
+trees, select=, order=, limit=, offset=); parse_query() turns one into a
+WHERE clause with bound parameters, and only columns that exist in the
+table can be named, so nothing from the query string reaches the SQL text
+unchecked.
+
+Differences from PostgREST worth knowing:
+- NULLs sort first ascending and last descending (SQLite's order) unless
+  the order term says nullsfirst/nullslast; the columns the app orders on
+  are never NULL.
+- Timestamps are ISO-8601 text and compare as text, which is correct for
+  the naive datetime.now().isoformat() values the app writes.
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import date
+from urllib.parse import unquote
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    phone TEXT,
+    password TEXT,
+    role TEXT DEFAULT 'patient',
+    is_active BOOLEAN DEFAULT 1,
+    profile_photo TEXT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')),
+    last_login TEXT,
+    last_login_ip TEXT
+);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    id TEXT PRIMARY KEY,
+    appointment_id TEXT UNIQUE NOT NULL,
+    user_id TEXT,
+    order_id TEXT,
+    patient_name TEXT NOT NULL,
+    patient_email TEXT NOT NULL,
+    patient_phone TEXT DEFAULT '+1234567890',
+    department TEXT,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    mode TEXT,
+    symptoms TEXT,
+    status TEXT DEFAULT 'pending',
+    payment_status TEXT DEFAULT 'pending',
+    consultation_fee NUMERIC,
+    invoice_no TEXT UNIQUE,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS appointments_date_time_idx ON appointments (date, time);
+CREATE INDEX IF NOT EXISTS appointments_email_payment_idx ON appointments (patient_email, payment_status);
+CREATE INDEX IF NOT EXISTS appointments_status_payment_idx ON appointments (status, payment_status);
+CREATE INDEX IF NOT EXISTS appointments_created_id_idx ON appointments (created_at, id);
+CREATE INDEX IF NOT EXISTS appointments_patient_email_id_idx ON appointments (patient_email, id);
+
+CREATE TABLE IF NOT EXISTS login_history (
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    user_email TEXT NOT NULL,
+    user_role TEXT,
+    status TEXT NOT NULL,
+    timestamp TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')),
+    ip_address TEXT,
+    browser TEXT,
+    os TEXT,
+    user_agent TEXT
+);
+CREATE INDEX IF NOT EXISTS login_history_timestamp_idx ON login_history (timestamp);
+CREATE INDEX IF NOT EXISTS login_history_timestamp_id_idx ON login_history (timestamp, id);
+
+CREATE TABLE IF NOT EXISTS contact_messages (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    email TEXT,
+    phone TEXT,
+    subject TEXT,
+    message TEXT,
+    status TEXT DEFAULT 'unread',
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS contact_messages_created_id_idx ON contact_messages (created_at, id);
+
+CREATE TABLE IF NOT EXISTS admin_messages (
+    id TEXT PRIMARY KEY,
+    recipient_email TEXT NOT NULL,
+    recipient_name TEXT NOT NULL,
+    message TEXT NOT NULL,
+    sent_by TEXT DEFAULT 'admin',
+    sent_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')),
+    status TEXT DEFAULT 'sent'
+);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    rating INTEGER,
+    review TEXT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS reviews_rating_created_idx ON reviews (rating, created_at);
+
+CREATE TABLE IF NOT EXISTS invoice_counters (
+    year INTEGER PRIMARY KEY,
+    next_no INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS invoice_returned_ranges (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    year INTEGER NOT NULL,
+    start_no INTEGER NOT NULL,
+    end_no INTEGER NOT NULL
+);
+"""
+
+COMPARISONS = {'eq': '=', 'neq': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+IS_VALUES = {'null': 'NULL', 'true': '1', 'false': '0', 'unknown': 'NULL'}
+
+
+class QueryError(ValueError):
+    """A query string this backend (or PostgREST) would reject"""
+
+
+def _split_top(text):
+    """Split on commas outside parentheses and double quotes"""
+    parts, depth, quoted, escaped, start = [], 0, False, False, 0
+    for i, ch in enumerate(text):
+        if escaped:
+            escaped = False
+        elif ch == '\\' and quoted:
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == '(':
+            depth += 1
+        elif not quoted and ch == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ',':
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _unquote_value(text):
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return text
+
+
+def _parenthesized(text):
+    if not (text.startswith('(') and text.endswith(')')):
+        raise QueryError(f'expected a parenthesized list, got {text!r}')
+    return text[1:-1]
+
+
+class _Compiler:
+    """Turns PostgREST filters for one table into SQL fragments and parameters"""
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+
+    def column(self, name):
+        if name not in self.columns:
+            raise QueryError(f'column {self.table}.{name} does not exist')
+        return f'"{name}"'
+
+    def value(self, name, text):
+        # Column affinity converts numbers; booleans are stored as 0/1
+        if self.columns[name] == 'BOOLEAN' and text in ('true', 'false'):
+            return 1 if text == 'true' else 0
+        return text
+
+    def condition(self, name, expression, in_tree):
+        """SQL for `name=expression`, e.g. expression 'not.gte.2024-01-01'"""
+        column = self.column(name)
+        negate = expression.startswith('not.')
+        if negate:
+            expression = expression[len('not.'):]
+        op, _, raw = expression.partition('.')
+        if op in COMPARISONS:
+            value = _unquote_value(raw) if in_tree else raw
+            sql, params = f'{column} {COMPARISONS[op]} ?', [self.value(name, value)]
+        elif op == 'in':
+            values = [_unquote_value(v) for v in _split_top(_parenthesized(raw))]
+            placeholders = ','.join('?' * len(values))
+            sql, params = f'{column} IN ({placeholders})', [self.value(name, v) for v in values]
+        elif op == 'is':
+            if raw not in IS_VALUES:
+                raise QueryError(f'is.{raw} is not supported')
+            sql, params = f'{column} IS {IS_VALUES[raw]}', []
+        else:
+            raise QueryError(f'operator {op!r} is not supported')
+        return (f'NOT ({sql})', params) if negate else (sql, params)
+
+    def logic(self, operator, body):
+        """SQL for or=(...)/and=(...), which may nest or(...)/and(...)/not.or(...)"""
+        clauses, params = [], []
+        for item in _split_top(_parenthesized(body)):
+            negate = item.startswith('not.')
+            inner = item[len('not.'):] if negate else item
+            if inner.startswith(('or(', 'and(')):
+                nested_op, _, nested_body = inner.partition('(')
+                sql, nested_params = self.logic(nested_op, '(' + nested_body)
+                sql = f'NOT {sql}' if negate else sql
+            else:
+                name, _, expression = item.partition('.')
+                sql, nested_params = self.condition(name, expression, in_tree=True)
+            clauses.append(sql)
+            params.extend(nested_params)
+        if not clauses:
+            raise QueryError(f'empty {operator}=()')
+        return '(' + f' {operator.upper()} '.join(clauses) + ')', params
+
+    def order(self, text):
+        terms = []
+        for term in text.split(','):
+            name, *modifiers = term.split('.')
+            sql = self.column(name)
+            for modifier in modifiers:
+                if modifier in ('asc', 'desc'):
+                    sql += f' {modifier.upper()}'
+                elif modifier in ('nullsfirst', 'nullslast'):
+                    sql += ' NULLS ' + modifier[len('nulls'):].upper()
+                else:
+                    raise QueryError(f'unknown order modifier {modifier!r}')
+            terms.append(sql)
+        return ', '.join(terms)
+
+
+def parse_query(query, table, columns):
+    """Compile a PostgREST query string for `table`
+
+    Returns a dict with 'select' (SQL column list), 'where' (list of SQL
+    clauses, ANDed), 'params', 'order' (SQL or None), 'limit' and 'offset'.
+    """
+    compiler = _Compiler(table, columns)
+    parsed = {'select': '*', 'where': [], 'params': [], 'order': None, 'limit': None, 'offset': None}
+    for pair in (query or '').split('&'):
+        if not pair:
+            continue
+        key, _, value = pair.partition('=')
+        key, value = unquote(key), unquote(value)
+        if key == 'select':
+            if value and value != '*':
+                parsed['select'] = ', '.join(compiler.column(name.strip()) for name in value.split(','))
+        elif key == 'order':
+            parsed['order'] = compiler.order(value)
+        elif key in ('limit', 'offset'):
+            try:
+                parsed[key] = int(value)
+            except ValueError:
+                raise QueryError(f'{key} must be an integer') from None
+        elif key in ('or', 'and', 'not.or', 'not.and'):
+            negate = key.startswith('not.')
+            sql, params = compiler.logic(key[len('not.'):] if negate else key, value)
+            parsed['where'].append(f'NOT {sql}' if negate else sql)
+            parsed['params'].extend(params)
+        else:
+            sql, params = compiler.condition(key, value, in_tree=False)
+            parsed['where'].append(sql)
+            parsed['params'].extend(params)
+    return parsed
+
+
+class SQLiteBackend:
+    """supabase_* equivalents over one SQLite file, one connection per thread"""
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._columns = None
+        self._counters = {'queries': 0, 'writes': 0, 'errors': 0, 'connections': 0}
+        self.functions = {
+            'dashboard_aggregates': self._dashboard_aggregates,
+            'review_summary': self._review_summary,
+            'reserve_invoice_block': self._reserve_invoice_block,
+            'release_invoice_block': self._release_invoice_block,
+        }
+
+    # -- connections -----------------------------------------------------
+
+    def _conn(self):
+        # Connections are per thread and never cross a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only risks the last commits on power loss, never corruption
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        with self._lock:
+            self._counters['connections'] += 1
+            if self._columns is None:
+                conn.executescript(SCHEMA)
+                self._columns = {
+                    table: {col['name']: (col['type'] or '').upper()
+                            for col in conn.execute(f'PRAGMA table_info("{table}")')}
+                    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+                }
+        return conn
+
+    def _table_columns(self, table):
+        self._conn()
+        if table not in self._columns:
+            raise QueryError(f'table {table} does not exist')
+        return self._columns[table]
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    # -- rows ------------------------------------------------------------
+
+    def _to_dict(self, table, row):
+        columns = self._columns[table]
+        result = dict(row)
+        for name, value in result.items():
+            if value is not None and columns.get(name) == 'BOOLEAN':
+                result[name] = bool(value)
+        return result
+
+    def _insert_row(self, conn, table, row):
+        columns = self._table_columns(table)
+        row = dict(row)
+        if 'id' in columns and columns['id'] == 'TEXT' and row.get('id') is None:
+            row['id'] = str(uuid.uuid4())
+        names = list(row)
+        for name in names:
+            if name not in columns:
+                raise QueryError(f'column {table}.{name} does not exist')
+        column_list = ', '.join(f'"{name}"' for name in names)
+        placeholders = ', '.join('?' * len(names))
+        sql = f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders}) RETURNING *'
+        values = [int(v) if isinstance(v, bool) else v for v in row.values()]
+        return self._to_dict(table, conn.execute(sql, values).fetchone())
+
+    def _query(self, table, query, extra_where=(), extra_params=(), order=None, limit=None):
+        """Run a SELECT built from a PostgREST query plus backend-side clauses"""
+        parsed = parse_query(query, table, self._table_columns(table))
+        where = parsed['where'] + list(extra_where)
+        sql = f'SELECT {parsed["select"]} FROM "{table}"'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        order = order or parsed['order']
+        if order:
+            sql += f' ORDER BY {order}'
+        limit = limit if limit is not None else parsed['limit']
+        if limit is not None or parsed['offset']:
+            sql += f' LIMIT {int(limit if limit is not None else -1)}'
+            if parsed['offset']:
+                sql += f' OFFSET {int(parsed["offset"])}'
+        self._count('queries')
+        rows = self._conn().execute(sql, parsed['params'] + list(extra_params)).fetchall()
+        return [self._to_dict(table, row) for row in rows]
+
+    # -- supabase_* contract -----------------------------------------------
+
+    def insert(self, table, data):
+        if isinstance(data, list):
+            return self.insert_many(table, data, returning=True)
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = self._insert_row(conn, table, data)
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self._count('errors')
+            print(f"[ERROR] Insert failed for {table}: {e}")
+            return None
+        self._count('writes')
+        print(f"[SUCCESS] Inserted into {table}: {data.get('email', data.get('name', 'data'))}")
+        return [row]
+
+    def insert_many(self, table, rows, returning=False, chunk_size=None):
+        chunk_size = chunk_size or len(rows) or 1
+        conn = self._conn()
+        inserted = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                inserted.extend(self._insert_row(conn, table, row) for row in chunk)
+                conn.execute('COMMIT')
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                self._count('errors')
+                print(f"[ERROR] Bulk insert failed for {table} (rows {start}-{start + len(chunk) - 1}): {e}")
+                return None
+            self._count('writes')
+        print(f"[SUCCESS] Inserted {len(rows)} rows into {table}")
+        return inserted if returning else True
+
+    def select(self, table, filters=None):
+        try:
+            return self._query(table, filters)
+        except Exception as e:
+            self._count('errors')
+            print(f"Select error: {e}")
+            return []
+
+    def select_page(self, table, filters, key, after, page_size):
+        """One page ordered by `key`, after the key value `after`; raises on errors"""
+        column = f'"{key}"'
+        extra = [f'{column} > ?'] if after is not None else []
+        return self._query(table, filters, extra, [after] if after is not None else [],
+                           order=f'{column} ASC', limit=page_size)
+
+    def select_keyset(self, table, filters=None, order=('created_at', 'id'),
+                      descending=True, after=None, limit=50):
+        columns = self._table_columns(table)
+        for name in order:
+            if name not in columns:
+                raise QueryError(f'column {table}.{name} does not exist')
+        column, tiebreak = (f'"{name}"' for name in order)
+        direction = 'DESC' if descending else 'ASC'
+        # Row values compare lexicographically and can walk a (column, id) index
+        extra = [f'({column}, {tiebreak}) {"<" if descending else ">"} (?, ?)'] if after is not None else []
+        return self._query(table, filters, extra, list(after) if after is not None else [],
+                           order=f'{column} {direction}, {tiebreak} {direction}', limit=limit)
+
+    def count(self, table, filters=None):
+        try:
+            parsed = parse_query(filters, table, self._table_columns(table))
+            sql = f'SELECT COUNT(*) FROM "{table}"'
+            if parsed['where']:
+                sql += ' WHERE ' + ' AND '.join(parsed['where'])
+            self._count('queries')
+            return self._conn().execute(sql, parsed['params']).fetchone()[0]
+        except Exception as e:
+            self._count('errors')
+            print(f"[ERROR] Count error for {table}: {e}")
+            return None
+
+    def update(self, table, data, filter_col, filter_val, extra_filters=None):
+        conn = self._conn()
+        try:
+            columns = self._table_columns(table)
+            query = f'{filter_col}=eq.{filter_val}' + (f'&{extra_filters}' if extra_filters else '')
+            parsed = parse_query(query, table, columns)
+            for name in data:
+                if name not in columns:
+                    raise QueryError(f'column {table}.{name} does not exist')
+            assignments = ', '.join(f'"{name}" = ?' for name in data)
+            values = [int(v) if isinstance(v, bool) else v for v in data.values()]
+            sql = (f'UPDATE "{table}" SET {assignments} WHERE {" AND ".join(parsed["where"])} RETURNING *')
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(sql, values + parsed['params']).fetchall()
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self._count('errors')
+            print(f"[ERROR] Update error: {e}")
+            return None
+        self._count('writes')
+        return [self._to_dict(table, row) for row in rows]
+
+    def rpc(self, function, params=None):
+        handler = self.functions.get(function)
+        if handler is None:
+            print(f"[ERROR] RPC {function} failed: no such function")
+            return None
+        conn = self._conn()
+        try:
+            result = handler(conn, **(params or {}))
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self._count('errors')
+            print(f"[ERROR] RPC {function} error: {e}")
+            return None
+        self._count('queries')
+        return True if result is None else result
+
+    # -- functions from SUPABASE_FUNCTIONS.sql -----------------------------
+
+    def _dashboard_aggregates(self, conn, p_month_start):
+        start = date.fromisoformat(p_month_start)
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        bounds = (start.isoformat(), end.isoformat())
+        row = conn.execute("""
+            SELECT
+                COALESCE(SUM(CASE WHEN payment_status = 'completed' AND status IS NOT 'cancelled'
+                                   AND date >= ? AND date < ? THEN consultation_fee END), 0),
+                COALESCE(SUM(CASE WHEN payment_status = 'refunded'
+                                   AND date >= ? AND date < ? THEN consultation_fee END), 0),
+                COUNT(DISTINCT CASE WHEN status IS NOT 'cancelled' THEN patient_email END)
+            FROM appointments
+        """, bounds + bounds).fetchone()
+        return {'revenue_base': row[0], 'refunded_base': row[1], 'unique_patients': row[2]}
+
+    def _review_summary(self, conn, p_min_rating, p_limit):
+        count, rating_sum = conn.execute('SELECT COUNT(*), COALESCE(SUM(rating), 0) FROM reviews').fetchone()
+        top = conn.execute('SELECT * FROM reviews WHERE rating >= ? ORDER BY created_at DESC LIMIT ?',
+                           (p_min_rating, p_limit)).fetchall()
+        return {'count': count, 'rating_sum': rating_sum, 'top': [self._to_dict('reviews', r) for r in top]}
+
+    def _reserve_invoice_block(self, conn, p_year, p_size):
+        conn.execute('BEGIN IMMEDIATE')
+        returned = conn.execute('SELECT id, start_no, end_no FROM invoice_returned_ranges '
+                                'WHERE year = ? ORDER BY start_no LIMIT 1', (p_year,)).fetchone()
+        if returned is not None:
+            conn.execute('DELETE FROM invoice_returned_ranges WHERE id = ?', (returned['id'],))
+            start, end = returned['start_no'], returned['end_no']
+        else:
+            next_no = conn.execute(
+                'INSERT INTO invoice_counters (year, next_no) VALUES (?, 1 + ?) '
+                'ON CONFLICT (year) DO UPDATE SET next_no = next_no + excluded.next_no - 1 '
+                'RETURNING next_no', (p_year, p_size)).fetchone()[0]
+            start, end = next_no - p_size, next_no - 1
+        conn.execute('COMMIT')
+        self._count('writes')
+        return {'start_no': start, 'end_no': end}
+
+    def _release_invoice_block(self, conn, p_year, p_start, p_end):
+        conn.execute('INSERT INTO invoice_returned_ranges (year, start_no, end_no) VALUES (?, ?, ?)',
+                     (p_year, p_start, p_end))
+        self._count('writes')
+
+    def stats(self):
+        with self._lock:
+            return {'path': self.path, **self._counters}
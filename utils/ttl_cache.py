@@ -0,0 +1,92 @@
+"""
+Bounded LRU cache with per-entry expiry.
+
+Used for read-through caching of database lookups. Misses can be cached
+too ("this key does not exist") under their own, usually shorter, TTL so
+that repeated lookups of unknown keys do not hammer the database either.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU + TTL cache with hit/miss/eviction counters"""
+
+    def __init__(self, maxsize=1024, ttl=60, negative_ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._counters = {
+            'hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, key, default=None):
+        """Cached value (None for a cached miss), or `default` if absent/expired"""
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return _MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            self._counters['negative_hits' if value is None else 'hits'] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value; None is stored as a negative entry with negative_ttl"""
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def get_or_load(self, key, loader):
+        """Read-through lookup: call loader() on a miss and cache its result"""
+        value = self._lookup(key)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._data)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['maxsize'] = self.maxsize
+        stats['hit_ratio'] = round((stats['hits'] + stats['negative_hits']) / lookups, 4) if lookups else 0.0
+        return stats
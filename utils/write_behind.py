@@ -0,0 +1,186 @@
+"""
+Bounded in-process write-behind queue with batched flushing.
+
+Request handlers put rows on the queue and return immediately; a
+background flusher hands them to flush_fn in batches, either when a batch
+fills up or when the oldest queued row has waited flush_interval seconds.
+When the queue is full the producer either drops the row or blocks for up
+to block_timeout seconds (overflow='drop' | 'block'). Remaining rows are
+flushed at interpreter exit.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Per-process queue + flusher thread feeding flush_fn(list_of_rows)"""
+
+    def __init__(self, name, flush_fn, max_size=10000, batch_size=100,
+                 flush_interval=1.0, overflow='drop', block_timeout=1.0):
+        if overflow not in ('drop', 'block'):
+            raise ValueError(f"overflow must be 'drop' or 'block', not {overflow!r}")
+        self.name = name
+        self.flush_fn = flush_fn
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._stopping = False
+        self._atexit_registered = False
+        self._counters = self._new_counters()
+
+    def _new_counters(self):
+        return {
+            'enqueued': 0,
+            'dropped': 0,
+            'blocked_puts': 0,
+            'flushed_rows': 0,
+            'failed_rows': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def _ensure_started(self):
+        # A forked worker must not inherit (and re-send) the parent's rows
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_size)
+            self._counters = self._new_counters()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-flusher', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def put(self, row):
+        """Queue a row; returns False if it was dropped because the queue is full"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.overflow == 'drop':
+                self._count('dropped')
+                return False
+            self._count('blocked_puts')
+            try:
+                self._queue.put(row, timeout=self.block_timeout)
+            except queue.Full:
+                self._count('dropped')
+                return False
+        self._count('enqueued')
+        return True
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _run(self):
+        q = self._queue
+        while not self._stopping:
+            try:
+                first = q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stop = True
+                    break
+                batch.append(row)
+            self._flush_batch(batch)
+            if stop:
+                return
+
+    def _flush_batch(self, batch):
+        with self._flush_lock:
+            started = time.perf_counter()
+            try:
+                ok = self.flush_fn(batch)
+            except Exception as e:
+                print(f"[ERROR] {self.name} flush failed: {e}")
+                ok = False
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            c = self._counters
+            c['batches'] += 1
+            c['last_batch_size'] = len(batch)
+            c['max_batch_size'] = max(c['max_batch_size'], len(batch))
+            c['last_flush_ms'] = round(elapsed_ms, 3)
+            c['max_flush_ms'] = round(max(c['max_flush_ms'], elapsed_ms), 3)
+            c['total_flush_ms'] += elapsed_ms
+            c['flushed_rows' if ok else 'failed_rows'] += len(batch)
+
+    def flush(self):
+        """Synchronously send everything queued so far"""
+        if self._pid != os.getpid():
+            return
+        q = self._queue
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    row = q.get_nowait()
+                except queue.Empty:
+                    break
+                if row is not _STOP:
+                    batch.append(row)
+            if not batch:
+                return
+            self._flush_batch(batch)
+
+    def close(self):
+        """Stop the flusher and drain the queue (registered with atexit)"""
+        self._stopping = True
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            # Wake the flusher so it sends the batch it is collecting, then drain the rest
+            try:
+                self._queue.put(_STOP, timeout=1)
+            except queue.Full:
+                pass
+            thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['depth'] = self._queue.qsize() if self._pid == os.getpid() else 0
+        stats['max_size'] = self.max_size
+        stats['overflow'] = self.overflow
+        rows = stats['flushed_rows'] + stats['failed_rows']
+        stats['avg_batch_size'] = round(rows / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['avg_flush_ms'] = round(stats.pop('total_flush_ms') / stats['batches'], 3) if stats['batches'] else 0.0
+        return stats